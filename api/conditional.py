@@ -0,0 +1,48 @@
+from fastapi import Request, Response, status
+
+
+# Times a conditional update rereads a row another request changed
+# between its read and its write before giving up with 409
+UPDATE_ATTEMPTS = 3
+
+
+def make_etag(*parts: object) -> str:
+    return '"' + "-".join(str(part) for part in parts) + '"'
+
+
+def matches_if_none_match(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if header is None:
+        return False
+    if header.strip() == "*":
+        return True
+    # If-None-Match uses weak comparison, so W/ prefixes are ignored
+    return etag in (
+        tag.strip().removeprefix("W/") for tag in header.split(",")
+    )
+
+
+def not_modified(etag: str) -> Response:
+    return Response(
+        status_code=status.HTTP_304_NOT_MODIFIED,
+        headers={"ETag": etag}
+    )
+
+
+def if_match_versions(request: Request, *parts: object) -> set[int] | None:
+    """Versions named by the If-Match tags made by
+    `make_etag(*parts, version, ...)`, or None if the request has no
+    If-Match or it is "*"."""
+    header = request.headers.get("if-match")
+    if header is None or header.strip() == "*":
+        return None
+    head = make_etag(*parts, "")[:-1]
+    versions = set()
+    for tag in header.split(","):
+        # If-Match uses strong comparison, so W/ tags never match
+        tag = tag.strip()
+        if tag.startswith(head):
+            version = tag[len(head):].rstrip('"').split("-")[0]
+            if version.isdigit():
+                versions.add(int(version))
+    return versions
@@ -1,3 +1,5 @@
+from collections.abc import AsyncGenerator
+from dataclasses import replace
 from typing import Annotated
 
 from fastapi import (
@@ -6,51 +8,140 @@ from fastapi import (
     status
 )
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy import select
-from sqlalchemy.orm import selectinload
+from sqlalchemy import select, insert
 from sqlalchemy.ext.asyncio import (
     AsyncSession
 )
 
-from db.session import get_db
-from db.models import User, TaskLog
+from db.session import (
+    get_db,
+    recent_writers,
+    AsyncSessionLocal,
+    AsyncReadSessionLocal
+)
+from db.models import User, Task, TaskLog
+from db.tasklog_buffer import tasklog_buffer, tasklog_entry
+from core.cache import TTLCache
+from core.events import Event
 from core.security import decode_token, InvalidCredentials
+from core.settings import settings
+from schemas.auth import Principal
+from api.feed import task_event
 
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/token")
 
+principal_cache: TTLCache[str, Principal] = TTLCache(
+    maxsize=settings.principal_cache_size,
+    ttl=settings.principal_cache_ttl
+)
+
+
+def invalidate_principal(username: str):
+    principal_cache.pop(username)
+
+
+async def load_principal(
+    session: AsyncSession,
+    username: str
+) -> Principal | None:
+    user = (await session.execute(
+        select(User.id, User.username)
+        .where(User.username == username)
+    )).one_or_none()
+    if user is None:
+        return None
+    return Principal(id=user.id, username=user.username)
+
+
+async def authenticate(session: AsyncSession, token: str) -> Principal:
+    token_data = decode_token(token)
+    principal = principal_cache.get(token_data.username)
+    if principal is None:
+        principal = await load_principal(session, token_data.username)
+        if principal is None:
+            raise InvalidCredentials
+        principal_cache.set(principal.username, principal)
+    return principal
+
 
 async def get_current_user(
     token: Annotated[str, Depends(oauth2_scheme)],
     session: Annotated[AsyncSession, Depends(get_db)]
-) -> User:
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
+) -> Principal:
     try:
-        token_data = decode_token(token)
+        principal = await authenticate(session, token)
     except InvalidCredentials:
-        raise credentials_exception
-    user = (await session.execute(
-        select(User)
-        .options(
-            selectinload(User.projects),
-            selectinload(User.owned_projects),
-            selectinload(User.logs),
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
         )
-        .where(User.username == token_data.username)
-    )).scalar_one_or_none()
-    if user is None:
-        raise credentials_exception
-    return user
+    # Lets db.session tell which user committed through this session
+    session.info["user_id"] = principal.id
+    return principal
+
+
+async def get_user_read_db(
+    current_user: Annotated[Principal, Depends(get_current_user)]
+) -> AsyncGenerator[AsyncSession]:
+    """`get_read_db` for authenticated routes.
+
+    Users who committed within the replica lag read from the primary
+    instead, so they don't miss their own writes. Writes are tracked
+    per process."""
+    if recent_writers.get(current_user.id):
+        factory = AsyncSessionLocal
+    else:
+        factory = AsyncReadSessionLocal
+    async with factory() as session:
+        yield session
 
 
 async def log_task_modification(
     session: AsyncSession,
     user_id: int,
-    task_id: int,
-    action: str
-):
-    session.add(TaskLog(user_id=user_id, task_id=task_id, action=action))
+    task: Task,
+    action: str,
+    event_type: str | None = None
+) -> Event | None:
+    """Record a TaskLog entry. With `event_type`, returns the task event
+    to publish once `session` commits, with the entry's id. An entry that
+    goes to the write-behind buffer has no id yet: the buffer publishes
+    its event once it is written, and this returns None."""
+    events = await log_task_modifications(
+        session,
+        user_id,
+        [(task, action, event_type)]
+    )
+    return events[0] if events else None
+
+
+async def log_task_modifications(
+    session: AsyncSession,
+    user_id: int,
+    entries: list[tuple[Task, str, str | None]]
+) -> list[Event]:
+    """Multi-row variant of `log_task_modification` for batch routes;
+    `entries` are (task, action, event_type) triples."""
+    if not entries:
+        return []
+    rows = [
+        tasklog_entry(user_id, task, action)
+        for task, action, _ in entries
+    ]
+    events = [
+        None if event_type is None else task_event(event_type, task, user_id)
+        for task, _, event_type in entries
+    ]
+    if await tasklog_buffer.submit(session, rows, events):
+        return []
+    log_ids = (await session.execute(
+        insert(TaskLog).returning(TaskLog.id, sort_by_parameter_order=True),
+        rows
+    )).scalars().all()
+    return [
+        replace(event, id=log_id)
+        for event, log_id in zip(events, log_ids)
+        if event is not None
+    ]
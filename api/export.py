@@ -0,0 +1,88 @@
+import zlib
+from collections.abc import AsyncIterator
+
+from sqlalchemy import select
+
+from db.models import Task, TaskLog
+from db.session import ExportSessionLocal
+from api.responses import dumps
+
+
+EXPORT_YIELD_PER = 1000
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+
+async def project_export_lines(project_id: int) -> AsyncIterator[bytes]:
+    """Yield NDJSON lines for every task of the project, each followed by
+    its logs in (timestamp, id) order.
+
+    Rows come from a single server-side cursor as plain tuples, so memory
+    use doesn't depend on the size of the project. Runs in its own
+    session, from `export_engine`, because the response outlives the
+    request's one."""
+    stmt = (
+        select(
+            Task.id,
+            Task.title,
+            Task.description,
+            Task.status,
+            TaskLog.id,
+            TaskLog.user_id,
+            TaskLog.action,
+            TaskLog.timestamp
+        )
+        .outerjoin(TaskLog, TaskLog.task_id == Task.id)
+        .where(Task.project_id == project_id)
+        .order_by(Task.id, TaskLog.timestamp, TaskLog.id)
+        .execution_options(yield_per=EXPORT_YIELD_PER)
+    )
+    async with ExportSessionLocal() as session:
+        result = await session.stream(stmt)
+        current_task = None
+        async for (
+            task_id, title, description, task_status,
+            log_id, user_id, action, timestamp
+        ) in result:
+            if task_id != current_task:
+                current_task = task_id
+                yield dumps({
+                    "type": "task",
+                    "id": task_id,
+                    "project_id": project_id,
+                    "title": title,
+                    "description": description,
+                    "status": task_status
+                }) + b"\n"
+            if log_id is not None:
+                yield dumps({
+                    "type": "log",
+                    "id": log_id,
+                    "task_id": task_id,
+                    "user_id": user_id,
+                    "action": action,
+                    "timestamp": timestamp.isoformat()
+                }) + b"\n"
+
+
+async def chunked(
+    lines: AsyncIterator[bytes],
+    compress: bool = False
+) -> AsyncIterator[bytes]:
+    """Group lines into chunks of about EXPORT_CHUNK_SIZE bytes, gzipping
+    them on the fly when `compress` is set."""
+    gzip = zlib.compressobj(wbits=31) if compress else None
+    buffer = bytearray()
+    async for line in lines:
+        buffer += line
+        if len(buffer) >= EXPORT_CHUNK_SIZE:
+            chunk = bytes(buffer)
+            buffer.clear()
+            if gzip is not None:
+                chunk = gzip.compress(chunk)
+            if chunk:
+                yield chunk
+    tail = bytes(buffer)
+    if gzip is not None:
+        tail = gzip.compress(tail) + gzip.flush()
+    if tail:
+        yield tail
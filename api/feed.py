@@ -0,0 +1,157 @@
+import asyncio
+from collections.abc import AsyncIterator
+from typing import Any
+
+from sqlalchemy import select
+
+from core.events import Event, event_bus
+from db.models import Task, TaskLog
+from db.session import AsyncSessionLocal
+from schemas.task import TaskReadSimple
+from api.responses import dumps
+
+
+TASK_CREATED = 'Created a task'
+
+KEEPALIVE_SECONDS = 15
+# Log entries read per replay query
+REPLAY_LIMIT = 1000
+
+
+def task_event(
+    event_type: str,
+    task: Task,
+    user_id: int,
+    log_id: int | None = None
+) -> Event:
+    return Event(
+        project_id=task.project_id,
+        type=event_type,
+        data={
+            "task": TaskReadSimple.model_validate(task).model_dump(),
+            "user_id": user_id
+        },
+        id=log_id
+    )
+
+
+def task_deleted_event(project_id: int, task_id: int, user_id: int) -> Event:
+    return Event(
+        project_id=project_id,
+        type="task.deleted",
+        data={"task_id": task_id, "user_id": user_id}
+    )
+
+
+def member_event(
+    event_type: str,
+    project_id: int,
+    user_id: int,
+    username: str
+) -> Event:
+    return Event(
+        project_id=project_id,
+        type=event_type,
+        data={"user": {"id": user_id, "username": username}}
+    )
+
+
+def project_event(
+    event_type: str,
+    project_id: int,
+    data: dict[str, Any]
+) -> Event:
+    return Event(project_id=project_id, type=event_type, data=data)
+
+
+async def publish(events: list[Event]):
+    for event in events:
+        await event_bus.publish(event)
+
+
+async def replay(project_id: int, after_id: int) -> list[Event]:
+    """Up to REPLAY_LIMIT task events after TaskLog id `after_id`,
+    rebuilt from the log.
+
+    Tasks are shown as they are now, and deletions and membership
+    changes aren't logged, so they can't be replayed."""
+    async with AsyncSessionLocal() as session:
+        rows = (await session.execute(
+            select(TaskLog.id, TaskLog.user_id, TaskLog.action, Task)
+            .join(Task, Task.id == TaskLog.task_id)
+            .where(Task.project_id == project_id, TaskLog.id > after_id)
+            .order_by(TaskLog.id)
+            .limit(REPLAY_LIMIT)
+        )).all()
+        return [
+            task_event(
+                "task.created" if action == TASK_CREATED else "task.updated",
+                task,
+                user_id,
+                log_id
+            )
+            for log_id, user_id, action, task in rows
+        ]
+
+
+async def project_events(
+    project_id: int,
+    user_id: int,
+    last_event_id: int | None
+) -> AsyncIterator[Event | None]:
+    """Events for one subscriber, replaying from `last_event_id` first.
+
+    Yields None every KEEPALIVE_SECONDS without events. Ends when the
+    subscriber falls too far behind, loses access or the project is
+    deleted."""
+    subscription = event_bus.subscribe(project_id)
+    try:
+        seen = last_event_id
+        if last_event_id is not None:
+            # Page through the whole backlog before going live; events
+            # published meanwhile wait in the subscription
+            while True:
+                events = await replay(project_id, seen)
+                for event in events:
+                    seen = event.id
+                    yield event
+                if len(events) < REPLAY_LIMIT:
+                    break
+        while True:
+            try:
+                event = await asyncio.wait_for(
+                    subscription.get(),
+                    KEEPALIVE_SECONDS
+                )
+            except TimeoutError:
+                yield None
+                continue
+            if event is None:
+                return
+            if event.id is not None and seen is not None and event.id <= seen:
+                continue
+            yield event
+            if event.type == "project.deleted" or (
+                event.type == "member.removed"
+                and event.data["user"]["id"] == user_id
+            ):
+                return
+    finally:
+        event_bus.unsubscribe(subscription)
+
+
+def event_json(event: Event) -> str:
+    return dumps(
+        {"id": event.id, "type": event.type, "data": event.data}
+    ).decode()
+
+
+def sse_format(event: Event | None) -> bytes:
+    if event is None:
+        return b": keepalive\n\n"
+    lines = []
+    if event.id is not None:
+        lines.append(f"id: {event.id}".encode())
+    lines.append(f"event: {event.type}".encode())
+    lines.append(b"data: " + dumps(event.data))
+    return b"\n".join(lines) + b"\n\n"
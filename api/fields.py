@@ -0,0 +1,144 @@
+"""Sparse fieldsets and relationship expansion for read routes.
+
+`?fields=title,version` limits a response to those of the schema's own
+fields (`id` is always included) and `?expand=owner,users` to those
+relationships. Only expanded relationships get a loader option, so the
+others are never queried, and the response is validated against a
+schema with just the selected fields.
+
+Routes return that response directly, so FastAPI neither validates it
+against the route's `response_model` nor documents the other shapes:
+`response_model` describes the default representation only, and
+`Representation.responses()` says so in the route's OpenAPI entry.
+"""
+from collections.abc import Callable, Sequence
+from dataclasses import dataclass
+from typing import Annotated, Any
+
+from fastapi import HTTPException, Query, status
+from pydantic import BaseModel, ConfigDict, create_model
+from sqlalchemy.orm import QueryableAttribute, selectinload
+from sqlalchemy.orm.interfaces import LoaderOption
+
+from api.responses import FastJSONResponse
+
+
+@dataclass(frozen=True)
+class Expandable:
+    relationship: QueryableAttribute
+    # Annotation of the field in the response, e.g. list[UserReadSimple]
+    annotation: Any
+
+
+@dataclass(frozen=True)
+class FieldSelection:
+    fields: tuple[str, ...]
+    expand: tuple[str, ...]
+
+
+def _split(value: str) -> list[str]:
+    return [name.strip() for name in value.split(",") if name.strip()]
+
+
+class Representation:
+    """The fields a read route can return: the fields of `base` and the
+    relationships in `expandable`, of which `default_expand` are
+    returned unless the client passes `expand`."""
+
+    def __init__(
+        self,
+        base: type[BaseModel],
+        expandable: dict[str, Expandable],
+        default_expand: Sequence[str]
+    ):
+        self.base = base
+        self.expandable = expandable
+        self.default_expand = tuple(default_expand)
+        self._schemas: dict[FieldSelection, type[BaseModel]] = {}
+
+    def _select(
+        self,
+        requested: list[str],
+        allowed: Sequence[str]
+    ) -> tuple[str, ...]:
+        unknown = set(requested) - set(allowed)
+        if unknown:
+            raise HTTPException(
+                status.HTTP_400_BAD_REQUEST,
+                f"Неизвестные поля: {', '.join(sorted(unknown))}."
+            )
+        # Canonical order, so equal selections share a schema
+        return tuple(name for name in allowed if name in requested)
+
+    def params(self) -> Callable[..., FieldSelection]:
+        """Dependency parsing `fields` and `expand`."""
+        fields_help = ", ".join(self.base.model_fields)
+        expand_help = ", ".join(self.expandable)
+
+        def field_selection(
+            fields: Annotated[
+                str | None,
+                Query(description=f"Comma-separated: {fields_help}")
+            ] = None,
+            expand: Annotated[
+                str | None,
+                Query(description=f"Comma-separated: {expand_help}")
+            ] = None
+        ) -> FieldSelection:
+            names = list(self.base.model_fields)
+            return FieldSelection(
+                fields=tuple(names) if fields is None else self._select(
+                    ["id", *_split(fields)],
+                    names
+                ),
+                expand=self.default_expand if expand is None else (
+                    self._select(_split(expand), list(self.expandable))
+                )
+            )
+        return field_selection
+
+    def responses(self) -> dict[int | str, dict[str, Any]]:
+        """`responses` for the route, noting that the documented schema
+        is only the default representation."""
+        expand = ", ".join(self.default_expand) or "nothing"
+        return {200: {"description": (
+            "The schema shown is the default representation, which "
+            f"expands {expand}. `fields` leaves out the other fields "
+            "and `expand` replaces the expanded relationships."
+        )}}
+
+    def options(self, selection: FieldSelection) -> list[LoaderOption]:
+        return [
+            selectinload(self.expandable[name].relationship)
+            for name in selection.expand
+        ]
+
+    def schema(self, selection: FieldSelection) -> type[BaseModel]:
+        schema = self._schemas.get(selection)
+        if schema is None:
+            definitions: dict[str, Any] = {
+                name: (
+                    self.base.model_fields[name].annotation,
+                    self.base.model_fields[name]
+                )
+                for name in selection.fields
+            }
+            for name in selection.expand:
+                definitions[name] = (self.expandable[name].annotation, ...)
+            schema = self._schemas[selection] = create_model(
+                self.base.__name__ + "Fields",
+                __config__=ConfigDict(from_attributes=True),
+                **definitions
+            )
+        return schema
+
+    def response(
+        self,
+        obj: Any,
+        selection: FieldSelection,
+        headers: dict[str, str] | None = None
+    ) -> FastJSONResponse:
+        content = self.schema(selection).model_validate(obj).model_dump(
+            mode="json"
+        )
+        return FastJSONResponse(content, headers=headers)
@@ -0,0 +1,132 @@
+"""HTTP, connection pool and queue metrics served at /metrics.
+
+`MetricsMiddleware` records request counts by route and status, latency
+by route and in-flight requests. Routes are labelled with their path
+template, requests that match no route with "unmatched" and
+non-standard methods with "other", so the number of label sets stays
+bounded. Pool and queue gauges are read when a snapshot is taken
+rather than kept up to date on every change.
+"""
+import time
+
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import QueuePool
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from core.events import event_bus
+from core.metrics import LabelValues, registry
+from core.security import hasher_pool
+from db.session import engine, read_engine, export_engine
+from db.tasklog_buffer import tasklog_buffer
+
+
+requests_total = registry.counter(
+    "http_requests_total",
+    "HTTP requests by route and response status",
+    labelnames=("method", "route", "status")
+)
+request_seconds = registry.histogram(
+    "http_request_duration_seconds",
+    "Time from receiving an HTTP request to sending its last byte",
+    labelnames=("method", "route")
+)
+in_flight = registry.gauge(
+    "http_requests_in_flight",
+    "HTTP requests being handled"
+).labels()
+
+
+def _engines() -> dict[str, AsyncEngine]:
+    engines = {"primary": engine}
+    if read_engine is not None:
+        engines["read"] = read_engine
+    if export_engine is not None:
+        engines["export"] = export_engine
+    return engines
+
+
+def _pool_stat(stat: str) -> dict[LabelValues, float]:
+    values = {}
+    for name, e in _engines().items():
+        pool = e.sync_engine.pool
+        # In-memory SQLite uses a single shared connection, not a queue
+        if isinstance(pool, QueuePool):
+            values[(name,)] = getattr(pool, stat)()
+    return values
+
+
+registry.gauge(
+    "db_pool_size",
+    "Connections the pool keeps open",
+    labelnames=("engine",),
+    function=lambda: _pool_stat("size")
+)
+registry.gauge(
+    "db_pool_checked_out",
+    "Pooled connections currently in use",
+    labelnames=("engine",),
+    function=lambda: _pool_stat("checkedout")
+)
+registry.gauge(
+    "db_pool_overflow",
+    "Connections open beyond the pool size",
+    labelnames=("engine",),
+    # QueuePool.overflow() counts up from -pool_size
+    function=lambda: {
+        labels: max(value, 0)
+        for labels, value in _pool_stat("overflow").items()
+    }
+)
+registry.gauge(
+    "password_hash_pending",
+    "argon2 calls running or waiting for a worker thread",
+    function=lambda: {(): hasher_pool.pending}
+)
+registry.gauge(
+    "tasklog_buffer_pending",
+    "Task log entries waiting to be written",
+    function=lambda: {(): len(tasklog_buffer)}
+)
+registry.gauge(
+    "event_subscribers",
+    "Open SSE and WebSocket event streams",
+    function=lambda: {(): event_bus.subscriber_count()}
+)
+
+
+METHODS = frozenset({
+    "GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS",
+    "CONNECT", "TRACE"
+})
+
+
+class MetricsMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_with_status(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        in_flight.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            in_flight.dec()
+            route = getattr(scope.get("route"), "path", "unmatched")
+            method = scope["method"]
+            if method not in METHODS:
+                method = "other"
+            request_seconds.labels(method, route).observe(
+                time.perf_counter() - start
+            )
+            requests_total.labels(method, route, str(status_code)).inc()
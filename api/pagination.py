@@ -0,0 +1,121 @@
+import base64
+import binascii
+import json
+import math
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Annotated, Any
+
+from fastapi import HTTPException, Query, status
+from sqlalchemy import Select, SQLColumnExpression, literal, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+
+@dataclass(frozen=True)
+class PageParams:
+    limit: int
+    cursor: str | None
+
+
+def page_params(
+    limit: Annotated[int, Query(ge=1, le=MAX_LIMIT)] = DEFAULT_LIMIT,
+    cursor: Annotated[str | None, Query()] = None
+) -> PageParams:
+    return PageParams(limit=limit, cursor=cursor)
+
+
+def encode_cursor(values: list[Any]) -> str:
+    payload = [
+        v.isoformat() if isinstance(v, datetime) else v
+        for v in values
+    ]
+    return base64.urlsafe_b64encode(
+        json.dumps(payload, separators=(",", ":")).encode()
+    ).decode().rstrip("=")
+
+
+# SQLite integers are signed 64-bit
+INT_MIN, INT_MAX = -2 ** 63, 2 ** 63 - 1
+
+
+def _cursor_value(key: SQLColumnExpression[Any], value: Any) -> Any:
+    """`value` from a decoded cursor as the Python type of `key`; raises
+    ValueError unless it has the JSON type `encode_cursor` gives it."""
+    python_type = key.type.python_type
+    if python_type is datetime:
+        if not isinstance(value, str):
+            raise ValueError(value)
+        return datetime.fromisoformat(value)
+    if python_type is int:
+        # bool is an int subclass, and floats would be truncated
+        if type(value) is not int or not INT_MIN <= value <= INT_MAX:
+            raise ValueError(value)
+        return value
+    if python_type is float:
+        if type(value) not in (int, float) or not math.isfinite(value):
+            raise ValueError(value)
+        return float(value)
+    if type(value) is not python_type:
+        raise ValueError(value)
+    return value
+
+
+def decode_cursor(
+    cursor: str,
+    keys: tuple[SQLColumnExpression[Any], ...]
+) -> list[Any]:
+    invalid = HTTPException(
+        status.HTTP_400_BAD_REQUEST,
+        "Некорректный курсор."
+    )
+    try:
+        raw = json.loads(
+            base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        )
+    # RecursionError: json nested too deeply
+    except (binascii.Error, ValueError, RecursionError):
+        raise invalid
+    if not isinstance(raw, list) or len(raw) != len(keys):
+        raise invalid
+    try:
+        return [_cursor_value(key, value) for key, value in zip(keys, raw)]
+    except (TypeError, ValueError, OverflowError):
+        raise invalid
+
+
+async def paginate(
+    session: AsyncSession,
+    stmt: Select,
+    page: PageParams,
+    keys: tuple[SQLColumnExpression[Any], ...],
+    descending: bool = False
+) -> dict[str, Any]:
+    """Keyset pagination over `stmt` ordered by `keys`.
+
+    Each page is a single indexed range scan (`keys > cursor`), so the cost
+    doesn't grow with how far the client has paged. `keys` must be unique
+    together, which in practice means ending with a primary key. They may
+    be expressions as well as columns of the selected entity. With
+    `descending`, every key is sorted in descending order."""
+    if page.cursor is not None:
+        after = decode_cursor(page.cursor, keys)
+        bound = tuple_(*(
+            literal(value, key.type) for key, value in zip(keys, after)
+        ))
+        if descending:
+            stmt = stmt.where(tuple_(*keys) < bound)
+        else:
+            stmt = stmt.where(tuple_(*keys) > bound)
+    order = [key.desc() for key in keys] if descending else keys
+    rows = (await session.execute(
+        stmt.add_columns(*keys).order_by(*order).limit(page.limit + 1)
+    )).all()
+    next_cursor = None
+    if len(rows) > page.limit:
+        rows = rows[:page.limit]
+        next_cursor = encode_cursor(list(rows[-1][1:]))
+    return {"items": [row[0] for row in rows], "next_cursor": next_cursor}
@@ -0,0 +1,41 @@
+"""JSON encoding for responses, event streams and exports.
+
+With FAST_JSON set and the optional `orjson` package installed, JSON is
+encoded by orjson instead of the stdlib encoder. The output is the same
+compact UTF-8 JSON either way.
+"""
+import json
+import logging
+from typing import Any
+
+from fastapi.responses import JSONResponse
+
+from core.settings import settings
+
+try:
+    import orjson
+except ImportError:  # optional dependency, see the `fast` extra
+    orjson = None
+
+
+logger = logging.getLogger(__name__)
+
+FAST_JSON = settings.fast_json and orjson is not None
+if settings.fast_json and orjson is None:
+    logger.warning("FAST_JSON is set but orjson isn't installed")
+
+
+def dumps(value: Any) -> bytes:
+    if FAST_JSON:
+        return orjson.dumps(value)
+    return json.dumps(
+        value,
+        ensure_ascii=False,
+        allow_nan=False,
+        separators=(",", ":")
+    ).encode()
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -1,13 +1,14 @@
-from collections.abc import Sequence
 from typing import Annotated
 
 from fastapi import (
     APIRouter,
     HTTPException,
     Depends,
+    Form,
+    Path,
+    Response,
     status
 )
-from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy import select
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -16,26 +17,62 @@ from core.security import (
     hash_password,
     verify_password,
     encode_token,
+    decode_token,
+    HasherBusy,
+    InvalidCredentials
 )
+from core.settings import settings
 from db.models import User
-from db.session import get_db
+from db.session import get_db, get_read_db
+from db.revocation import revoke_token
+from db.refresh import (
+    RefreshTokenReused,
+    find_session,
+    issue_refresh_token,
+    list_sessions,
+    revoke_session,
+    use_refresh_token
+)
 from schemas.user import UserReadSimple, UserRead, UserCreate
-from schemas.auth import Token
-from api.deps import get_current_user
+from schemas.project import ProjectReadSimple
+from schemas.tasklog import TaskLogRead
+from schemas.auth import Token, Principal, SessionRead
+from schemas.page import Page
+from api.deps import get_current_user, invalidate_principal, oauth2_scheme
+from api.fields import Expandable, FieldSelection, Representation
+from api.pagination import PageParams, page_params, paginate
+from api.timing import TimedRoute, query_budget
 
 
 prefix_url = "/auth"
 router = APIRouter(
-    prefix=prefix_url
+    prefix=prefix_url,
+    route_class=TimedRoute
+)
+
+hasher_busy_exception = HTTPException(
+    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+    detail="Сервер перегружен, повторите попытку позже.",
+    headers={"Retry-After": "1"},
+)
+
+invalid_refresh_exception = HTTPException(
+    status_code=status.HTTP_401_UNAUTHORIZED,
+    detail="Недействительный токен обновления",
+    headers={"WWW-Authenticate": "Bearer"},
 )
 
 
-@router.get("/", response_model=Sequence[UserReadSimple])
+@router.get(
+    "/",
+    response_model=Page[UserReadSimple],
+    dependencies=[Depends(query_budget(1))]
+)
 async def read_users(
-    session: Annotated[AsyncSession, Depends(get_db)]
+    session: Annotated[AsyncSession, Depends(get_read_db)],
+    page: Annotated[PageParams, Depends(page_params)]
 ):
-    users = (await session.execute(select(User))).scalars().all()
-    return users
+    return await paginate(session, select(User), page, (User.id,))
 
 
 @router.post("/new", response_model=UserReadSimple)
@@ -43,7 +80,10 @@ async def create_user(
     user: UserCreate,
     session: Annotated[AsyncSession, Depends(get_db)]
 ):
-    password_hash = hash_password(user.password)
+    try:
+        password_hash = await hash_password(user.password)
+    except HasherBusy:
+        raise hasher_busy_exception
     db_user = User(
         username=user.username,
         password_hash=password_hash
@@ -60,31 +100,162 @@ async def create_user(
     return db_user
 
 
-@router.get("/me", response_model=UserRead)
-def read_current_user(
-    current_user: Annotated[User, Depends(get_current_user)]
-):
-    return current_user
+user_fields = Representation(
+    UserReadSimple,
+    {
+        "projects": Expandable(User.projects, list[ProjectReadSimple]),
+        "owned_projects": Expandable(
+            User.owned_projects,
+            list[ProjectReadSimple]
+        ),
+        "logs": Expandable(User.logs, list[TaskLogRead]),
+    },
+    default_expand=("projects", "owned_projects", "logs")
+)
 
 
-@router.post("/token", response_model=Token)
-async def login_for_access_token(
-    form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
-    session: Annotated[AsyncSession, Depends(get_db)]
+@router.get(
+    "/me",
+    response_model=UserRead,
+    responses=user_fields.responses()
+)
+async def read_current_user(
+    principal: Annotated[Principal, Depends(get_current_user)],
+    session: Annotated[AsyncSession, Depends(get_db)],
+    selection: Annotated[FieldSelection, Depends(user_fields.params())]
 ):
     user = (await session.execute(
         select(User)
-        .where(User.username == form_data.username)
+        .where(User.id == principal.id)
+        .options(*user_fields.options(selection))
     )).scalar_one_or_none()
+    if user is None:
+        invalidate_principal(principal.username)
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return user_fields.response(user, selection)
+
+
+async def _check_password(
+    session: AsyncSession,
+    username: str | None,
+    password: str | None
+) -> tuple[int, str]:
     incorrect = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Неверное имя пользователя или пароль",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    if username is None or password is None:
+        raise incorrect
+    user = (await session.execute(
+        select(User.id, User.username, User.password_hash)
+        .where(User.username == username)
+    )).one_or_none()
+    # Hand the connection back to the pool before the slow hash check
+    await session.close()
     if not user:
         raise incorrect
-    if not verify_password(user.password_hash, form_data.password):
+    try:
+        verified = await verify_password(user.password_hash, password)
+    except HasherBusy:
+        raise hasher_busy_exception
+    if not verified:
         raise incorrect
+    return user.id, user.username
 
-    access_token = encode_token(user.username)
-    return {"access_token": access_token, "token_type": "bearer"}
+
+@router.post("/token", response_model=Token)
+async def login_for_access_token(
+    session: Annotated[AsyncSession, Depends(get_db)],
+    grant_type: Annotated[
+        str,
+        Form(pattern="^(password|refresh_token)$")
+    ] = "password",
+    username: Annotated[str | None, Form()] = None,
+    password: Annotated[str | None, Form()] = None,
+    refresh_token: Annotated[str | None, Form()] = None
+):
+    """OAuth 2.0 password and refresh token grants. Both return a new
+    refresh token; a refresh token can only be used once."""
+    if grant_type == "refresh_token":
+        if refresh_token is None:
+            raise invalid_refresh_exception
+        try:
+            grant = await use_refresh_token(session, refresh_token)
+        except RefreshTokenReused:
+            await session.commit()
+            raise invalid_refresh_exception
+        except InvalidCredentials:
+            raise invalid_refresh_exception
+        user_id, username = grant.user_id, grant.username
+        family, started = grant.family, grant.session_started_at
+    else:
+        user_id, username = await _check_password(
+            session,
+            username,
+            password
+        )
+        family, started = None, None
+
+    access_token = encode_token(username)
+    new_refresh_token = await issue_refresh_token(
+        session,
+        user_id,
+        decode_token(access_token),
+        family,
+        started
+    )
+    await session.commit()
+    return {
+        "access_token": access_token,
+        "token_type": "bearer",
+        "expires_in": settings.jwt_minutes * 60,
+        "refresh_token": new_refresh_token
+    }
+
+
+@router.post("/logout")
+async def revoke_access_token(
+    token: Annotated[str, Depends(oauth2_scheme)],
+    current_user: Annotated[Principal, Depends(get_current_user)],
+    session: Annotated[AsyncSession, Depends(get_db)]
+):
+    """Revoke the access token the request was made with, and end its
+    session so its refresh token can't issue new ones."""
+    token_data = decode_token(token)
+    await revoke_token(session, token_data)
+    if token_data.jti is not None:
+        family = await find_session(session, current_user.id, token_data.jti)
+        if family is not None:
+            await revoke_session(session, current_user.id, family)
+    await session.commit()
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
+@router.get("/sessions", response_model=list[SessionRead])
+async def read_sessions(
+    current_user: Annotated[Principal, Depends(get_current_user)],
+    session: Annotated[AsyncSession, Depends(get_db)]
+):
+    """The current user's sessions that can still be refreshed."""
+    return await list_sessions(session, current_user.id)
+
+
+@router.delete("/sessions/{id}")
+async def delete_session(
+    id: Annotated[str, Path(title="session ID")],
+    current_user: Annotated[Principal, Depends(get_current_user)],
+    session: Annotated[AsyncSession, Depends(get_db)]
+):
+    """Revoke a session's refresh token and its access tokens."""
+    if not await revoke_session(session, current_user.id, id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Сессия не найдена."
+        )
+    await session.commit()
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
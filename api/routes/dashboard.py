@@ -0,0 +1,83 @@
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from db.models import Project, ProjectAccess, ProjectStats, TaskLog
+from db.access import join_access
+from schemas.auth import Principal
+from schemas.dashboard import Dashboard, DashboardProject
+from schemas.tasklog import TaskLogRead
+from schemas.user import UserReadSimple
+from api.deps import get_current_user, get_user_read_db
+from api.timing import TimedRoute, query_budget
+
+
+router = APIRouter(route_class=TimedRoute)
+
+
+@router.get(
+    "/dashboard",
+    response_model=Dashboard,
+    dependencies=[Depends(query_budget(4))]
+)
+async def read_dashboard(
+    session: Annotated[AsyncSession, Depends(get_user_read_db)],
+    current_user: Annotated[Principal, Depends(get_current_user)],
+    recent_logs: Annotated[int, Query(ge=0, le=100)] = 20
+):
+    """The user's projects with their stats and latest task log entries."""
+    rows = (await session.execute(
+        join_access(
+            select(Project, ProjectAccess.is_owner, ProjectStats)
+            .outerjoin(ProjectStats, ProjectStats.project_id == Project.id),
+            current_user.id,
+            Project.id
+        )
+        .order_by(
+            ProjectStats.last_activity_at.desc().nulls_last(),
+            Project.id
+        )
+    )).all()
+    projects = [
+        DashboardProject(
+            id=project.id,
+            title=project.title,
+            version=project.version,
+            is_owner=is_owner,
+            task_counts=stats.task_counts if stats else {},
+            member_count=stats.member_count if stats else 0,
+            last_activity_at=stats.last_activity_at if stats else None
+        )
+        for project, is_owner, stats in rows
+    ]
+    logs = []
+    if projects and recent_logs:
+        # Each project's latest entries come off the (project_id,
+        # timestamp, id) index, so older history is never read
+        latest = aliased(TaskLog)
+        project_latest = (
+            select(latest.id)
+            .where(latest.project_id == ProjectAccess.project_id)
+            .order_by(latest.timestamp.desc(), latest.id.desc())
+            .limit(recent_logs)
+            .correlate(ProjectAccess)
+        )
+        logs = (await session.execute(
+            select(TaskLog)
+            .select_from(ProjectAccess)
+            .join(TaskLog, TaskLog.id.in_(project_latest))
+            .where(ProjectAccess.user_id == current_user.id)
+            .order_by(TaskLog.timestamp.desc(), TaskLog.id.desc())
+            .limit(recent_logs)
+        )).scalars().all()
+    return Dashboard(
+        user=UserReadSimple(
+            id=current_user.id,
+            username=current_user.username
+        ),
+        projects=projects,
+        recent_logs=[TaskLogRead.model_validate(log) for log in logs]
+    )
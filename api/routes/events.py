@@ -0,0 +1,104 @@
+import asyncio
+from typing import Annotated
+
+from fastapi import (
+    APIRouter,
+    Depends,
+    Header,
+    HTTPException,
+    Path,
+    Query,
+    WebSocket,
+    WebSocketDisconnect,
+    status
+)
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.security import InvalidCredentials
+from db.access import has_access
+from db.session import get_db, AsyncSessionLocal
+from schemas.auth import Principal
+from api.deps import get_current_user, authenticate
+from api.feed import project_events, sse_format, event_json
+from api.timing import TimedRoute
+
+
+PREFIX_URL = "/project"
+router = APIRouter(
+    prefix=PREFIX_URL,
+    route_class=TimedRoute
+)
+
+
+@router.get("/{id}/events")
+async def stream_project_events(
+    id: Annotated[int, Path(title="project ID")],
+    session: Annotated[AsyncSession, Depends(get_db)],
+    current_user: Annotated[Principal, Depends(get_current_user)],
+    last_event_id: Annotated[int | None, Header()] = None
+):
+    if not await has_access(session, current_user.id, id):
+        raise HTTPException(status.HTTP_404_NOT_FOUND)
+    # Don't hold a pooled connection for the lifetime of the stream
+    await session.close()
+
+    async def body():
+        async for event in project_events(id, current_user.id, last_event_id):
+            yield sse_format(event)
+
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.websocket("/{id}/ws")
+async def project_events_websocket(
+    websocket: WebSocket,
+    id: Annotated[int, Path(title="project ID")],
+    token: Annotated[str | None, Query()] = None,
+    last_event_id: Annotated[int | None, Query()] = None
+):
+    """WebSocket variant of `/events`. Browsers can't set headers on
+    WebSockets, so the token may also be passed as `?token=`."""
+    authorization = websocket.headers.get("authorization", "")
+    if authorization.lower().startswith("bearer "):
+        token = authorization[7:]
+    async with AsyncSessionLocal() as session:
+        try:
+            if token is None:
+                raise InvalidCredentials
+            principal = await authenticate(session, token)
+        except InvalidCredentials:
+            await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+            return
+        if not await has_access(session, principal.id, id):
+            await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+            return
+    await websocket.accept()
+
+    async def send_events():
+        async for event in project_events(id, principal.id, last_event_id):
+            if event is not None:
+                await websocket.send_text(event_json(event))
+
+    async def wait_for_disconnect():
+        try:
+            while True:
+                await websocket.receive_text()
+        except WebSocketDisconnect:
+            pass
+
+    sender = asyncio.create_task(send_events())
+    receiver = asyncio.create_task(wait_for_disconnect())
+    done, pending = await asyncio.wait(
+        (sender, receiver),
+        return_when=asyncio.FIRST_COMPLETED
+    )
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+    if sender in done:
+        await websocket.close()
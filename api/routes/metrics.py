@@ -0,0 +1,20 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from core.metrics import collect
+
+
+router = APIRouter()
+
+
+class MetricsResponse(PlainTextResponse):
+    media_type = "text/plain; version=0.0.4"
+
+
+@router.get(
+    "/metrics",
+    response_class=MetricsResponse,
+    include_in_schema=False
+)
+async def read_metrics():
+    return MetricsResponse(await collect())
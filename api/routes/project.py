@@ -1,4 +1,5 @@
-from typing import Sequence, Annotated
+from collections import Counter
+from typing import Annotated
 
 from fastapi import (
     APIRouter,
@@ -6,11 +7,16 @@ from fastapi import (
     HTTPException,
     status,
     Path,
+    Query,
+    Request,
     Response
 )
+from fastapi.responses import StreamingResponse
 from sqlalchemy import (
+    or_,
     select,
-    or_
+    insert,
+    update as sql_update
 )
 from sqlalchemy.orm import (
     selectinload
@@ -23,83 +29,284 @@ from sqlalchemy.exc import (
 )
 
 from db.session import get_db
-from db.models import User, Project, Task
-from schemas.user import UserBase
+from db.models import (
+    User,
+    Project,
+    Task,
+    ProjectAccess,
+    ProjectStats,
+    user_project
+)
+from db.tasklog_buffer import tasklog_buffer
+from db.versions import bump_project_versions
+from db.access import (
+    join_access,
+    has_access,
+    grant_access,
+    add_members,
+    remove_members,
+    drop_project_access
+)
+from db.stats import (
+    touch_projects,
+    init_project_stats,
+    adjust_task_counts,
+    refresh_member_count,
+    drop_project_stats
+)
+from schemas.user import UserBase, UserReadSimple
 from schemas.project import (
     ProjectReadSimple,
     ProjectRead,
     ProjectCreate,
-    ProjectUpdate
+    ProjectUpdate,
+    ProjectStatsRead,
+    ProjectMemberBatch,
+    ProjectMembersAdded,
+    ProjectMembersRemoved
+)
+from schemas.task import (
+    TaskReadSimple,
+    TaskBase,
+    TaskBatchCreate,
+    TaskBatchResult,
+    TaskBatchItemResult
+)
+from schemas.auth import Principal
+from schemas.page import Page
+from api.deps import (
+    get_current_user,
+    get_user_read_db,
+    log_task_modification,
+    log_task_modifications
 )
-from schemas.task import TaskReadSimple, TaskBase
-from api.deps import get_current_user, log_task_modification
+from api.feed import (
+    TASK_CREATED,
+    member_event,
+    project_event,
+    publish
+)
+from api.pagination import PageParams, page_params, paginate
+from api.export import project_export_lines, chunked
+from api.conditional import (
+    make_etag,
+    matches_if_none_match,
+    not_modified,
+    if_match_versions,
+    UPDATE_ATTEMPTS
+)
+from api.fields import Expandable, FieldSelection, Representation
+from api.timing import TimedRoute, query_budget
 
 
 PREFIX_URL = "/project"
 router = APIRouter(
-    prefix=PREFIX_URL
+    prefix=PREFIX_URL,
+    route_class=TimedRoute
 )
 
 
+project_fields = Representation(
+    ProjectReadSimple,
+    {
+        "owner": Expandable(Project.owner, UserReadSimple),
+        "users": Expandable(Project.users, list[UserReadSimple]),
+        "tasks": Expandable(Project.tasks, list[TaskReadSimple]),
+    },
+    default_expand=("owner", "users")
+)
+
+
+def precondition_failed_exception(etag: str) -> HTTPException:
+    return HTTPException(
+        status.HTTP_412_PRECONDITION_FAILED,
+        "Проект был изменён другим запросом, загрузите его заново.",
+        headers={"ETag": etag}
+    )
+
+
 async def get_project_by_id(
     session: AsyncSession,
     project_id: int,
     user_id: int
 ) -> Project | None:
     return (await session.execute(
-        select(Project)
-        .where(
-            Project.id == project_id,
-            or_(
-                Project.owner_id == user_id,
-                Project.users.any(User.id == user_id)
-            )
-        )
+        join_access(select(Project), user_id, Project.id)
+        .where(Project.id == project_id)
         .options(
             selectinload(Project.users),
-            selectinload(Project.owner),
-            selectinload(Project.tasks)
+            selectinload(Project.owner)
         )
     )).scalars().one_or_none()
 
 
-@router.get("/", response_model=Sequence[ProjectReadSimple])
+@router.get(
+    "/",
+    response_model=Page[ProjectReadSimple],
+    dependencies=[Depends(query_budget(3))]
+)
 async def read_projects(
-    session: Annotated[AsyncSession, Depends(get_db)],
-    current_user: Annotated[User, Depends(get_current_user)]
+    session: Annotated[AsyncSession, Depends(get_user_read_db)],
+    current_user: Annotated[Principal, Depends(get_current_user)],
+    page: Annotated[PageParams, Depends(page_params)]
 ):
-    return (await session.execute(
-        select(Project)
-        .where(
-            or_(
-                Project.owner_id == current_user.id,
-                Project.users.any(User.id == current_user.id)
-            )
-        )
-    )).scalars().all()
+    return await paginate(
+        session,
+        join_access(select(Project), current_user.id, Project.id),
+        page,
+        (Project.id,)
+    )
 
 
-@router.get("/{id}", response_model=ProjectRead)
+@router.get(
+    "/stats",
+    response_model=Page[ProjectStatsRead],
+    dependencies=[Depends(query_budget(3))]
+)
+async def read_projects_stats(
+    session: Annotated[AsyncSession, Depends(get_user_read_db)],
+    current_user: Annotated[Principal, Depends(get_current_user)],
+    page: Annotated[PageParams, Depends(page_params)]
+):
+    """Task counts by status, member count and last activity of every
+    project the user can access."""
+    return await paginate(
+        session,
+        join_access(
+            select(ProjectStats),
+            current_user.id,
+            ProjectStats.project_id
+        ),
+        page,
+        (ProjectStats.project_id,)
+    )
+
+
+def project_etag(project_id: int, version: int) -> str:
+    return make_etag("project", project_id, version)
+
+
+@router.get(
+    "/{id}",
+    response_model=ProjectRead,
+    responses=project_fields.responses(),
+    dependencies=[Depends(query_budget(6))]
+)
 async def read_project(
     id: Annotated[int, Path(title="project ID")],
-    session: Annotated[AsyncSession, Depends(get_db)],
-    current_user: Annotated[User, Depends(get_current_user)]
+    request: Request,
+    session: Annotated[AsyncSession, Depends(get_user_read_db)],
+    current_user: Annotated[Principal, Depends(get_current_user)],
+    selection: Annotated[FieldSelection, Depends(project_fields.params())]
 ):
-    project = await get_project_by_id(session, id, current_user.id)
+    if "if-none-match" in request.headers:
+        version = (await session.execute(
+            join_access(select(Project.version), current_user.id, Project.id)
+            .where(Project.id == id)
+        )).scalar_one_or_none()
+        if version is None:
+            raise HTTPException(status.HTTP_404_NOT_FOUND)
+        etag = project_etag(id, version)
+        if matches_if_none_match(request, etag):
+            return not_modified(etag)
+    project = (await session.execute(
+        join_access(select(Project), current_user.id, Project.id)
+        .where(Project.id == id)
+        .options(*project_fields.options(selection))
+    )).scalars().one_or_none()
     if project is None:
         raise HTTPException(status.HTTP_404_NOT_FOUND)
-    return project
+    return project_fields.response(
+        project,
+        selection,
+        headers={"ETag": project_etag(project.id, project.version)}
+    )
+
+
+@router.get(
+    "/{id}/tasks",
+    response_model=Page[TaskReadSimple],
+    dependencies=[Depends(query_budget(4))]
+)
+async def read_project_tasks(
+    id: Annotated[int, Path(title="project ID")],
+    session: Annotated[AsyncSession, Depends(get_user_read_db)],
+    current_user: Annotated[Principal, Depends(get_current_user)],
+    page: Annotated[PageParams, Depends(page_params)]
+):
+    if not await has_access(session, current_user.id, id):
+        raise HTTPException(status.HTTP_404_NOT_FOUND)
+    return await paginate(
+        session,
+        select(Task).where(Task.project_id == id),
+        page,
+        (Task.id,)
+    )
+
+
+@router.get(
+    "/{id}/stats",
+    response_model=ProjectStatsRead,
+    dependencies=[Depends(query_budget(3))]
+)
+async def read_project_stats(
+    id: Annotated[int, Path(title="project ID")],
+    session: Annotated[AsyncSession, Depends(get_user_read_db)],
+    current_user: Annotated[Principal, Depends(get_current_user)]
+):
+    stats = (await session.execute(
+        join_access(
+            select(ProjectStats),
+            current_user.id,
+            ProjectStats.project_id
+        )
+        .where(ProjectStats.project_id == id)
+    )).scalars().one_or_none()
+    if stats is None:
+        raise HTTPException(status.HTTP_404_NOT_FOUND)
+    return stats
+
+
+@router.get("/{id}/export")
+async def export_project(
+    id: Annotated[int, Path(title="project ID")],
+    session: Annotated[AsyncSession, Depends(get_db)],
+    current_user: Annotated[Principal, Depends(get_current_user)],
+    gzip: Annotated[bool, Query()] = False
+):
+    if not await has_access(session, current_user.id, id):
+        raise HTTPException(status.HTTP_404_NOT_FOUND)
+    await session.close()
+    await tasklog_buffer.flush()
+    headers = {
+        "Content-Disposition": f'attachment; filename="project-{id}.ndjson"'
+    }
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(
+        chunked(project_export_lines(id), compress=gzip),
+        media_type="application/x-ndjson",
+        headers=headers
+    )
 
 
 @router.post("/", response_model=ProjectReadSimple)
 async def create_project(
     session: Annotated[AsyncSession, Depends(get_db)],
-    current_user: Annotated[User, Depends(get_current_user)],
+    current_user: Annotated[Principal, Depends(get_current_user)],
     project: ProjectCreate
 ):
     db_project = Project(**project.model_dump(), owner_id=current_user.id)
     session.add(db_project)
     try:
+        await session.flush()
+        await grant_access(
+            session,
+            db_project.id,
+            current_user.id,
+            is_owner=True
+        )
+        await init_project_stats(session, db_project.id)
         await session.commit()
     except IntegrityError:
         await session.rollback()
@@ -115,120 +322,322 @@ async def create_project(
 async def create_task_in_project(
     id: Annotated[int, Path(title="project ID")],
     session: Annotated[AsyncSession, Depends(get_db)],
-    current_user: Annotated[User, Depends(get_current_user)],
+    current_user: Annotated[Principal, Depends(get_current_user)],
     task: TaskBase
 ):
-    project = await get_project_by_id(session, id, current_user.id)
-    if project is None:
+    if not await has_access(session, current_user.id, id):
         raise HTTPException(status.HTTP_404_NOT_FOUND)
-    db_task = Task(**task.model_dump(), project=project)
+    db_task = Task(**task.model_dump(), project_id=id)
     session.add(db_task)
-    user_id = current_user.id
-    await session.commit()
-    await session.refresh(db_task)
-    await log_task_modification(
+    await session.flush()
+    event = await log_task_modification(
         session,
-        user_id,
-        db_task.id,
-        'Created a task'
+        current_user.id,
+        db_task,
+        TASK_CREATED,
+        "task.created"
     )
+    await adjust_task_counts(session, Counter({(id, db_task.status): 1}))
+    await bump_project_versions(session, [id])
     await session.commit()
     await session.refresh(db_task)
+    if event is not None:
+        await publish([event])
     return db_task
 
 
-@router.post("/{id}/user")
-async def add_user_to_project(
+@router.post("/{id}/tasks:batch", response_model=TaskBatchResult)
+async def create_tasks_in_project(
     id: Annotated[int, Path(title="project ID")],
     session: Annotated[AsyncSession, Depends(get_db)],
-    current_user: Annotated[User, Depends(get_current_user)],
-    user: UserBase
+    current_user: Annotated[Principal, Depends(get_current_user)],
+    batch: TaskBatchCreate
 ):
-    project = await get_project_by_id(session, id, current_user.id)
-    if project is None:
+    if not await has_access(session, current_user.id, id):
+        raise HTTPException(status.HTTP_404_NOT_FOUND)
+    tasks = (await session.execute(
+        insert(Task).returning(Task, sort_by_parameter_order=True),
+        [task.model_dump() | {"project_id": id} for task in batch.tasks]
+    )).scalars().all()
+    events = await log_task_modifications(
+        session,
+        current_user.id,
+        [(task, TASK_CREATED, "task.created") for task in tasks]
+    )
+    results = [
+        TaskBatchItemResult(
+            id=task.id,
+            status=status.HTTP_201_CREATED,
+            task=TaskReadSimple.model_validate(task)
+        )
+        for task in tasks
+    ]
+    await adjust_task_counts(
+        session,
+        Counter((id, task.status) for task in tasks)
+    )
+    await bump_project_versions(session, [id])
+    await session.commit()
+    await publish(events)
+    return TaskBatchResult(results=results)
+
+
+async def check_project_owner(
+    session: AsyncSession,
+    project_id: int,
+    user_id: int
+):
+    access = await session.get(ProjectAccess, (user_id, project_id))
+    if access is None:
         raise HTTPException(
             status.HTTP_404_NOT_FOUND,
             "Проект с таким ID не найден или вы не имеете к нему доступа."
         )
-    if project.owner_id != current_user.id:
+    if not access.is_owner:
         raise HTTPException(
             status.HTTP_403_FORBIDDEN,
             "Необходимо быть владельцем проекта для этого действия."
         )
-    user = (await session.execute(
-        select(User)
-        .where(User.username == user.username)
-    )).scalars().one_or_none()
-    if user is None:
+
+
+async def resolve_usernames(
+    session: AsyncSession,
+    usernames: list[str]
+) -> dict[str, int]:
+    """Ids of the users among `usernames` that exist, by username."""
+    return dict((await session.execute(
+        select(User.username, User.id)
+        .where(User.username.in_(set(usernames)))
+    )).tuples().all())
+
+
+async def commit_member_changes(
+    session: AsyncSession,
+    project_id: int,
+    event_type: str,
+    members: dict[int, str]
+):
+    """Commit the addition or removal of `members`, usernames by id."""
+    events = [
+        member_event(event_type, project_id, user_id, username)
+        for user_id, username in members.items()
+    ]
+    if members:
+        await refresh_member_count(session, project_id)
+        await bump_project_versions(session, [project_id])
+    await session.commit()
+    await publish(events)
+
+
+@router.post("/{id}/user")
+async def add_user_to_project(
+    id: Annotated[int, Path(title="project ID")],
+    session: Annotated[AsyncSession, Depends(get_db)],
+    current_user: Annotated[Principal, Depends(get_current_user)],
+    user: UserBase
+):
+    await check_project_owner(session, id, current_user.id)
+    user_id = (await resolve_usernames(session, [user.username])).get(
+        user.username
+    )
+    if user_id is None:
         raise HTTPException(
             status.HTTP_404_NOT_FOUND,
             "Пользователь с таким именем не найден"
         )
-    if user not in project.users:
-        project.users.append(user)
-    await session.commit()
+    added = await add_members(session, id, [user_id])
+    await commit_member_changes(
+        session,
+        id,
+        "member.added",
+        {user_id: user.username for user_id in added}
+    )
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 
+@router.post("/{id}/users:batch", response_model=ProjectMembersAdded)
+async def add_users_to_project(
+    id: Annotated[int, Path(title="project ID")],
+    session: Annotated[AsyncSession, Depends(get_db)],
+    current_user: Annotated[Principal, Depends(get_current_user)],
+    batch: ProjectMemberBatch
+):
+    await check_project_owner(session, id, current_user.id)
+    usernames = list(dict.fromkeys(batch.usernames))
+    user_ids = await resolve_usernames(session, usernames)
+    added = await add_members(session, id, user_ids.values())
+    result = ProjectMembersAdded(added=[], already_members=[], unknown=[])
+    for username in usernames:
+        if username not in user_ids:
+            result.unknown.append(username)
+        elif user_ids[username] in added:
+            result.added.append(username)
+        else:
+            result.already_members.append(username)
+    await commit_member_changes(
+        session,
+        id,
+        "member.added",
+        {user_ids[username]: username for username in result.added}
+    )
+    return result
+
+
 @router.delete("/{project_id}/user/{user_id}")
 async def remove_user_from_project(
     project_id: Annotated[int, Path(title="project ID")],
     user_id: Annotated[int, Path(title="user ID")],
     session: Annotated[AsyncSession, Depends(get_db)],
-    current_user: Annotated[User, Depends(get_current_user)]
+    current_user: Annotated[Principal, Depends(get_current_user)]
 ):
-    project = await get_project_by_id(session, project_id, current_user.id)
-    if project is None:
-        raise HTTPException(
-            status.HTTP_404_NOT_FOUND,
-            "Проект с таким ID не найден или вы не имеете к нему доступа."
-        )
-    if project.owner_id != current_user.id:
-        raise HTTPException(
-            status.HTTP_403_FORBIDDEN,
-            "Необходимо быть владельцем проекта для этого действия."
-        )
-    user = await session.get(User, user_id)
-    if user is None:
+    await check_project_owner(session, project_id, current_user.id)
+    username = (await session.execute(
+        select(User.username).where(User.id == user_id)
+    )).scalar_one_or_none()
+    if username is None:
         raise HTTPException(
             status.HTTP_404_NOT_FOUND,
             "Пользователь с таким ID не найден"
         )
-    if user in project.users:
-        project.users.remove(user)
-    await session.commit()
+    removed = await remove_members(session, project_id, [user_id])
+    await commit_member_changes(
+        session,
+        project_id,
+        "member.removed",
+        {user_id: username for user_id in removed}
+    )
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 
+@router.delete("/{id}/users:batch", response_model=ProjectMembersRemoved)
+async def remove_users_from_project(
+    id: Annotated[int, Path(title="project ID")],
+    session: Annotated[AsyncSession, Depends(get_db)],
+    current_user: Annotated[Principal, Depends(get_current_user)],
+    batch: ProjectMemberBatch
+):
+    await check_project_owner(session, id, current_user.id)
+    usernames = list(dict.fromkeys(batch.usernames))
+    user_ids = await resolve_usernames(session, usernames)
+    removed = await remove_members(session, id, user_ids.values())
+    result = ProjectMembersRemoved(removed=[], not_members=[], unknown=[])
+    for username in usernames:
+        if username not in user_ids:
+            result.unknown.append(username)
+        elif user_ids[username] in removed:
+            result.removed.append(username)
+        else:
+            result.not_members.append(username)
+    await commit_member_changes(
+        session,
+        id,
+        "member.removed",
+        {user_ids[username]: username for username in result.removed}
+    )
+    return result
+
+
+# A project's own columns, as returned by `update_project`
+PROJECT_COLUMNS = (
+    Project.id,
+    Project.title,
+    Project.version,
+    Project.owner_id
+)
+
+
+async def project_read(session: AsyncSession, project) -> ProjectRead:
+    """ProjectRead for a row of PROJECT_COLUMNS, loading its owner and
+    members in one query."""
+    members = (
+        select(user_project.c.user_id)
+        .where(user_project.c.project_id == project.id)
+    )
+    users = (await session.execute(
+        select(User.id, User.username, User.id.in_(members).label("member"))
+        .where(or_(User.id == project.owner_id, User.id.in_(members)))
+    )).all()
+    return ProjectRead(
+        id=project.id,
+        title=project.title,
+        version=project.version,
+        owner=next(
+            UserReadSimple.model_validate(user)
+            for user in users
+            if user.id == project.owner_id
+        ),
+        users=[
+            UserReadSimple.model_validate(user)
+            for user in users
+            if user.member
+        ]
+    )
+
+
 @router.patch("/{id}", response_model=ProjectRead)
 async def update_project(
     id: Annotated[int, Path(title="project ID")],
+    request: Request,
+    response: Response,
     session: Annotated[AsyncSession, Depends(get_db)],
-    current_user: Annotated[User, Depends(get_current_user)],
+    current_user: Annotated[Principal, Depends(get_current_user)],
     update: ProjectUpdate
 ):
-    project = await get_project_by_id(session, id, current_user.id)
-    if project is None or project.owner_id != current_user.id:
-        raise HTTPException(status.HTTP_404_NOT_FOUND)
-    if update.title is not None:
-        project.title = update.title
+    """Update a project. With If-Match, the update only applies if the
+    project is still at the version in the tag, else it fails with 412.
+    The version also changes with the project's tasks and members."""
+    expected = if_match_versions(request, "project", id)
+    owned = (Project.id == id, Project.owner_id == current_user.id)
+    for _ in range(UPDATE_ATTEMPTS):
+        project = None
+        if update.title is not None:
+            stmt = (
+                sql_update(Project)
+                .where(*owned, Project.title != update.title)
+                .values(title=update.title, version=Project.version + 1)
+                .returning(*PROJECT_COLUMNS)
+            )
+            if expected is not None:
+                stmt = stmt.where(Project.version.in_(expected))
+            project = (await session.execute(stmt)).one_or_none()
+        changed = project is not None
+        if changed:
+            break
+        # Nothing was updated: find out whether the project is missing,
+        # at another version or already has the title
+        project = (await session.execute(
+            select(*PROJECT_COLUMNS).where(*owned)
+        )).one_or_none()
+        if project is None:
+            raise HTTPException(status.HTTP_404_NOT_FOUND)
+        if expected is not None and project.version not in expected:
+            raise precondition_failed_exception(
+                project_etag(id, project.version)
+            )
+        if update.title is None or update.title == project.title:
+            break
+        # Retitled by another request in between: try again
+    else:
+        raise HTTPException(status.HTTP_409_CONFLICT)
+    if changed:
+        await touch_projects(session, [id])
+    result = await project_read(session, project)
     await session.commit()
-    return (await session.execute(
-        select(Project)
-        .where(Project.id == id)
-        .options(
-            selectinload(Project.owner),
-            selectinload(Project.users),
-            selectinload(Project.tasks)
-        )
-    )).scalars().one_or_none()
+    if changed:
+        await publish([project_event(
+            "project.updated",
+            id,
+            {"project": ProjectReadSimple.model_validate(project).model_dump()}
+        )])
+    response.headers["ETag"] = project_etag(id, result.version)
+    return result
 
 
 @router.delete("/{id}")
 async def delete_project(
     id: Annotated[int, Path(title="project ID")],
     session: Annotated[AsyncSession, Depends(get_db)],
-    current_user: Annotated[User, Depends(get_current_user)],
+    current_user: Annotated[Principal, Depends(get_current_user)],
 ):
     project = await get_project_by_id(session, id, current_user.id)
     if project is None:
@@ -241,6 +650,11 @@ async def delete_project(
             status.HTTP_403_FORBIDDEN,
             "Чтобы удалить проект, необходимо быть его владельцем."
         )
+    # Buffered logs must land before the cascade deletes them
+    await tasklog_buffer.flush()
+    await drop_project_access(session, project.id)
+    await drop_project_stats(session, project.id)
     await session.delete(project)
     await session.commit()
+    await publish([project_event("project.deleted", id, {"project_id": id})])
     return Response(status_code=status.HTTP_204_NO_CONTENT)
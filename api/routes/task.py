@@ -1,26 +1,79 @@
+from collections import Counter
 from typing import Annotated
 
 from fastapi import (
     APIRouter,
     Path,
+    Query,
     Depends,
+    Request,
     Response,
     HTTPException,
     status
 )
-from sqlalchemy import select, or_
+from sqlalchemy import (
+    exists,
+    func,
+    select,
+    delete,
+    update as sql_update
+)
 from sqlalchemy.orm import selectinload
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from db.session import get_db
-from db.models import User, Task, Project
-from schemas.task import TaskRead, TaskUpdate
-from api.deps import get_current_user, log_task_modification
+from db.models import Task, TaskLog, Project, ProjectAccess
+from db.access import join_access
+from db.tasklog_buffer import tasklog_buffer
+from db.search import match_query, relevance, search_tasks
+from db.versions import bump_project_versions, bump_task_versions
+from db.stats import TaskCountDeltas, adjust_task_counts
+from schemas.task import (
+    TaskRead,
+    TaskReadSimple,
+    TaskUpdate,
+    TaskBatchUpdate,
+    TaskBatchDelete,
+    TaskBatchResult,
+    TaskBatchItemResult
+)
+from schemas.tasklog import TaskLogRead
+from schemas.project import ProjectReadSimple
+from schemas.auth import Principal
+from schemas.page import Page
+from api.deps import (
+    get_current_user,
+    get_user_read_db,
+    log_task_modification,
+    log_task_modifications
+)
+from api.feed import task_deleted_event, publish
+from api.pagination import PageParams, page_params, paginate
+from api.conditional import (
+    make_etag,
+    matches_if_none_match,
+    not_modified,
+    if_match_versions,
+    UPDATE_ATTEMPTS
+)
+from api.fields import Expandable, FieldSelection, Representation
+from api.timing import TimedRoute, query_budget
 
 
 PREFIX_URL = "/task"
 router = APIRouter(
-    prefix=PREFIX_URL
+    prefix=PREFIX_URL,
+    route_class=TimedRoute
+)
+
+
+task_fields = Representation(
+    TaskReadSimple,
+    {
+        "project": Expandable(Task.project, ProjectReadSimple),
+        "logs": Expandable(Task.logs, list[TaskLogRead]),
+    },
+    default_expand=("project",)
 )
 
 
@@ -30,78 +83,453 @@ async def get_task_by_id(
     task_id: int
 ):
     return (await session.execute(
-        select(Task)
-        .join(Project, Task.project_id == Project.id)
-        .where(
-            Task.id == task_id,
-            or_(
-                Project.owner_id == user_id,
-                Project.users.any(User.id == user_id)
-            )
-        )
+        join_access(select(Task), user_id, Task.project_id)
+        .where(Task.id == task_id)
         .options(
-            selectinload(Task.project),
-            selectinload(Task.logs)
+            selectinload(Task.project)
         )
     )).scalars().one_or_none()
 
 
-@router.get("/{id}", response_model=TaskRead)
+def task_update_values(task, update: TaskUpdate) -> dict[str, str]:
+    """The fields `update` changes on `task`, a Task or a row of its
+    columns, with their new values."""
+    values = {}
+    for field_name in TaskUpdate.model_fields:
+        field_value = getattr(update, field_name)
+        if field_value is not None:
+            if getattr(task, field_name) != field_value:
+                values[field_name] = field_value
+    return values
+
+
+def apply_task_update(task: Task, update: TaskUpdate) -> list[str]:
+    values = task_update_values(task, update)
+    for field_name, field_value in values.items():
+        setattr(task, field_name, field_value)
+    return list(values)
+
+
+@router.patch(":batch", response_model=TaskBatchResult)
+async def update_tasks(
+    session: Annotated[AsyncSession, Depends(get_db)],
+    current_user: Annotated[Principal, Depends(get_current_user)],
+    batch: TaskBatchUpdate
+):
+    tasks = {
+        task.id: task
+        for task in (await session.execute(
+            join_access(select(Task), current_user.id, Task.project_id)
+            .where(Task.id.in_({item.id for item in batch.tasks}))
+        )).scalars()
+    }
+    logs = []
+    changed = set()
+    counts: TaskCountDeltas = Counter()
+    for item in batch.tasks:
+        task = tasks.get(item.id)
+        if task is None:
+            continue
+        old_status = task.status
+        updated_fields = apply_task_update(task, item)
+        if updated_fields:
+            changed.add(task)
+        if "status" in updated_fields:
+            counts[(task.project_id, old_status)] -= 1
+            counts[(task.project_id, task.status)] += 1
+        logs.append((
+            task,
+            f'Updated fields: {", ".join(updated_fields)}',
+            "task.updated" if updated_fields else None
+        ))
+    await adjust_task_counts(session, counts)
+    # Bumped first, so the events carry the new versions
+    await bump_task_versions(session, (task.id for task in changed))
+    await bump_project_versions(session, (task.project_id for task in changed))
+    events = await log_task_modifications(session, current_user.id, logs)
+    results = [
+        TaskBatchItemResult(
+            id=item.id,
+            status=status.HTTP_200_OK,
+            task=TaskReadSimple.model_validate(tasks[item.id])
+        )
+        if item.id in tasks
+        else TaskBatchItemResult(
+            id=item.id,
+            status=status.HTTP_404_NOT_FOUND
+        )
+        for item in batch.tasks
+    ]
+    await session.commit()
+    await publish(events)
+    return TaskBatchResult(results=results)
+
+
+@router.delete(":batch", response_model=TaskBatchResult)
+async def delete_tasks(
+    session: Annotated[AsyncSession, Depends(get_db)],
+    current_user: Annotated[Principal, Depends(get_current_user)],
+    batch: TaskBatchDelete
+):
+    found = {
+        row.id: row
+        for row in await session.execute(
+            join_access(
+                select(
+                    Task.id,
+                    Task.project_id,
+                    Task.status,
+                    ProjectAccess.is_owner
+                )
+                .select_from(Task),
+                current_user.id,
+                Task.project_id
+            )
+            .where(Task.id.in_(batch.ids))
+        )
+    }
+    results = []
+    deleted = set()
+    for task_id in batch.ids:
+        if task_id not in found:
+            code = status.HTTP_404_NOT_FOUND
+        elif not found[task_id].is_owner:
+            code = status.HTTP_403_FORBIDDEN
+        else:
+            code = status.HTTP_204_NO_CONTENT
+            deleted.add(task_id)
+        results.append(TaskBatchItemResult(id=task_id, status=code))
+    if deleted:
+        await tasklog_buffer.flush()
+        await session.execute(
+            delete(TaskLog).where(TaskLog.task_id.in_(deleted))
+        )
+        await session.execute(delete(Task).where(Task.id.in_(deleted)))
+        counts: TaskCountDeltas = Counter()
+        counts.subtract(
+            (found[task_id].project_id, found[task_id].status)
+            for task_id in deleted
+        )
+        await adjust_task_counts(session, counts)
+        await bump_project_versions(
+            session,
+            (found[task_id].project_id for task_id in deleted)
+        )
+    await session.commit()
+    await publish([
+        task_deleted_event(found[task_id].project_id, task_id, current_user.id)
+        for task_id in batch.ids
+        if task_id in deleted
+    ])
+    return TaskBatchResult(results=results)
+
+
+# Keyset pagination keys for each `sort` of `GET /task/`. Only `id`
+# follows an index across projects (the primary key); the others follow
+# (project_id, status, id) and (project_id, title, id), so they need
+# `project_id` rather than sorting every accessible task on each page
+SORT_KEYS = {
+    "id": (Task.id,),
+    "title": (Task.title, Task.id),
+    "status": (Task.status, Task.id),
+}
+
+
+@router.get(
+    "/",
+    response_model=Page[TaskReadSimple],
+    dependencies=[Depends(query_budget(3))]
+)
+async def read_tasks(
+    session: Annotated[AsyncSession, Depends(get_user_read_db)],
+    current_user: Annotated[Principal, Depends(get_current_user)],
+    page: Annotated[PageParams, Depends(page_params)],
+    project_id: Annotated[int | None, Query()] = None,
+    task_status: Annotated[list[str] | None, Query(alias="status")] = None,
+    sort: Annotated[str, Query(pattern="^-?(id|title|status)$")] = "id"
+):
+    """Tasks in every project the user can access, optionally only in
+    `project_id` or with one of the given statuses. `sort` may be
+    prefixed with `-` for descending order; sorting by anything but `id`
+    needs `project_id`."""
+    sort_keys = SORT_KEYS[sort.removeprefix("-")]
+    if project_id is None and sort_keys[0] is not Task.id:
+        raise HTTPException(
+            status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Sorting by title or status requires project_id"
+        )
+    stmt = join_access(select(Task), current_user.id, Task.project_id)
+    if project_id is not None:
+        stmt = stmt.where(Task.project_id == project_id)
+    if task_status:
+        stmt = stmt.where(Task.status.in_(set(task_status)))
+    return await paginate(
+        session,
+        stmt,
+        page,
+        sort_keys,
+        descending=sort.startswith("-")
+    )
+
+
+@router.get(
+    "/search",
+    response_model=Page[TaskReadSimple],
+    dependencies=[Depends(query_budget(3))]
+)
+async def search(
+    q: Annotated[str, Query(min_length=1, max_length=200)],
+    session: Annotated[AsyncSession, Depends(get_user_read_db)],
+    current_user: Annotated[Principal, Depends(get_current_user)],
+    page: Annotated[PageParams, Depends(page_params)],
+    project_id: Annotated[int | None, Query()] = None,
+    task_status: Annotated[str | None, Query(alias="status")] = None
+):
+    """Tasks matching every word of `q`, most relevant first.
+
+    Scores depend on the whole index, so concurrent writes can shift
+    results between pages."""
+    match = match_query(q)
+    if match is None:
+        return {"items": [], "next_cursor": None}
+    stmt = join_access(search_tasks(match), current_user.id, Task.project_id)
+    if project_id is not None:
+        stmt = stmt.where(Task.project_id == project_id)
+    if task_status is not None:
+        stmt = stmt.where(Task.status == task_status)
+    return await paginate(session, stmt, page, (relevance, Task.id))
+
+
+def task_etag(
+    task_id: int,
+    version: int,
+    project_version: int,
+    latest_log_id: int | None = None
+) -> str:
+    # TaskRead embeds the project, so its version is part of the tag.
+    # Logs are added without a version bump, so with `expand=logs` the
+    # newest one's id is as well
+    if latest_log_id is None:
+        return make_etag("task", task_id, version, project_version)
+    return make_etag("task", task_id, version, project_version, latest_log_id)
+
+
+@router.get(
+    "/{id}",
+    response_model=TaskRead,
+    responses=task_fields.responses(),
+    dependencies=[Depends(query_budget(5))]
+)
 async def read_task(
     id: Annotated[int, Path(title="task ID")],
-    session: Annotated[AsyncSession, Depends(get_db)],
-    current_user: Annotated[User, Depends(get_current_user)]
+    request: Request,
+    session: Annotated[AsyncSession, Depends(get_user_read_db)],
+    current_user: Annotated[Principal, Depends(get_current_user)],
+    selection: Annotated[FieldSelection, Depends(task_fields.params())]
 ):
-    task = await get_task_by_id(session, current_user.id, id)
-    if task is None:
+    logs_expanded = "logs" in selection.expand
+    if "if-none-match" in request.headers:
+        latest_log_id = (
+            select(func.coalesce(func.max(TaskLog.id), 0))
+            .where(TaskLog.task_id == Task.id)
+            .scalar_subquery()
+        )
+        versions = (await session.execute(
+            join_access(
+                select(
+                    Task.version,
+                    Project.version,
+                    *([latest_log_id] if logs_expanded else [])
+                )
+                .select_from(Task)
+                .join(Project, Project.id == Task.project_id),
+                current_user.id,
+                Task.project_id
+            )
+            .where(Task.id == id)
+        )).one_or_none()
+        if versions is None:
+            raise HTTPException(status.HTTP_404_NOT_FOUND)
+        etag = task_etag(id, *versions)
+        if matches_if_none_match(request, etag):
+            return not_modified(etag)
+    # The project's version comes with the task, so the ETag doesn't
+    # need the project loaded when it isn't expanded
+    row = (await session.execute(
+        join_access(
+            select(Task, Project.version)
+            .join(Project, Project.id == Task.project_id),
+            current_user.id,
+            Task.project_id
+        )
+        .where(Task.id == id)
+        .options(*task_fields.options(selection))
+    )).one_or_none()
+    if row is None:
         raise HTTPException(status.HTTP_404_NOT_FOUND)
-    return task
+    task, project_version = row
+    etag = task_etag(
+        task.id,
+        task.version,
+        project_version,
+        max((log.id for log in task.logs), default=0)
+        if logs_expanded else None
+    )
+    return task_fields.response(task, selection, headers={"ETag": etag})
+
+
+@router.get(
+    "/{id}/logs",
+    response_model=Page[TaskLogRead],
+    dependencies=[Depends(query_budget(4))]
+)
+async def read_task_logs(
+    id: Annotated[int, Path(title="task ID")],
+    session: Annotated[AsyncSession, Depends(get_user_read_db)],
+    current_user: Annotated[Principal, Depends(get_current_user)],
+    page: Annotated[PageParams, Depends(page_params)]
+):
+    project_id = (await session.execute(
+        join_access(select(Task.project_id), current_user.id, Task.project_id)
+        .where(Task.id == id)
+    )).scalar_one_or_none()
+    if project_id is None:
+        raise HTTPException(status.HTTP_404_NOT_FOUND)
+    return await paginate(
+        session,
+        select(TaskLog).where(TaskLog.task_id == id),
+        page,
+        (TaskLog.timestamp, TaskLog.id)
+    )
+
+
+# A task's own columns, as read and returned by `update_task`
+TASK_COLUMNS = (
+    Task.id,
+    Task.project_id,
+    Task.title,
+    Task.description,
+    Task.status,
+    Task.version
+)
 
 
 @router.patch("/{id}", response_model=TaskRead)
 async def update_task(
     id: Annotated[int, Path(title="task ID")],
+    request: Request,
+    response: Response,
     session: Annotated[AsyncSession, Depends(get_db)],
-    current_user: Annotated[User, Depends(get_current_user)],
+    current_user: Annotated[Principal, Depends(get_current_user)],
     update: TaskUpdate
 ):
-    task = await get_task_by_id(session, current_user.id, id)
-    if task is None:
-        raise HTTPException(status.HTTP_404_NOT_FOUND)
-    updated_fields = []
-    for field_name, field_value in update:
-        if field_value is not None:
-            if getattr(task, field_name) != field_value:
-                setattr(task, field_name, field_value)
-                updated_fields.append(field_name)
-    await log_task_modification(
+    """Update a task. With If-Match, the update only applies if the task
+    is still at the version in the tag, else it fails with 412; edits
+    to other tasks of the project don't count as a conflict."""
+    expected = if_match_versions(request, "task", id)
+    for _ in range(UPDATE_ATTEMPTS):
+        # RETURNING only has the new values, and the old ones tell which
+        # fields change and which status count to decrement
+        current = (await session.execute(
+            join_access(
+                select(
+                    *TASK_COLUMNS,
+                    Project.title.label("project_title"),
+                    Project.version.label("project_version")
+                )
+                .join(Project, Project.id == Task.project_id),
+                current_user.id,
+                Task.project_id
+            )
+            .where(Task.id == id)
+        )).one_or_none()
+        if current is None:
+            raise HTTPException(status.HTTP_404_NOT_FOUND)
+        if expected is not None and current.version not in expected:
+            raise HTTPException(
+                status.HTTP_412_PRECONDITION_FAILED,
+                headers={"ETag": task_etag(
+                    id,
+                    current.version,
+                    current.project_version
+                )}
+            )
+        values = task_update_values(current, update)
+        if not values:
+            task = current
+            break
+        # Fails if the task changed after it was read, or the user lost
+        # access to its project
+        task = (await session.execute(
+            sql_update(Task)
+            .where(
+                Task.id == id,
+                Task.version == current.version,
+                exists().where(
+                    ProjectAccess.user_id == current_user.id,
+                    ProjectAccess.project_id == Task.project_id
+                )
+            )
+            .values(**values, version=Task.version + 1)
+            .returning(*TASK_COLUMNS)
+        )).one_or_none()
+        if task is not None:
+            break
+        # Read the task again: with If-Match that fails with 412,
+        # without it the last writer wins
+    else:
+        raise HTTPException(status.HTTP_409_CONFLICT)
+    event = await log_task_modification(
         session,
         current_user.id,
-        task.id,
-        f'Updated fields: {", ".join(updated_fields)}'
+        task,
+        f'Updated fields: {", ".join(values)}',
+        "task.updated" if values else None
     )
-    await session.commit()
-    return (await session.execute(
-        select(Task)
-        .where(Task.id == id)
-        .options(
-            selectinload(Task.project),
-            selectinload(Task.logs)
+    if "status" in values:
+        await adjust_task_counts(session, Counter({
+            (task.project_id, current.status): -1,
+            (task.project_id, task.status): 1
+        }))
+    if values:
+        project = ProjectReadSimple.model_validate(
+            (await bump_project_versions(session, [task.project_id]))[0]
         )
-    )).scalars().one_or_none()
+    else:
+        project = ProjectReadSimple(
+            id=current.project_id,
+            title=current.project_title,
+            version=current.project_version
+        )
+    result = TaskRead.model_validate({**task._mapping, "project": project})
+    await session.commit()
+    if event is not None:
+        await publish([event])
+    response.headers["ETag"] = task_etag(
+        result.id,
+        result.version,
+        result.project.version
+    )
+    return result
 
 
 @router.delete("/{id}")
 async def delete_task(
     id: Annotated[int, Path(title="task ID")],
     session: Annotated[AsyncSession, Depends(get_db)],
-    current_user: Annotated[User, Depends(get_current_user)]
+    current_user: Annotated[Principal, Depends(get_current_user)]
 ):
     task = await get_task_by_id(session, current_user.id, id)
     if task is None:
         raise HTTPException(status.HTTP_404_NOT_FOUND)
     if task.project.owner_id != current_user.id:
         raise HTTPException(status.HTTP_403_FORBIDDEN)
+    # Buffered logs must land before the cascade deletes them
+    await tasklog_buffer.flush()
+    project_id = task.project_id
+    await adjust_task_counts(session, Counter({(project_id, task.status): -1}))
+    await bump_project_versions(session, [project_id])
     await session.delete(task)
     await session.commit()
+    await publish([task_deleted_event(project_id, id, current_user.id)])
     return Response(status_code=status.HTTP_204_NO_CONTENT)
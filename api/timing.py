@@ -0,0 +1,210 @@
+"""Per-request timing: DB statements, endpoint and serialization time.
+
+With SERVER_TIMING set, `ServerTimingMiddleware` collects a
+`RequestStats` for every HTTP request. SQLAlchemy cursor events on the
+instrumented engines add to the stats of the request that runs them, and
+`TimedRoute` records when the endpoint itself started and returned. The
+result goes out in a `Server-Timing` header and as one log line per
+request:
+
+    method=GET route=/project/{id} status=200 total_ms=4.10
+    deps_ms=0.62 endpoint_ms=2.95 serialize_ms=0.41 db_ms=1.80 queries=3
+
+With QUERY_BUDGET_CHECK also set, requests that run more statements
+than their route's budget, or the same statement more than
+QUERY_REPEAT_LIMIT times (the usual shape of an N+1), are logged as
+warnings. Routes declare a budget with `Depends(query_budget(n))`;
+others get QUERY_BUDGET.
+"""
+import functools
+import inspect
+import logging
+import time
+from collections import Counter
+from collections.abc import Callable
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any
+
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from core.settings import settings
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class RequestStats:
+    start: float
+    statements: int = 0
+    db_time: float = 0.0
+    shapes: Counter[str] = field(default_factory=Counter)
+    budget: int | None = None
+    endpoint_start: float | None = None
+    endpoint_end: float | None = None
+    response_start: float | None = None
+
+    def timings(self) -> dict[str, float]:
+        """Phase durations in milliseconds, as far as they're known."""
+        end = self.response_start or time.perf_counter()
+        timings = {"total": end - self.start}
+        if self.endpoint_start is not None:
+            timings["deps"] = self.endpoint_start - self.start
+        if self.endpoint_end is not None:
+            timings["endpoint"] = self.endpoint_end - self.endpoint_start
+            timings["serialize"] = end - self.endpoint_end
+        timings["db"] = self.db_time
+        return {name: value * 1000 for name, value in timings.items()}
+
+
+current_stats: ContextVar[RequestStats | None] = ContextVar(
+    "current_stats",
+    default=None
+)
+
+
+def _before_cursor_execute(conn, cursor, statement, *args):
+    if current_stats.get() is not None:
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, *args):
+    stats = current_stats.get()
+    if stats is None:
+        return
+    stats.db_time += time.perf_counter() - conn.info["query_start"].pop()
+    stats.statements += 1
+    if settings.query_budget_check:
+        stats.shapes[statement] += 1
+
+
+def _handle_error(context):
+    if current_stats.get() is not None and context.connection is not None:
+        starts = context.connection.info.get("query_start")
+        if starts:
+            starts.pop()
+
+
+def instrument_engine(engine: AsyncEngine):
+    sync_engine = engine.sync_engine
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(sync_engine, "handle_error", _handle_error)
+
+
+def query_budget(limit: int) -> Callable[[], None]:
+    """Dependency setting the route's statement budget to `limit`."""
+    def set_budget():
+        stats = current_stats.get()
+        if stats is not None:
+            stats.budget = limit
+    return set_budget
+
+
+def _timed(endpoint: Callable[..., Any]) -> Callable[..., Any]:
+    if inspect.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def timed_async(*args, **kwargs):
+            stats = current_stats.get()
+            if stats is None:
+                return await endpoint(*args, **kwargs)
+            stats.endpoint_start = time.perf_counter()
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                stats.endpoint_end = time.perf_counter()
+        return timed_async
+
+    @functools.wraps(endpoint)
+    def timed(*args, **kwargs):
+        stats = current_stats.get()
+        if stats is None:
+            return endpoint(*args, **kwargs)
+        stats.endpoint_start = time.perf_counter()
+        try:
+            return endpoint(*args, **kwargs)
+        finally:
+            stats.endpoint_end = time.perf_counter()
+    return timed
+
+
+class TimedRoute(APIRoute):
+    """Route that records when its endpoint runs, so request time can be
+    split into dependencies, the endpoint and response serialization."""
+
+    def __init__(self, path: str, endpoint: Callable[..., Any], **kwargs):
+        super().__init__(path, _timed(endpoint), **kwargs)
+
+
+def server_timing(stats: RequestStats) -> str:
+    timings = stats.timings()
+    entries = [
+        f"{name};dur={value:.2f}"
+        for name, value in timings.items()
+        if name != "db"
+    ]
+    entries.append(
+        f'db;dur={timings["db"]:.2f};desc="{stats.statements} queries"'
+    )
+    return ", ".join(entries)
+
+
+def _check_budget(scope: Scope, route: str, stats: RequestStats):
+    budget = stats.budget if stats.budget is not None else (
+        settings.query_budget
+    )
+    if stats.statements > budget:
+        logger.warning(
+            "method=%s route=%s queries=%d over budget=%d",
+            scope["method"], route, stats.statements, budget
+        )
+    for statement, count in stats.shapes.items():
+        if count > settings.query_repeat_limit:
+            logger.warning(
+                "method=%s route=%s repeated_query=%d possible N+1: %s",
+                scope["method"], route, count, " ".join(statement.split())
+            )
+
+
+class ServerTimingMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        stats = RequestStats(start=time.perf_counter())
+        status_code = None
+
+        async def send_with_timing(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                stats.response_start = time.perf_counter()
+                status_code = message["status"]
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", server_timing(stats))
+            await send(message)
+
+        token = current_stats.set(stats)
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current_stats.reset(token)
+            route = getattr(scope.get("route"), "path", scope["path"])
+            timings = " ".join(
+                f"{name}_ms={value:.2f}"
+                for name, value in stats.timings().items()
+            )
+            logger.info(
+                "method=%s route=%s status=%s %s queries=%d",
+                scope["method"], route, status_code, timings,
+                stats.statements
+            )
+            if settings.query_budget_check:
+                _check_budget(scope, route, stats)
@@ -0,0 +1,124 @@
+"""Old OR/EXISTS membership check vs. the `project_access` lookup.
+
+Generates USERS users and PROJECTS projects with MEMBERS extra members
+each, then times the project-detail and project-list authorization
+queries both ways and prints SQLite's query plans.
+"""
+import asyncio
+import random
+import time
+
+from sqlalchemy import select, insert, or_, text
+
+import bench.common  # noqa: F401  (configures the throwaway database)
+from bench.common import summarize
+from db.access import join_access, backfill_access
+from db.models import User, Project, user_project
+from db.session import engine, init_db
+
+
+USERS = 10_000
+PROJECTS = 50_000
+MEMBERS = 2
+SAMPLES = 2_000
+
+
+def old_detail(user_id: int, project_id: int):
+    return select(Project).where(
+        Project.id == project_id,
+        or_(
+            Project.owner_id == user_id,
+            Project.users.any(User.id == user_id)
+        )
+    )
+
+
+def new_detail(user_id: int, project_id: int):
+    return (
+        join_access(select(Project), user_id, Project.id)
+        .where(Project.id == project_id)
+    )
+
+
+def old_list(user_id: int):
+    return select(Project).where(
+        or_(
+            Project.owner_id == user_id,
+            Project.users.any(User.id == user_id)
+        )
+    ).order_by(Project.id).limit(50)
+
+
+def new_list(user_id: int):
+    return (
+        join_access(select(Project), user_id, Project.id)
+        .order_by(Project.id)
+        .limit(50)
+    )
+
+
+async def generate():
+    rng = random.Random(0)
+    async with engine.begin() as conn:
+        await conn.execute(insert(User), [
+            {"id": i, "username": f"user{i}", "password_hash": "-"}
+            for i in range(1, USERS + 1)
+        ])
+        await conn.execute(insert(Project), [
+            {"id": i, "owner_id": rng.randint(1, USERS), "title": f"p{i}"}
+            for i in range(1, PROJECTS + 1)
+        ])
+        await conn.execute(insert(user_project), [
+            {"user_id": user_id, "project_id": project_id}
+            for project_id in range(1, PROJECTS + 1)
+            for user_id in rng.sample(range(1, USERS + 1), MEMBERS)
+        ])
+        await conn.run_sync(backfill_access)
+
+
+async def explain(conn, name: str, stmt):
+    if engine.dialect.name != "sqlite":
+        return
+    compiled = stmt.compile(
+        dialect=engine.dialect,
+        compile_kwargs={"literal_binds": True}
+    )
+    plan = (await conn.execute(
+        text(f"EXPLAIN QUERY PLAN {compiled}")
+    )).all()
+    print(f"{name} plan:")
+    for row in plan:
+        print(f"    {row[-1]}")
+
+
+async def measure(conn, name: str, stmts):
+    samples = []
+    for stmt in stmts:
+        start = time.perf_counter()
+        (await conn.execute(stmt)).all()
+        samples.append(time.perf_counter() - start)
+    summarize(name, samples)
+
+
+async def main():
+    await init_db()
+    await generate()
+    rng = random.Random(1)
+    pairs = [
+        (rng.randint(1, USERS), rng.randint(1, PROJECTS))
+        for _ in range(SAMPLES)
+    ]
+    async with engine.connect() as conn:
+        await explain(conn, "old detail", old_detail(1, 1))
+        await explain(conn, "new detail", new_detail(1, 1))
+        await explain(conn, "old list", old_list(1))
+        await explain(conn, "new list", new_list(1))
+        await measure(conn, "old detail", [old_detail(*p) for p in pairs])
+        await measure(conn, "new detail", [new_detail(*p) for p in pairs])
+        await measure(conn, "old list", [old_list(u) for u, _ in pairs])
+        await measure(conn, "new list", [new_list(u) for u, _ in pairs])
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
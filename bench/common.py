@@ -0,0 +1,77 @@
+"""Shared helpers for the in-process benchmarks under `bench/`.
+
+Benchmarks drive the ASGI app directly through httpx, against a throwaway
+SQLite database, so they need no running server. Run them from the
+repository root, e.g. `uv run python -m bench.login_load`.
+"""
+import os
+import tempfile
+from contextlib import asynccontextmanager
+from statistics import quantiles
+
+_db_dir = tempfile.mkdtemp(prefix="teamtask-bench-")
+os.environ.setdefault(
+    "DATABASE_URL",
+    f"sqlite+aiosqlite:///{os.path.join(_db_dir, 'bench.db')}"
+)
+os.environ.setdefault("SQLALCHEMY_ECHO", "false")
+os.environ.setdefault("JWT_KEY", "bench-" + "x" * 32)
+os.environ.setdefault("JWT_ALGO", "HS256")
+os.environ.setdefault("JWT_MINUTES", "30")
+
+import httpx  # noqa: E402
+
+from main import app, lifespan  # noqa: E402
+
+
+@asynccontextmanager
+async def client():
+    async with lifespan(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport,
+            base_url="http://bench"
+        ) as c:
+            yield c
+
+
+async def register(c: httpx.AsyncClient, username: str, password: str):
+    r = await c.post(
+        "/auth/new",
+        json={"username": username, "password": password}
+    )
+    r.raise_for_status()
+
+
+async def login(
+    c: httpx.AsyncClient,
+    username: str,
+    password: str
+) -> dict[str, str]:
+    r = await c.post(
+        "/auth/token",
+        data={"username": username, "password": password}
+    )
+    r.raise_for_status()
+    return {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+
+def percentiles(
+    samples: list[float],
+    points: tuple[int, ...] = (50, 95, 99)
+) -> dict[str, float]:
+    """Percentiles of `samples` (seconds) in milliseconds, keyed "p50"..."""
+    cuts = quantiles(samples, n=100)
+    return {f"p{point}": cuts[point - 1] * 1000 for point in points}
+
+
+def summarize(name: str, samples: list[float]):
+    """Print count, p50 and p99 of `samples` (seconds) in milliseconds."""
+    if len(samples) < 2:
+        print(f"{name}: not enough samples ({len(samples)})")
+        return
+    cuts = percentiles(samples, (50, 99))
+    print(
+        f"{name}: n={len(samples)} "
+        f"p50={cuts['p50']:.2f}ms p99={cuts['p99']:.2f}ms"
+    )
@@ -0,0 +1,142 @@
+"""Read throughput while writes are in flight, with and without the
+SQLite pragma profile from `db.session.sqlite_pragmas`.
+
+For each profile, a fresh database gets PROJECTS projects of TASKS tasks
+each. Then READERS tasks page through project tasks while WRITERS tasks
+insert WRITE_BATCH tasks and their logs per transaction, for DURATION
+seconds. Prints reads and written rows per second, read latency percentiles,
+and how many operations failed with "database is locked".
+"""
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+from sqlalchemy import select, insert
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+import bench.common  # noqa: F401  (configures the throwaway database)
+from bench.common import summarize
+from db.migrations import migrate
+from db.models import User, Project, Task, TaskLog
+from db.session import make_engine, sqlite_pragmas
+
+
+PROJECTS = 20
+TASKS = 1_000
+READERS = 8
+WRITERS = 2
+WRITE_BATCH = 200
+DURATION = 5.0
+PROFILES = {
+    "sqlite defaults": {},
+    "pragma profile": sqlite_pragmas(),
+}
+
+
+async def generate(engine: AsyncEngine):
+    async with engine.begin() as conn:
+        await conn.run_sync(migrate)
+        await conn.execute(
+            insert(User),
+            [{"id": 1, "username": "bench", "password_hash": "-"}]
+        )
+        await conn.execute(insert(Project), [
+            {"id": i, "owner_id": 1, "title": f"p{i}"}
+            for i in range(1, PROJECTS + 1)
+        ])
+        await conn.execute(insert(Task), [
+            {"project_id": p, "title": f"task {i}", "status": "open"}
+            for p in range(1, PROJECTS + 1)
+            for i in range(TASKS)
+        ])
+
+
+async def reader(engine: AsyncEngine, deadline: float, stats: dict):
+    rng = random.Random()
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            async with engine.connect() as conn:
+                (await conn.execute(
+                    select(Task)
+                    .where(Task.project_id == rng.randint(1, PROJECTS))
+                    .order_by(Task.id)
+                    .limit(50)
+                )).all()
+        except OperationalError:
+            stats["read errors"] += 1
+            continue
+        stats["latencies"].append(time.perf_counter() - start)
+
+
+async def writer(engine: AsyncEngine, deadline: float, stats: dict):
+    rng = random.Random()
+    while time.perf_counter() < deadline:
+        try:
+            async with engine.begin() as conn:
+                tasks = (await conn.execute(
+                    insert(Task).returning(Task.id, Task.project_id),
+                    [
+                        {
+                            "project_id": rng.randint(1, PROJECTS),
+                            "title": "written",
+                            "status": "open"
+                        }
+                        for _ in range(WRITE_BATCH)
+                    ]
+                )).all()
+                await conn.execute(insert(TaskLog), [
+                    {
+                        "task_id": task_id,
+                        "project_id": project_id,
+                        "user_id": 1,
+                        "action": "Created a task"
+                    }
+                    for task_id, project_id in tasks
+                ])
+        except OperationalError:
+            stats["write errors"] += 1
+            continue
+        stats["writes"] += WRITE_BATCH
+
+
+async def run(name: str, pragmas: dict):
+    path = os.path.join(tempfile.mkdtemp(prefix="teamtask-bench-"), "c.db")
+    engine = make_engine(
+        f"sqlite+aiosqlite:///{path}",
+        pragmas,
+        pool_size=READERS + WRITERS,
+        max_overflow=0
+    )
+    await generate(engine)
+    stats = {
+        "latencies": [],
+        "writes": 0,
+        "read errors": 0,
+        "write errors": 0
+    }
+    deadline = time.perf_counter() + DURATION
+    await asyncio.gather(
+        *(reader(engine, deadline, stats) for _ in range(READERS)),
+        *(writer(engine, deadline, stats) for _ in range(WRITERS))
+    )
+    await engine.dispose()
+    print(
+        f"{name}: {len(stats['latencies']) / DURATION:.0f} reads/s, "
+        f"{stats['writes'] / DURATION:.0f} rows written/s, "
+        f"{stats['read errors']} read errors, "
+        f"{stats['write errors']} write errors"
+    )
+    summarize(f"{name} read latency", stats["latencies"])
+
+
+async def main():
+    for name, pragmas in PROFILES.items():
+        await run(name, pragmas)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,185 @@
+"""Peak memory of `GET /project/{id}/export` on a small and a large project.
+
+Requests both exports from the app over ASGI and fails if the large one
+needs noticeably more memory than the small one, i.e. if memory grows
+with the number of rows. Both the Python heap peak (tracemalloc) and the
+process RSS are checked, the latter sampled as each chunk is sent.
+
+httpx's ASGITransport collects the whole body before returning, which
+would itself grow with the export, so the app is called directly.
+"""
+import asyncio
+import gc
+import os
+import resource
+import sys
+import time
+import tracemalloc
+
+from sqlalchemy import insert
+
+from bench.common import client, register, login
+from db.models import Task, TaskLog
+from db.session import engine
+from main import app
+
+
+SMALL = (10, 10)
+LARGE = (1_000, 200)
+CHUNK_ROWS = 10_000
+# Allowed growth of the large export's peaks over the small one's
+PEAK_SLACK = 4 * 1024 * 1024
+RSS_SLACK = 8 * 1024 * 1024
+
+
+async def generate(project_id: int, user_id: int, tasks: int,
+                   logs_per_task: int):
+    first_task = project_id * 1_000_000
+    async with engine.begin() as conn:
+        await conn.execute(insert(Task), [
+            {
+                "id": first_task + i,
+                "project_id": project_id,
+                "title": f"task {i}",
+                "status": "open"
+            }
+            for i in range(tasks)
+        ])
+        rows = []
+        for i in range(tasks):
+            for j in range(logs_per_task):
+                rows.append({
+                    "task_id": first_task + i,
+                    "project_id": project_id,
+                    "user_id": user_id,
+                    "action": f"Updated fields: status ({j})"
+                })
+                if len(rows) == CHUNK_ROWS:
+                    await conn.execute(insert(TaskLog), rows)
+                    rows = []
+        if rows:
+            await conn.execute(insert(TaskLog), rows)
+
+
+def rss() -> int:
+    """Current resident set size; the peak so far where /proc is
+    missing, which only shows growth past earlier peaks."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss if sys.platform == "darwin" else rss * 1024
+
+
+async def get(path: str, query: str, headers: dict[str, str]):
+    """Send a GET through the ASGI app; returns the status, body size and
+    peak RSS growth while the body was streamed."""
+    rss_before = rss()
+    rss_peak = rss_before
+    status = None
+    size = 0
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query.encode(),
+        "root_path": "",
+        "headers": [
+            (k.lower().encode(), v.encode()) for k, v in headers.items()
+        ],
+        "server": ("bench", 80),
+        "client": ("127.0.0.1", 0),
+    }
+    requested = False
+    done = asyncio.Event()
+
+    async def receive():
+        nonlocal requested
+        if requested:
+            await done.wait()
+            return {"type": "http.disconnect"}
+        requested = True
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal status, size, rss_peak
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            size += len(message.get("body", b""))
+            rss_peak = max(rss_peak, rss())
+            if not message.get("more_body", False):
+                done.set()
+
+    await app(scope, receive, send)
+    return status, size, rss_peak - rss_before
+
+
+async def export(
+    project_id: int,
+    headers: dict[str, str],
+    compress: bool
+) -> tuple[int, int]:
+    gc.collect()
+    tracemalloc.reset_peak()
+    start = time.perf_counter()
+    status, size, rss_growth = await get(
+        f"/project/{project_id}/export",
+        "gzip=true" if compress else "",
+        headers
+    )
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    if status != 200:
+        raise RuntimeError(f"export of project {project_id}: {status}")
+    print(
+        f"project {project_id} compress={compress}: {size} bytes "
+        f"in {elapsed:.2f}s, traced peak {peak / 1024:.0f} KiB, "
+        f"peak RSS growth {rss_growth / 1024:.0f} KiB"
+    )
+    return peak, rss_growth
+
+
+async def main() -> int:
+    failed = False
+    async with client() as c:
+        await register(c, "bench", "password")
+        headers = await login(c, "bench", "password")
+        user_id = (await c.get("/auth/me", headers=headers)).json()["id"]
+        projects = []
+        for size in (SMALL, LARGE):
+            r = await c.post(
+                "/project/",
+                json={"title": f"{size[0]} tasks"},
+                headers=headers
+            )
+            r.raise_for_status()
+            projects.append(r.json()["id"])
+            await generate(projects[-1], user_id, *size)
+        small, large = projects
+
+        tracemalloc.start()
+        # Warm up, so neither measured export pays for first-use setup
+        await export(small, headers, True)
+        for compress in (False, True):
+            small_peak, small_rss = await export(small, headers, compress)
+            large_peak, large_rss = await export(large, headers, compress)
+            if large_peak > small_peak + PEAK_SLACK:
+                print(f"FAIL: large export peak exceeds small by more "
+                      f"than {PEAK_SLACK // 1024} KiB")
+                failed = True
+            if large_rss > small_rss + RSS_SLACK:
+                print(f"FAIL: large export RSS growth exceeds small by "
+                      f"more than {RSS_SLACK // 1024} KiB")
+                failed = True
+        tracemalloc.stop()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,121 @@
+"""Seeded synthetic data for benchmarks.
+
+`generate` fills the database behind `db.session.engine` with `users`
+users, `projects` projects with `members` members besides the owner,
+`tasks` tasks per project and `logs` TaskLog rows per task. The same
+seed always produces the same rows, so runs of `bench.suite` against
+different commits are comparable.
+"""
+import random
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+
+from core.security import ph
+from db.access import backfill_access
+from db.models import User, Project, Task, TaskLog, user_project
+from db.session import engine
+from db.stats import rebuild_stats
+
+
+PASSWORD = "bench-password"
+CHUNK_ROWS = 10_000
+STATUSES = ("open", "in progress", "done")
+WORDS = (
+    "api", "login", "release", "database", "cache", "report", "export",
+    "search", "deploy", "review", "design", "bug", "migration", "docs",
+    "metrics", "billing", "onboarding", "mobile", "queue", "backup",
+)
+
+
+@dataclass
+class Dataset:
+    seed: int
+    usernames: dict[int, str] = field(default_factory=dict)
+    # project id -> ids of users with access, owner first
+    project_users: dict[int, list[int]] = field(default_factory=dict)
+    # project id -> task ids
+    project_tasks: dict[int, list[int]] = field(default_factory=dict)
+    # user id -> ids of projects the user can access
+    user_projects: dict[int, list[int]] = field(default_factory=dict)
+
+
+async def _insert_chunked(conn, table, rows):
+    for start in range(0, len(rows), CHUNK_ROWS):
+        await conn.execute(insert(table), rows[start:start + CHUNK_ROWS])
+
+
+async def generate(
+    users: int,
+    projects: int,
+    members: int,
+    tasks: int,
+    logs: int,
+    seed: int = 0
+) -> Dataset:
+    rng = random.Random(seed)
+    data = Dataset(seed=seed)
+    # One argon2 hash shared by every user keeps generation fast
+    password_hash = ph.hash(PASSWORD)
+    user_rows = []
+    for user_id in range(1, users + 1):
+        data.usernames[user_id] = f"user{user_id}"
+        data.user_projects[user_id] = []
+        user_rows.append({
+            "id": user_id,
+            "username": data.usernames[user_id],
+            "password_hash": password_hash
+        })
+    project_rows = []
+    member_rows = []
+    for project_id in range(1, projects + 1):
+        owner_id = rng.randint(1, users)
+        candidates = rng.sample(range(1, users + 1), min(members + 1, users))
+        member_ids = [u for u in candidates if u != owner_id][:members]
+        data.project_users[project_id] = [owner_id, *member_ids]
+        for user_id in data.project_users[project_id]:
+            data.user_projects[user_id].append(project_id)
+        project_rows.append({
+            "id": project_id,
+            "owner_id": owner_id,
+            "title": f"project {project_id}"
+        })
+        member_rows += [
+            {"user_id": user_id, "project_id": project_id}
+            for user_id in member_ids
+        ]
+    task_rows = []
+    log_rows = []
+    start = datetime(2025, 1, 1)
+    task_id = 0
+    for project_id, user_ids in data.project_users.items():
+        data.project_tasks[project_id] = []
+        for _ in range(tasks):
+            task_id += 1
+            data.project_tasks[project_id].append(task_id)
+            task_rows.append({
+                "id": task_id,
+                "project_id": project_id,
+                "title": " ".join(rng.choices(WORDS, k=3)),
+                "description": " ".join(rng.choices(WORDS, k=12)),
+                "status": rng.choice(STATUSES)
+            })
+            for i in range(logs):
+                action = "Updated fields: status" if i else "Created a task"
+                log_rows.append({
+                    "task_id": task_id,
+                    "project_id": project_id,
+                    "user_id": rng.choice(user_ids),
+                    "action": action,
+                    "timestamp": start + timedelta(seconds=task_id * 60 + i)
+                })
+    async with engine.begin() as conn:
+        await _insert_chunked(conn, User, user_rows)
+        await _insert_chunked(conn, Project, project_rows)
+        await _insert_chunked(conn, user_project, member_rows)
+        await _insert_chunked(conn, Task, task_rows)
+        await _insert_chunked(conn, TaskLog, log_rows)
+        await conn.run_sync(backfill_access)
+        await conn.run_sync(rebuild_stats)
+    return data
@@ -0,0 +1,95 @@
+"""Serialize time per response payload, stdlib JSON vs. FAST_JSON.
+
+Builds `ProjectRead` payloads with N members and `Page[TaskReadSimple]`
+payloads with N tasks from unsaved ORM objects, and times the steps
+FastAPI takes for a route with a `response_model`: validate from
+attributes, dump to JSON-compatible Python, and render the body, once
+with `JSONResponse` and once with `FastJSONResponse` backed by orjson.
+"""
+import os
+import timeit
+
+os.environ.setdefault("FAST_JSON", "true")
+
+import bench.common  # noqa: E402,F401  (configures the throwaway database)
+from fastapi.responses import JSONResponse  # noqa: E402
+from pydantic import TypeAdapter  # noqa: E402
+
+from api.responses import FAST_JSON, FastJSONResponse  # noqa: E402
+from db.models import User, Project, Task  # noqa: E402
+from schemas.page import Page  # noqa: E402
+from schemas.project import ProjectRead  # noqa: E402
+from schemas.task import TaskReadSimple  # noqa: E402
+
+
+SIZES = (10, 100, 1_000)
+NUMBER = 20
+REPEAT = 5
+
+
+def project_payload(n: int) -> Project:
+    users = [
+        User(id=i, username=f"user{i}", password_hash="-")
+        for i in range(n)
+    ]
+    return Project(
+        id=1,
+        title="project",
+        version=1,
+        owner=users[0],
+        users=users
+    )
+
+
+def tasks_payload(n: int) -> dict:
+    return {
+        "items": [
+            Task(
+                id=i,
+                title=f"task {i}",
+                description="описание " * 5,
+                status="open",
+                version=1
+            )
+            for i in range(n)
+        ],
+        "next_cursor": None
+    }
+
+
+def best(func) -> float:
+    """Best time of one call in microseconds."""
+    times = timeit.repeat(func, number=NUMBER, repeat=REPEAT)
+    return min(times) / NUMBER * 1e6
+
+
+def measure(name: str, adapter: TypeAdapter, payload):
+    validated = adapter.validate_python(payload, from_attributes=True)
+    content = adapter.dump_python(validated, mode="json")
+    validate = best(
+        lambda: adapter.validate_python(payload, from_attributes=True)
+    )
+    dump = best(lambda: adapter.dump_python(validated, mode="json"))
+    stdlib = best(lambda: JSONResponse.render(None, content))
+    fast = best(lambda: FastJSONResponse.render(None, content))
+    size = len(JSONResponse.render(None, content))
+    print(
+        f"{name} ({size} bytes): validate {validate:.0f}us, "
+        f"dump {dump:.0f}us, render stdlib {stdlib:.0f}us / "
+        f"fast {fast:.0f}us; total {validate + dump + stdlib:.0f}us -> "
+        f"{validate + dump + fast:.0f}us"
+    )
+
+
+def main():
+    if not FAST_JSON:
+        print("orjson isn't installed; both renders use the stdlib")
+    project = TypeAdapter(ProjectRead)
+    tasks = TypeAdapter(Page[TaskReadSimple])
+    for n in SIZES:
+        measure(f"ProjectRead, {n} users", project, project_payload(n))
+        measure(f"Page[TaskReadSimple], {n} tasks", tasks, tasks_payload(n))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""p99 latency of `GET /project/` while `/auth/token` is under load.
+
+Logins run argon2 in `core.security.hasher_pool`, so reads should stay
+fast even with many concurrent logins in flight. Also times renewing a
+token with the refresh token grant, which skips argon2.
+"""
+import asyncio
+import time
+
+from bench.common import client, register, login, summarize
+
+
+LOGIN_CONCURRENCY = 16
+READS = 200
+REFRESHES = 200
+
+
+async def main():
+    async with client() as c:
+        await register(c, "bench", "password")
+        headers = await login(c, "bench", "password")
+        await c.post("/project/", json={"title": "bench"}, headers=headers)
+
+        stop = asyncio.Event()
+        login_samples: list[float] = []
+        rejected = 0
+
+        async def login_worker():
+            nonlocal rejected
+            while not stop.is_set():
+                start = time.perf_counter()
+                r = await c.post(
+                    "/auth/token",
+                    data={"username": "bench", "password": "password"}
+                )
+                if r.status_code == 503:
+                    rejected += 1
+                    await asyncio.sleep(0.01)
+                else:
+                    login_samples.append(time.perf_counter() - start)
+
+        async def read_baseline() -> list[float]:
+            samples = []
+            for _ in range(READS):
+                start = time.perf_counter()
+                r = await c.get("/project/", headers=headers)
+                r.raise_for_status()
+                samples.append(time.perf_counter() - start)
+            return samples
+
+        summarize("GET /project/ idle", await read_baseline())
+
+        workers = [
+            asyncio.create_task(login_worker())
+            for _ in range(LOGIN_CONCURRENCY)
+        ]
+        summarize("GET /project/ under login load", await read_baseline())
+        stop.set()
+        await asyncio.gather(*workers)
+        summarize("POST /auth/token", login_samples)
+        print(f"POST /auth/token rejected with 503: {rejected}")
+
+        r = await c.post(
+            "/auth/token",
+            data={"username": "bench", "password": "password"}
+        )
+        refresh_token = r.json()["refresh_token"]
+        refresh_samples = []
+        for _ in range(REFRESHES):
+            start = time.perf_counter()
+            r = await c.post("/auth/token", data={
+                "grant_type": "refresh_token",
+                "refresh_token": refresh_token
+            })
+            r.raise_for_status()
+            refresh_samples.append(time.perf_counter() - start)
+            refresh_token = r.json()["refresh_token"]
+        summarize("POST /auth/token (refresh_token)", refresh_samples)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
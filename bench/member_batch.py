@@ -0,0 +1,90 @@
+"""Onboarding a team: the single-member route against the batch routes.
+
+Adds MEMBERS users to a project one request at a time and then in one
+`users:batch` request, and removes them again the same two ways,
+printing members per second for each.
+"""
+import asyncio
+import time
+
+from sqlalchemy import insert
+
+from bench.common import client, register, login
+from db.models import User
+from db.session import engine
+
+
+MEMBERS = 200
+
+
+def report(name: str, count: int, elapsed: float):
+    print(f"{name}: {count} members in {elapsed:.2f}s "
+          f"({count / elapsed:.0f} members/s)")
+
+
+async def main():
+    async with client() as c:
+        await register(c, "bench", "password")
+        headers = await login(c, "bench", "password")
+        usernames = [f"member{i}" for i in range(MEMBERS)]
+        # Registering through the API would spend the time hashing
+        async with engine.begin() as conn:
+            await conn.execute(insert(User), [
+                {"username": username, "password_hash": "-"}
+                for username in usernames
+            ])
+        single, batch = [
+            (await c.post(
+                "/project/",
+                json={"title": title},
+                headers=headers
+            )).json()["id"]
+            for title in ("single", "batch")
+        ]
+
+        start = time.perf_counter()
+        for username in usernames:
+            await c.post(
+                f"/project/{single}/user",
+                json={"username": username},
+                headers=headers
+            )
+        report("single add", MEMBERS, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        r = await c.post(
+            f"/project/{batch}/users:batch",
+            json={"usernames": usernames},
+            headers=headers
+        )
+        assert len(r.json()["added"]) == MEMBERS
+        report("batch add", MEMBERS, time.perf_counter() - start)
+
+        user_ids = [
+            user["id"]
+            for user in (await c.get(
+                f"/project/{single}",
+                headers=headers
+            )).json()["users"]
+        ]
+        start = time.perf_counter()
+        for user_id in user_ids:
+            await c.delete(
+                f"/project/{single}/user/{user_id}",
+                headers=headers
+            )
+        report("single remove", MEMBERS, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        r = await c.request(
+            "DELETE",
+            f"/project/{batch}/users:batch",
+            json={"usernames": usernames},
+            headers=headers
+        )
+        assert len(r.json()["removed"]) == MEMBERS
+        report("batch remove", MEMBERS, time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,79 @@
+"""Cost of request metrics, per request and per scrape.
+
+Times the bookkeeping `MetricsMiddleware` does for every request, runs
+the same ASGI request through the middleware and around it, and times
+a /metrics scrape once ROUTES routes have recorded requests.
+"""
+import asyncio
+import os
+import time
+import timeit
+
+os.environ.setdefault("METRICS", "true")
+
+import bench.common  # noqa: E402,F401  (configures the throwaway database)
+from api.metrics import (  # noqa: E402
+    MetricsMiddleware,
+    in_flight,
+    request_seconds,
+    requests_total
+)
+from core.metrics import collect, registry  # noqa: E402
+
+
+NUMBER = 100_000
+REQUESTS = 20_000
+ROUTES = 50
+
+
+def record():
+    in_flight.inc()
+    in_flight.dec()
+    request_seconds.labels("GET", "/task/{id}").observe(0.0042)
+    requests_total.labels("GET", "/task/{id}", "200").inc()
+
+
+async def app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200})
+    await send({"type": "http.response.body", "body": b""})
+
+
+async def receive():
+    return {"type": "http.request", "body": b""}
+
+
+async def send(message):
+    pass
+
+
+async def per_request(asgi) -> float:
+    scope = {"type": "http", "method": "GET", "path": "/bench"}
+    start = time.perf_counter()
+    for _ in range(REQUESTS):
+        await asgi(scope, receive, send)
+    return (time.perf_counter() - start) / REQUESTS * 1e6
+
+
+async def main():
+    bookkeeping = min(timeit.repeat(record, number=NUMBER, repeat=5))
+    print(f"bookkeeping: {bookkeeping / NUMBER * 1e6:.2f}us per request")
+
+    bare = await per_request(app)
+    wrapped = await per_request(MetricsMiddleware(app))
+    print(f"ASGI request: {bare:.2f}us bare, {wrapped:.2f}us with metrics")
+
+    for i in range(ROUTES):
+        for status in ("200", "404"):
+            requests_total.labels("GET", f"/route/{i}", status).inc()
+        request_seconds.labels("GET", f"/route/{i}").observe(0.01)
+    start = time.perf_counter()
+    body = await collect()
+    print(
+        f"scrape with {ROUTES} routes: {len(body)} bytes in "
+        f"{(time.perf_counter() - start) * 1000:.2f}ms "
+        f"({len(registry.snapshot())} metrics)"
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
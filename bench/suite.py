@@ -0,0 +1,309 @@
+"""Per-endpoint load test against a seeded synthetic dataset.
+
+Generates data with `bench.generate`, logs in SESSIONS users and then,
+for each endpoint in turn:
+
+1. sends QUERY_SAMPLES requests one at a time, counting the SQL
+   statements they execute, to get queries per request;
+2. sends `--requests` requests from `--concurrency` concurrent clients
+   and records throughput and p50/p95/p99 latency.
+
+Results can be written as JSON with `--out` and compared with an earlier
+run with `--baseline`. The run fails if an endpoint's p95 latency grew,
+or its throughput fell, by more than `--threshold`, or if it runs
+another query per request.
+
+    uv run python -m bench.suite --out before.json
+    uv run python -m bench.suite --baseline before.json
+"""
+import argparse
+import asyncio
+import json
+import platform
+import random
+import sys
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+
+import httpx
+import sqlalchemy
+from sqlalchemy import event
+
+from bench.common import client, login, percentiles
+from bench.generate import PASSWORD, Dataset, generate
+from db.session import engine, read_engine, export_engine
+
+
+SESSIONS = 10
+QUERY_SAMPLES = 20
+# argon2 makes logins orders of magnitude slower than other requests
+LOGIN_REQUESTS = 20
+# Cache expiry can add a fraction of a query per request between runs;
+# a whole new query per request is a regression
+QUERY_SLACK = 0.5
+
+
+@dataclass
+class Session:
+    user_id: int
+    headers: dict[str, str]
+    projects: list[int]
+
+
+@dataclass
+class Endpoint:
+    name: str
+    # Returns the next request to send as (method, url, keyword arguments)
+    request: Callable[[random.Random], tuple[str, str, dict]]
+    requests: int | None = None
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, *args):
+        self.count += 1
+
+
+def endpoints(data: Dataset, sessions: list[Session]) -> list[Endpoint]:
+    def session(rng: random.Random) -> tuple[Session, int, int]:
+        s = rng.choice(sessions)
+        project_id = rng.choice(s.projects)
+        return s, project_id, rng.choice(data.project_tasks[project_id])
+
+    def get(path: Callable[[Session, int, int], str], **params):
+        def request(rng):
+            s, project_id, task_id = session(rng)
+            return "GET", path(s, project_id, task_id), {
+                "headers": s.headers,
+                "params": params
+            }
+        return request
+
+    def login_request(rng):
+        s = rng.choice(sessions)
+        return "POST", "/auth/token", {"data": {
+            "username": data.usernames[s.user_id],
+            "password": PASSWORD
+        }}
+
+    def update_task(rng):
+        s, _, task_id = session(rng)
+        return "PATCH", f"/task/{task_id}", {
+            "headers": s.headers,
+            "json": {"status": rng.choice(("open", "done"))}
+        }
+
+    def create_task(rng):
+        s, project_id, _ = session(rng)
+        return "POST", f"/project/{project_id}", {
+            "headers": s.headers,
+            "json": {"title": "bench task", "status": "open"}
+        }
+
+    return [
+        Endpoint("POST /auth/token", login_request, LOGIN_REQUESTS),
+        Endpoint("GET /auth/", get(lambda s, p, t: "/auth/")),
+        Endpoint("GET /project/", get(lambda s, p, t: "/project/")),
+        Endpoint("GET /project/{id}", get(lambda s, p, t: f"/project/{p}")),
+        Endpoint(
+            "GET /project/{id}/tasks",
+            get(lambda s, p, t: f"/project/{p}/tasks")
+        ),
+        Endpoint("GET /task/{id}", get(lambda s, p, t: f"/task/{t}")),
+        Endpoint(
+            "GET /task/{id}/logs",
+            get(lambda s, p, t: f"/task/{t}/logs")
+        ),
+        Endpoint("GET /project/stats", get(lambda s, p, t: "/project/stats")),
+        Endpoint(
+            "GET /project/{id}/stats",
+            get(lambda s, p, t: f"/project/{p}/stats")
+        ),
+        Endpoint(
+            "GET /task/?status=open",
+            get(lambda s, p, t: "/task/", status="open")
+        ),
+        Endpoint("GET /dashboard", get(lambda s, p, t: "/dashboard")),
+        Endpoint(
+            "GET /task/search",
+            get(lambda s, p, t: "/task/search", q="login release")
+        ),
+        Endpoint("PATCH /task/{id}", update_task),
+        Endpoint("POST /project/{id}", create_task),
+    ]
+
+
+async def send(c: httpx.AsyncClient, request) -> float:
+    method, url, kwargs = request
+    start = time.perf_counter()
+    r = await c.request(method, url, **kwargs)
+    elapsed = time.perf_counter() - start
+    r.raise_for_status()
+    return elapsed
+
+
+async def run_endpoint(
+    c: httpx.AsyncClient,
+    endpoint: Endpoint,
+    counter: QueryCounter,
+    requests: int,
+    concurrency: int,
+    seed: int
+) -> dict:
+    rng = random.Random(seed)
+    counter.count = 0
+    for _ in range(QUERY_SAMPLES):
+        await send(c, endpoint.request(rng))
+    queries = counter.count / QUERY_SAMPLES
+
+    total = endpoint.requests or requests
+    pending = [endpoint.request(rng) for _ in range(total)]
+    samples: list[float] = []
+
+    async def worker():
+        while pending:
+            samples.append(await send(c, pending.pop()))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {
+        "requests": total,
+        "throughput": total / elapsed,
+        **percentiles(samples),
+        "queries_per_request": queries,
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    regressions = []
+    for name, current in results["endpoints"].items():
+        before = baseline["endpoints"].get(name)
+        if before is None:
+            continue
+        if current["p95"] > before["p95"] * (1 + threshold):
+            regressions.append(
+                f"{name}: p95 {before['p95']:.2f}ms -> {current['p95']:.2f}ms"
+            )
+        if current["throughput"] < before["throughput"] * (1 - threshold):
+            regressions.append(
+                f"{name}: throughput {before['throughput']:.0f}/s -> "
+                f"{current['throughput']:.0f}/s"
+            )
+        if (
+            current["queries_per_request"]
+            > before["queries_per_request"] + QUERY_SLACK
+        ):
+            regressions.append(
+                f"{name}: queries per request "
+                f"{before['queries_per_request']:g} -> "
+                f"{current['queries_per_request']:g}"
+            )
+    return regressions
+
+
+def print_table(results: dict):
+    print(f"{'endpoint':<26}{'req/s':>9}{'p50':>9}{'p95':>9}{'p99':>9}"
+          f"{'queries':>9}")
+    for name, r in results["endpoints"].items():
+        print(
+            f"{name:<26}{r['throughput']:>9.0f}{r['p50']:>9.2f}"
+            f"{r['p95']:>9.2f}{r['p99']:>9.2f}"
+            f"{r['queries_per_request']:>9.2f}"
+        )
+
+
+async def main(args: argparse.Namespace) -> int:
+    counter = QueryCounter()
+    for e in (engine, read_engine, export_engine):
+        if e is not None:
+            event.listen(e.sync_engine, "before_cursor_execute", counter)
+    async with client() as c:
+        start = time.perf_counter()
+        data = await generate(
+            users=args.users,
+            projects=args.projects,
+            members=args.members,
+            tasks=args.tasks,
+            logs=args.logs,
+            seed=args.seed
+        )
+        print(f"generated dataset in {time.perf_counter() - start:.1f}s")
+        rng = random.Random(args.seed)
+        with_projects = [u for u, p in data.user_projects.items() if p]
+        sessions = [
+            Session(
+                user_id=user_id,
+                headers=await login(c, data.usernames[user_id], PASSWORD),
+                projects=data.user_projects[user_id]
+            )
+            for user_id in rng.sample(
+                with_projects,
+                min(SESSIONS, len(with_projects))
+            )
+        ]
+        results = {
+            "meta": {
+                "users": args.users,
+                "projects": args.projects,
+                "members": args.members,
+                "tasks": args.tasks,
+                "logs": args.logs,
+                "seed": args.seed,
+                "requests": args.requests,
+                "concurrency": args.concurrency,
+                "python": platform.python_version(),
+                "sqlalchemy": sqlalchemy.__version__,
+            },
+            "endpoints": {}
+        }
+        for endpoint in endpoints(data, sessions):
+            results["endpoints"][endpoint.name] = await run_endpoint(
+                c,
+                endpoint,
+                counter,
+                args.requests,
+                args.concurrency,
+                args.seed
+            )
+    print_table(results)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+    return 0
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--projects", type=int, default=100)
+    parser.add_argument("--members", type=int, default=5)
+    parser.add_argument("--tasks", type=int, default=50)
+    parser.add_argument("--logs", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--out", help="write results to this JSON file")
+    parser.add_argument("--baseline", help="JSON results to compare with")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.25,
+        help="allowed relative p95/throughput change (default 0.25)"
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(parse_args())))
@@ -0,0 +1,91 @@
+"""Throughput of the batch task routes against their single-item routes.
+
+Creates, updates and deletes TASKS tasks one request at a time and then
+in batches of BATCH, printing tasks per second for each.
+"""
+import asyncio
+import time
+
+from bench.common import client, register, login
+
+
+TASKS = 500
+BATCH = 500
+
+
+def report(name: str, count: int, elapsed: float):
+    print(f"{name}: {count} tasks in {elapsed:.2f}s "
+          f"({count / elapsed:.0f} tasks/s)")
+
+
+async def main():
+    async with client() as c:
+        await register(c, "bench", "password")
+        headers = await login(c, "bench", "password")
+        r = await c.post("/project/", json={"title": "bench"}, headers=headers)
+        project_id = r.json()["id"]
+
+        start = time.perf_counter()
+        single_ids = []
+        for i in range(TASKS):
+            r = await c.post(
+                f"/project/{project_id}",
+                json={"title": f"single {i}", "status": "open"},
+                headers=headers
+            )
+            single_ids.append(r.json()["id"])
+        report("single create", TASKS, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        batch_ids = []
+        for offset in range(0, TASKS, BATCH):
+            r = await c.post(
+                f"/project/{project_id}/tasks:batch",
+                json={"tasks": [
+                    {"title": f"batch {i}", "status": "open"}
+                    for i in range(offset, min(offset + BATCH, TASKS))
+                ]},
+                headers=headers
+            )
+            batch_ids += [item["id"] for item in r.json()["results"]]
+        report("batch create", TASKS, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for task_id in single_ids:
+            await c.patch(
+                f"/task/{task_id}",
+                json={"status": "done"},
+                headers=headers
+            )
+        report("single update", TASKS, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for offset in range(0, TASKS, BATCH):
+            await c.patch(
+                "/task:batch",
+                json={"tasks": [
+                    {"id": task_id, "status": "done"}
+                    for task_id in batch_ids[offset:offset + BATCH]
+                ]},
+                headers=headers
+            )
+        report("batch update", TASKS, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for task_id in single_ids:
+            await c.delete(f"/task/{task_id}", headers=headers)
+        report("single delete", TASKS, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for offset in range(0, TASKS, BATCH):
+            await c.request(
+                "DELETE",
+                "/task:batch",
+                json={"ids": batch_ids[offset:offset + BATCH]},
+                headers=headers
+            )
+        report("batch delete", TASKS, time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,134 @@
+"""`GET /task/search` query vs. a LIKE scan over TASKS tasks.
+
+Generates TASKS tasks with titles and descriptions drawn from a Zipf-like
+vocabulary, spread over PROJECTS projects of which the searching user
+can access ACCESSIBLE, then times first-page searches for rare and
+common words both ways and prints SQLite's query plan.
+"""
+import asyncio
+import random
+import time
+
+from sqlalchemy import select, insert, or_, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import bench.common  # noqa: F401  (configures the throwaway database)
+from bench.common import summarize
+from api.pagination import PageParams, paginate
+from db.access import join_access, backfill_access
+from db.models import User, Project, Task
+from db.search import match_query, relevance, search_tasks
+from db.session import engine, init_db
+
+
+TASKS = 1_000_000
+PROJECTS = 1_000
+ACCESSIBLE = 100
+VOCABULARY = 20_000
+CHUNK_ROWS = 50_000
+SAMPLES = 200
+PAGE = PageParams(limit=50, cursor=None)
+
+
+def words(rng: random.Random, n: int) -> str:
+    # Rank r is drawn with probability ~1/r, like word frequencies
+    return " ".join(
+        f"w{int(VOCABULARY ** rng.random())}" for _ in range(n)
+    )
+
+
+async def generate():
+    rng = random.Random(0)
+    async with engine.begin() as conn:
+        await conn.execute(insert(User), [
+            {"id": i, "username": f"user{i}", "password_hash": "-"}
+            for i in (1, 2)
+        ])
+        await conn.execute(insert(Project), [
+            {
+                "id": i,
+                "owner_id": 1 if i <= ACCESSIBLE else 2,
+                "title": f"p{i}"
+            }
+            for i in range(1, PROJECTS + 1)
+        ])
+        await conn.run_sync(backfill_access)
+        for start in range(0, TASKS, CHUNK_ROWS):
+            await conn.execute(insert(Task), [
+                {
+                    "project_id": rng.randint(1, PROJECTS),
+                    "title": words(rng, 3),
+                    "description": words(rng, 12),
+                    "status": "open"
+                }
+                for _ in range(start, min(start + CHUNK_ROWS, TASKS))
+            ])
+
+
+def search_stmt(word: str):
+    return join_access(search_tasks(match_query(word)), 1, Task.project_id)
+
+
+def search(word: str):
+    return lambda session: paginate(
+        session,
+        search_stmt(word),
+        PAGE,
+        (relevance, Task.id)
+    )
+
+
+def like(word: str):
+    return lambda session: session.execute(like_stmt(word))
+
+
+def like_stmt(word: str):
+    pattern = f"%{word}%"
+    return join_access(
+        select(Task).where(
+            or_(Task.title.like(pattern), Task.description.like(pattern))
+        ),
+        1,
+        Task.project_id
+    ).order_by(Task.id).limit(PAGE.limit + 1)
+
+
+async def measure(name: str, queries):
+    samples = []
+    async with AsyncSession(engine) as session:
+        for query in queries:
+            start = time.perf_counter()
+            await query(session)
+            samples.append(time.perf_counter() - start)
+    summarize(name, samples)
+
+
+async def main():
+    await init_db()
+    start = time.perf_counter()
+    await generate()
+    print(f"generated {TASKS} tasks in {time.perf_counter() - start:.1f}s")
+    rng = random.Random(1)
+    rare = [f"w{rng.randint(VOCABULARY // 2, VOCABULARY)}"
+            for _ in range(SAMPLES)]
+    common = [f"w{rng.randint(1, 20)}" for _ in range(SAMPLES)]
+    async with engine.connect() as conn:
+        stmt = search_stmt("w1").add_columns(relevance, Task.id)
+        compiled = stmt.compile(
+            dialect=engine.dialect,
+            compile_kwargs={"literal_binds": True}
+        )
+        print("search plan:")
+        for row in (await conn.execute(
+            text(f"EXPLAIN QUERY PLAN {compiled}")
+        )).all():
+            print(f"    {row[-1]}")
+    for name, sample in (("rare", rare), ("common", common)):
+        await measure(f"fts5 {name}", [search(w) for w in sample])
+        # A LIKE scan reads every task, so a few samples are enough
+        await measure(f"like {name}", [like(w) for w in sample[:10]])
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
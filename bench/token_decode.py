@@ -0,0 +1,34 @@
+"""Cost of authenticating a bearer token, verified vs. cached.
+
+Times `decode_token` on a token it has already verified, against the
+full signature verification it falls back to on a cache miss.
+"""
+import timeit
+
+import bench.common  # noqa: F401  (configures the throwaway database)
+from core.security import (
+    _verify_token,
+    decode_token,
+    encode_token
+)
+
+
+NUMBER = 20_000
+
+
+def best(func) -> float:
+    """Best time of one call in microseconds."""
+    times = timeit.repeat(func, number=NUMBER, repeat=5)
+    return min(times) / NUMBER * 1e6
+
+
+def main():
+    token = encode_token("bench")
+    decode_token(token)
+    verified = best(lambda: _verify_token(token))
+    cached = best(lambda: decode_token(token))
+    print(f"verify signature: {verified:.2f}us, cached: {cached:.2f}us")
+
+
+if __name__ == "__main__":
+    main()
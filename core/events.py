@@ -0,0 +1,218 @@
+"""In-process pub/sub for project change events.
+
+Routes publish an `Event` after committing; `api.routes.events` streams
+them to subscribers of that project. `LocalEventBus` only reaches
+subscribers in the same process. `SQLiteEventBus` relays every event
+through a small SQLite file shared by all workers on the host, so each
+worker's subscribers see events published by the others.
+"""
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from dataclasses import dataclass, asdict
+from typing import Any
+
+from core.settings import settings
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Event:
+    project_id: int
+    type: str
+    data: dict[str, Any]
+    # TaskLog id for task events, so clients can resume from it
+    id: int | None = None
+
+
+class Subscription:
+    """Bounded queue of events for one subscriber.
+
+    A subscriber that falls `maxsize` events behind is cut off: its
+    queue is replaced by a single None, after which the stream should
+    end and the client reconnect with Last-Event-ID."""
+
+    def __init__(self, project_id: int, maxsize: int):
+        self.project_id = project_id
+        self.overflowed = False
+        self._queue: asyncio.Queue[Event | None] = asyncio.Queue(maxsize)
+
+    def put(self, event: Event):
+        if self.overflowed:
+            return
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+            while not self._queue.empty():
+                self._queue.get_nowait()
+            self._queue.put_nowait(None)
+
+    async def get(self) -> Event | None:
+        return await self._queue.get()
+
+
+class EventBus(ABC):
+    def __init__(self, buffer_size: int):
+        self.buffer_size = buffer_size
+        self._subscribers: defaultdict[int, set[Subscription]] = (
+            defaultdict(set)
+        )
+
+    def subscribe(self, project_id: int) -> Subscription:
+        subscription = Subscription(project_id, self.buffer_size)
+        self._subscribers[project_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subscribers = self._subscribers.get(subscription.project_id)
+        if subscribers is None:
+            return
+        subscribers.discard(subscription)
+        if not subscribers:
+            del self._subscribers[subscription.project_id]
+
+    def subscriber_count(self) -> int:
+        return sum(len(s) for s in self._subscribers.values())
+
+    def dispatch(self, event: Event):
+        for subscription in tuple(self._subscribers.get(event.project_id, ())):
+            subscription.put(event)
+
+    @abstractmethod
+    async def publish(self, event: Event):
+        ...
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+
+class LocalEventBus(EventBus):
+    async def publish(self, event: Event):
+        self.dispatch(event)
+
+
+class SQLiteEventBus(EventBus):
+    """Relays events through a table in a SQLite file shared by workers.
+
+    Each worker appends what it publishes and polls for rows it hasn't
+    seen every `interval` seconds, dispatching them to its own
+    subscribers. Rows older than `retention` seconds are pruned."""
+
+    def __init__(
+        self,
+        buffer_size: int,
+        path: str,
+        interval: float,
+        retention: float
+    ):
+        super().__init__(buffer_size)
+        self.path = path
+        self.interval = interval
+        self.retention = retention
+        self._conn: sqlite3.Connection | None = None
+        self._conn_lock = threading.Lock()
+        self._last_seq = 0
+        self._task: asyncio.Task | None = None
+
+    def _execute(self, sql: str, params: tuple = ()) -> list[tuple]:
+        assert self._conn is not None
+        with self._conn_lock:
+            rows = self._conn.execute(sql, params).fetchall()
+            self._conn.commit()
+            return rows
+
+    def _open(self):
+        self._conn = sqlite3.connect(
+            self.path,
+            timeout=5,
+            check_same_thread=False
+        )
+        self._execute("PRAGMA journal_mode=WAL")
+        self._execute(
+            "CREATE TABLE IF NOT EXISTS events ("
+            "seq INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "created REAL NOT NULL, "
+            "payload TEXT NOT NULL)"
+        )
+        self._last_seq = self._execute(
+            "SELECT coalesce(max(seq), 0) FROM events"
+        )[0][0]
+
+    async def start(self):
+        if self._task is None:
+            await asyncio.to_thread(self._open)
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    async def publish(self, event: Event):
+        if self._conn is None:
+            self.dispatch(event)
+            return
+        await asyncio.to_thread(
+            self._execute,
+            "INSERT INTO events (created, payload) VALUES (?, ?)",
+            (time.time(), json.dumps(asdict(event)))
+        )
+
+    async def _poll(self):
+        rows = await asyncio.to_thread(
+            self._execute,
+            "SELECT seq, payload FROM events WHERE seq > ? ORDER BY seq",
+            (self._last_seq,)
+        )
+        for seq, payload in rows:
+            self._last_seq = seq
+            self.dispatch(Event(**json.loads(payload)))
+
+    async def _run(self):
+        last_prune = time.monotonic()
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self._poll()
+                if time.monotonic() - last_prune > self.retention:
+                    last_prune = time.monotonic()
+                    await asyncio.to_thread(
+                        self._execute,
+                        "DELETE FROM events WHERE created < ?",
+                        (time.time() - self.retention,)
+                    )
+            except sqlite3.Error:
+                logger.exception("Event bus poll failed")
+
+
+def create_event_bus() -> EventBus:
+    if settings.event_bus_backend == "sqlite":
+        return SQLiteEventBus(
+            buffer_size=settings.event_buffer_size,
+            path=settings.event_bus_path,
+            interval=settings.event_poll_ms / 1000,
+            retention=settings.event_retention_seconds
+        )
+    return LocalEventBus(buffer_size=settings.event_buffer_size)
+
+
+event_bus = create_event_bus()
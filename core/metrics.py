@@ -0,0 +1,374 @@
+"""Prometheus metrics with as little overhead per request as possible.
+
+Metrics are plain Python objects updated from the event loop thread
+only, so incrementing a counter or observing a histogram is a dict
+lookup and a couple of additions, with no locks. A histogram's buckets
+are allocated once per label set. `render` produces the Prometheus text
+exposition format.
+
+With METRICS_DIR set, each worker writes a snapshot of its registry to
+`<METRICS_DIR>/<pid>.json` every METRICS_FLUSH_SECONDS, and the worker
+serving /metrics merges the snapshots of all workers. Counters and
+histograms are summed over every file, so requests served by workers
+that have since exited still count; gauges only over live workers. The
+directory should be emptied when the server is (re)started.
+"""
+import asyncio
+import json
+import logging
+import math
+import os
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from collections.abc import Callable, Iterable
+from pathlib import Path
+from typing import Any
+
+from core.settings import settings
+
+
+logger = logging.getLogger(__name__)
+
+type LabelValues = tuple[str, ...]
+
+# Seconds; suits requests served from a local database
+DEFAULT_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+    5.0, 10.0
+)
+
+
+class CounterValue:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+
+class GaugeValue(CounterValue):
+    __slots__ = ()
+
+    def dec(self, amount: float = 1.0):
+        self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class HistogramValue:
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: tuple[float, ...]):
+        self.bounds = bounds
+        # counts[i] is observations in (bounds[i - 1], bounds[i]]; the
+        # last one is everything above the largest bound
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+
+class Metric(ABC):
+    type = ""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = ()
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: dict[LabelValues, Any] = {}
+
+    @abstractmethod
+    def _new_value(self) -> Any:
+        ...
+
+    def labels(self, *values: str) -> Any:
+        value = self._values.get(values)
+        if value is None:
+            value = self._values[values] = self._new_value()
+        return value
+
+    def _sample(self, value: Any) -> Any:
+        return value.value
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            "type": self.type,
+            "help": self.documentation,
+            "labels": list(self.labelnames),
+            "samples": [
+                [list(labels), self._sample(value)]
+                for labels, value in self._values.items()
+            ]
+        }
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def _new_value(self) -> CounterValue:
+        return CounterValue()
+
+
+class Gauge(Metric):
+    """Gauge set directly, or read from `function` at snapshot time.
+
+    `function` returns values by label values, e.g. `{("primary",): 3}`.
+    """
+    type = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        function: Callable[[], dict[LabelValues, float]] | None = None
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+
+    def _new_value(self) -> GaugeValue:
+        return GaugeValue()
+
+    def snapshot(self) -> dict[str, Any]:
+        if self.function is not None:
+            for labels, value in self.function().items():
+                self.labels(*labels).set(value)
+        return super().snapshot()
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_value(self) -> HistogramValue:
+        return HistogramValue(self.buckets)
+
+    def _sample(self, value: HistogramValue) -> dict[str, Any]:
+        return {"counts": list(value.counts), "sum": value.sum}
+
+    def snapshot(self) -> dict[str, Any]:
+        return {**super().snapshot(), "buckets": list(self.buckets)}
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, Metric] = {}
+
+    def register[M: Metric](self, metric: M) -> M:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, **kwargs) -> Counter:
+        return self.register(Counter(name, documentation, **kwargs))
+
+    def gauge(self, name: str, documentation: str, **kwargs) -> Gauge:
+        return self.register(Gauge(name, documentation, **kwargs))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        **kwargs
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, **kwargs))
+
+    def snapshot(self) -> dict[str, dict[str, Any]]:
+        return {
+            name: metric.snapshot()
+            for name, metric in self._metrics.items()
+        }
+
+
+registry = Registry()
+
+
+def merge(
+    snapshots: Iterable[tuple[dict[str, dict[str, Any]], bool]]
+) -> dict[str, dict[str, Any]]:
+    """Sums (snapshot, worker is alive) pairs into one snapshot whose
+    samples are keyed by label values. Gauges of dead workers are left
+    out."""
+    merged: dict[str, dict[str, Any]] = {}
+    for snapshot, alive in snapshots:
+        for name, metric in snapshot.items():
+            if metric["type"] == "gauge" and not alive:
+                continue
+            target = merged.setdefault(name, {**metric, "samples": {}})
+            samples = target["samples"]
+            for labels, value in metric["samples"]:
+                key = tuple(labels)
+                if metric["type"] != "histogram":
+                    samples[key] = samples.get(key, 0.0) + value
+                    continue
+                current = samples.get(key)
+                if current is None:
+                    samples[key] = {
+                        "counts": list(value["counts"]),
+                        "sum": value["sum"]
+                    }
+                elif len(current["counts"]) == len(value["counts"]):
+                    for i, count in enumerate(value["counts"]):
+                        current["counts"][i] += count
+                    current["sum"] += value["sum"]
+    return merged
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return (
+        value.replace("\\", "\\\\")
+        .replace('"', '\\"')
+        .replace("\n", "\\n")
+    )
+
+
+def _sample_line(
+    name: str,
+    labels: Iterable[tuple[str, str]],
+    value: float
+) -> str:
+    pairs = ",".join(f'{k}="{_escape(v)}"' for k, v in labels)
+    if pairs:
+        return f"{name}{{{pairs}}} {_format_value(value)}"
+    return f"{name} {_format_value(value)}"
+
+
+def render(merged: dict[str, dict[str, Any]]) -> str:
+    lines = []
+    for name, metric in merged.items():
+        documentation = metric["help"].replace("\\", "\\\\")
+        lines.append(f"# HELP {name} {documentation}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        for key, value in sorted(metric["samples"].items()):
+            labels = list(zip(metric["labels"], key))
+            if metric["type"] != "histogram":
+                lines.append(_sample_line(name, labels, value))
+                continue
+            total = 0
+            bounds = [*metric["buckets"], math.inf]
+            for bound, count in zip(bounds, value["counts"]):
+                total += count
+                lines.append(_sample_line(
+                    f"{name}_bucket",
+                    [*labels, ("le", _format_value(bound))],
+                    total
+                ))
+            lines.append(_sample_line(f"{name}_sum", labels, value["sum"]))
+            lines.append(_sample_line(f"{name}_count", labels, total))
+    return "\n".join(lines) + "\n"
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class MetricsStore:
+    """Per-worker snapshot files in `path`, for multi-worker servers."""
+
+    def __init__(self, registry: Registry, path: str, interval: float):
+        self.registry = registry
+        self.path = Path(path)
+        self.interval = interval
+        self._task: asyncio.Task | None = None
+
+    @property
+    def own_file(self) -> Path:
+        return self.path / f"{os.getpid()}.json"
+
+    def _write(self, snapshot: dict[str, dict[str, Any]]):
+        tmp = self.own_file.with_suffix(".tmp")
+        tmp.write_text(json.dumps(snapshot))
+        os.replace(tmp, self.own_file)
+
+    def write(self):
+        self._write(self.registry.snapshot())
+
+    def read(self) -> list[tuple[dict[str, dict[str, Any]], bool]]:
+        snapshots = []
+        for file in self.path.glob("*.json"):
+            try:
+                pid = int(file.stem)
+                snapshot = json.loads(file.read_text())
+            except (OSError, ValueError):
+                # Not ours, or removed since the glob
+                continue
+            snapshots.append((snapshot, _alive(pid)))
+        return snapshots
+
+    async def start(self):
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.write()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self.write()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await asyncio.to_thread(self._write, self.registry.snapshot())
+            except OSError:
+                logger.exception("Couldn't write metrics snapshot")
+
+
+metrics_store = MetricsStore(
+    registry,
+    settings.metrics_dir,
+    settings.metrics_flush_seconds
+) if settings.metrics_dir else None
+
+
+async def collect() -> str:
+    """The merged metrics of every worker, in Prometheus text format."""
+    snapshot = registry.snapshot()
+    if metrics_store is None:
+        return render(merge([(snapshot, True)]))
+
+    def merge_files() -> str:
+        metrics_store._write(snapshot)
+        return render(merge(metrics_store.read()))
+
+    return await asyncio.to_thread(merge_files)
@@ -1,9 +1,16 @@
+import asyncio
+import hashlib
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone, timedelta
 
 import jwt
 from jwt.exceptions import InvalidTokenError
 import argon2
 
+from core.cache import TTLCache
+from core.metrics import registry
 from core.settings import settings
 from schemas.auth import TokenData
 
@@ -11,11 +18,80 @@ from schemas.auth import TokenData
 ph = argon2.PasswordHasher()
 
 
-def hash_password(password: str) -> str:
-    return ph.hash(password)
+hash_seconds = registry.histogram(
+    "password_hash_seconds",
+    "Time spent in argon2, excluding time queued for a worker thread",
+    labelnames=("operation",),
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+)
+hash_rejected = registry.counter(
+    "password_hash_rejected_total",
+    "argon2 calls refused because the hasher queue was full"
+)
 
 
-def verify_password(hash: str, password: str) -> bool:
+class HasherBusy(Exception):
+    pass
+
+
+def _timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+class HasherPool:
+    """Runs argon2 in worker threads so it doesn't block the event loop.
+
+    At most `workers + queue_size` calls may be pending at once; anything
+    beyond that raises `HasherBusy` instead of queueing indefinitely."""
+
+    def __init__(self, workers: int, queue_size: int):
+        self.workers = workers
+        self.limit = workers + queue_size
+        self.pending = 0
+        self._executor: ThreadPoolExecutor | None = None
+
+    async def run(self, operation: str, func, *args):
+        if self.pending >= self.limit:
+            hash_rejected.labels().inc()
+            raise HasherBusy
+        # Created on first use, so the pool works again after shutdown,
+        # e.g. when the app is started twice in one process
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.workers,
+                thread_name_prefix="argon2"
+            )
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            result, elapsed = await loop.run_in_executor(
+                self._executor,
+                _timed,
+                func,
+                *args
+            )
+        finally:
+            self.pending -= 1
+        # Observed here rather than in the worker thread, so that metrics
+        # are only ever updated from the event loop
+        hash_seconds.labels(operation).observe(elapsed)
+        return result
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+hasher_pool = HasherPool(
+    workers=settings.password_hash_workers,
+    queue_size=settings.password_hash_queue
+)
+
+
+def _verify_password(hash: str, password: str) -> bool:
     try:
         ph.verify(hash, password)
     except (
@@ -28,25 +104,102 @@ def verify_password(hash: str, password: str) -> bool:
         return True
 
 
+async def hash_password(password: str) -> str:
+    return await hasher_pool.run("hash", ph.hash, password)
+
+
+async def verify_password(hash: str, password: str) -> bool:
+    return await hasher_pool.run(
+        "verify",
+        _verify_password,
+        hash,
+        password
+    )
+
+
 class InvalidCredentials(Exception):
     pass
 
 
-def decode_token(token: str) -> TokenData:
+# Signing keys by `kid`; new tokens are signed with JWT_KEY, while keys
+# in JWT_PREVIOUS_KEYS still verify tokens issued before a rotation
+jwt_keys = {
+    **settings.jwt_previous_keys,
+    settings.jwt_key_id: settings.jwt_key
+}
+
+# Verified tokens by SHA-256 of the token, so repeat requests with the
+# same token skip signature verification
+token_cache: TTLCache[bytes, TokenData] = TTLCache(
+    maxsize=settings.token_cache_size,
+    ttl=settings.token_cache_ttl
+)
+
+
+class RevocationList:
+    """`jti` claims of revoked tokens that haven't expired yet."""
+
+    def __init__(self):
+        self._expires: dict[str, float] = {}
+
+    def __contains__(self, jti: str) -> bool:
+        return jti in self._expires
+
+    def __len__(self) -> int:
+        return len(self._expires)
+
+    def add(self, jti: str, expires: float):
+        self._expires[jti] = expires
+
+    def prune(self):
+        now = time.time()
+        self._expires = {
+            jti: expires
+            for jti, expires in self._expires.items()
+            if expires > now
+        }
+
+
+revoked_tokens = RevocationList()
+
+
+def _verify_token(token: str) -> TokenData:
     try:
+        kid = jwt.get_unverified_header(token).get("kid")
+        # Tokens from before key ids were issued carry none
+        key = jwt_keys[kid] if kid is not None else settings.jwt_key
         payload = jwt.decode(
             token,
-            settings.jwt_key,
+            key,
             algorithms=[settings.jwt_algo],
+            options={"require": ["exp"]}
         )
-    except InvalidTokenError as e:
+    except (InvalidTokenError, KeyError) as e:
         raise InvalidCredentials from e
 
     username = payload.get("sub")
     if username is None:
         raise InvalidCredentials
 
-    return TokenData(username=username)
+    return TokenData(
+        username=username,
+        jti=payload.get("jti"),
+        exp=payload["exp"]
+    )
+
+
+def decode_token(token: str) -> TokenData:
+    key = hashlib.sha256(token.encode()).digest()
+    token_data = token_cache.get(key)
+    if token_data is None:
+        token_data = _verify_token(token)
+        token_cache.set(key, token_data)
+    elif token_data.exp <= time.time():
+        token_cache.pop(key)
+        raise InvalidCredentials
+    if token_data.jti is not None and token_data.jti in revoked_tokens:
+        raise InvalidCredentials
+    return token_data
 
 
 def encode_token(username: str) -> str:
@@ -57,8 +210,10 @@ def encode_token(username: str) -> str:
     return jwt.encode(
         {
             "sub": username,
-            "exp": expire
+            "exp": expire,
+            "jti": uuid.uuid4().hex
         },
         settings.jwt_key,
-        algorithm=settings.jwt_algo
+        algorithm=settings.jwt_algo,
+        headers={"kid": settings.jwt_key_id}
     )
@@ -3,10 +3,52 @@ from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
     database_url: str
+    database_read_url: str = ""
+    read_replica_lag_seconds: float = 2.0
     sqlalchemy_echo: bool
     jwt_key: str
     jwt_algo: str
     jwt_minutes: int
+    jwt_key_id: str = "1"
+    # Retired keys by key id, e.g. {"0": "old-secret"}
+    jwt_previous_keys: dict[str, str] = {}
+    token_cache_size: int = 10000
+    token_cache_ttl: float = 300.0
+    token_revocation_poll_ms: int = 1000
+    refresh_token_days: int = 30
+    fast_json: bool = False
+    server_timing: bool = False
+    query_budget_check: bool = False
+    query_budget: int = 20
+    query_repeat_limit: int = 3
+    metrics: bool = False
+    metrics_dir: str = ""
+    metrics_flush_seconds: float = 5.0
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout: float = 30.0
+    db_pool_recycle: int = -1
+    db_pool_pre_ping: bool = False
+    sqlite_journal_mode: str = "WAL"
+    sqlite_synchronous: str = "NORMAL"
+    sqlite_busy_timeout_ms: int = 5000
+    # Negative values are KiB, as in SQLite's cache_size pragma
+    sqlite_cache_size: int = -65536
+    sqlite_mmap_size: int = 268435456
+    principal_cache_size: int = 1024
+    principal_cache_ttl: float = 30.0
+    password_hash_workers: int = 4
+    password_hash_queue: int = 64
+    tasklog_write_behind: bool = False
+    tasklog_buffer_size: int = 10000
+    tasklog_flush_batch: int = 500
+    tasklog_flush_ms: int = 200
+    tasklog_sync_fallback: bool = True
+    event_bus_backend: str = "local"
+    event_bus_path: str = "./events.db"
+    event_buffer_size: int = 256
+    event_poll_ms: int = 100
+    event_retention_seconds: int = 300
 
     class Config:
         env_file = ".env"
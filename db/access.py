@@ -0,0 +1,141 @@
+from collections.abc import Iterable
+
+from sqlalchemy import (
+    Select,
+    select,
+    delete,
+    insert,
+    exists,
+    true,
+    false
+)
+from sqlalchemy import Connection
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.models import Project, ProjectAccess, user_project
+
+
+def join_access(stmt: Select, user_id: int, project_id_column) -> Select:
+    """Restrict `stmt` to rows in projects the user can access."""
+    return stmt.join(
+        ProjectAccess,
+        (ProjectAccess.project_id == project_id_column)
+        & (ProjectAccess.user_id == user_id)
+    )
+
+
+async def has_access(
+    session: AsyncSession,
+    user_id: int,
+    project_id: int
+) -> bool:
+    return await session.get(ProjectAccess, (user_id, project_id)) is not None
+
+
+async def grant_access(
+    session: AsyncSession,
+    project_id: int,
+    user_id: int,
+    is_owner: bool = False
+):
+    if await session.get(ProjectAccess, (user_id, project_id)) is None:
+        session.add(ProjectAccess(
+            user_id=user_id,
+            project_id=project_id,
+            is_owner=is_owner
+        ))
+
+
+async def add_members(
+    session: AsyncSession,
+    project_id: int,
+    user_ids: Iterable[int]
+) -> set[int]:
+    """Add users to the project's members and grant them access; returns
+    the ids of those who weren't members yet."""
+    rows = [
+        {"user_id": user_id, "project_id": project_id}
+        for user_id in set(user_ids)
+    ]
+    if not rows:
+        return set()
+    # Existing members are skipped, and left out of RETURNING
+    added = set((await session.execute(
+        insert(user_project)
+        .prefix_with("OR IGNORE", dialect="sqlite")
+        .returning(user_project.c.user_id),
+        rows
+    )).scalars())
+    if added:
+        await session.execute(
+            insert(ProjectAccess).prefix_with("OR IGNORE", dialect="sqlite"),
+            [
+                {
+                    "user_id": user_id,
+                    "project_id": project_id,
+                    "is_owner": False
+                }
+                for user_id in added
+            ]
+        )
+    return added
+
+
+async def remove_members(
+    session: AsyncSession,
+    project_id: int,
+    user_ids: Iterable[int]
+) -> set[int]:
+    """Remove users from the project's members and revoke their access,
+    unless they own it; returns the ids of those who were members."""
+    user_ids = set(user_ids)
+    if not user_ids:
+        return set()
+    removed = set((await session.execute(
+        delete(user_project)
+        .where(
+            user_project.c.project_id == project_id,
+            user_project.c.user_id.in_(user_ids)
+        )
+        .returning(user_project.c.user_id)
+    )).scalars())
+    if removed:
+        await session.execute(
+            delete(ProjectAccess)
+            .where(
+                ProjectAccess.project_id == project_id,
+                ProjectAccess.user_id.in_(removed),
+                ProjectAccess.is_owner.is_(False)
+            )
+        )
+    return removed
+
+
+async def drop_project_access(session: AsyncSession, project_id: int):
+    await session.execute(
+        delete(ProjectAccess)
+        .where(ProjectAccess.project_id == project_id)
+    )
+
+
+def backfill_access(conn: Connection):
+    """Populate `project_access` from owners and `users_teams` when the
+    table is empty, e.g. on a database created before it existed."""
+    if conn.execute(select(exists(ProjectAccess))).scalar():
+        return
+    conn.execute(
+        insert(ProjectAccess).from_select(
+            ["user_id", "project_id", "is_owner"],
+            select(Project.owner_id, Project.id, true())
+        )
+    )
+    conn.execute(
+        insert(ProjectAccess).from_select(
+            ["user_id", "project_id", "is_owner"],
+            select(user_project.c.user_id, user_project.c.project_id, false())
+            .where(~exists().where(
+                Project.id == user_project.c.project_id,
+                Project.owner_id == user_project.c.user_id
+            ))
+        )
+    )
@@ -6,6 +6,7 @@ Base = declarative_base()
 from db.models import (  # noqa
     User,
     Project,
+    ProjectAccess,
     Task,
     TaskLog
 )
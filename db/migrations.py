@@ -0,0 +1,316 @@
+"""Versioned schema migrations.
+
+Applied versions are recorded in `schema_version`. A fresh database gets
+the current schema from the models and is stamped with the latest
+version; a database that predates versioning starts at 0 and runs every
+step, so steps must tolerate objects that already exist.
+
+To change the schema, update `db/models.py` and append a step to
+`MIGRATIONS` that brings an existing database to the same shape. Steps
+are literal SQL rather than built from the models, so they keep doing
+what they did when they shipped; never edit one once it has.
+"""
+import logging
+from collections.abc import Callable
+
+from sqlalchemy import (
+    Connection,
+    Table,
+    MetaData,
+    Column,
+    Integer,
+    DateTime,
+    inspect,
+    insert,
+    select,
+    func,
+    text
+)
+
+from db.base import Base
+from db.search import create_task_search
+
+
+logger = logging.getLogger(__name__)
+
+
+schema_version = Table(
+    "schema_version",
+    MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column(
+        "applied_at",
+        DateTime(timezone=True),
+        server_default=func.now(),
+        nullable=False
+    )
+)
+
+
+def _execute(conn: Connection, *statements: str):
+    for statement in statements:
+        conn.execute(text(statement))
+
+
+def _0001_project_access(conn: Connection):
+    _execute(
+        conn,
+        "CREATE TABLE IF NOT EXISTS project_access ("
+        "user_id INTEGER NOT NULL REFERENCES users (id), "
+        "project_id INTEGER NOT NULL REFERENCES projects (id), "
+        "is_owner BOOLEAN NOT NULL, "
+        "PRIMARY KEY (user_id, project_id)"
+        ")",
+        "CREATE INDEX IF NOT EXISTS ix_project_access_project_id "
+        "ON project_access (project_id)"
+    )
+    if conn.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM project_access)"
+    )).scalar():
+        return
+    _execute(
+        conn,
+        "INSERT INTO project_access (user_id, project_id, is_owner) "
+        "SELECT owner_id, id, 1 FROM projects",
+        "INSERT INTO project_access (user_id, project_id, is_owner) "
+        "SELECT m.user_id, m.project_id, 0 FROM users_teams m "
+        "WHERE NOT EXISTS (SELECT 1 FROM projects p "
+        "WHERE p.id = m.project_id AND p.owner_id = m.user_id)"
+    )
+
+
+def _0002_indexes(conn: Connection):
+    for statement in (
+        "CREATE INDEX IF NOT EXISTS ix_tasks_project_id "
+        "ON tasks (project_id)",
+        "CREATE INDEX IF NOT EXISTS ix_tasklogs_task_id_timestamp "
+        "ON tasklogs (task_id, timestamp)",
+        "CREATE INDEX IF NOT EXISTS ix_tasklogs_user_id "
+        "ON tasklogs (user_id)",
+        "CREATE INDEX IF NOT EXISTS ix_tasklogs_timestamp "
+        "ON tasklogs (timestamp)",
+        "CREATE INDEX IF NOT EXISTS ix_users_teams_project_id "
+        "ON users_teams (project_id)",
+        "CREATE INDEX IF NOT EXISTS ix_project_access_project_id "
+        "ON project_access (project_id)",
+    ):
+        conn.execute(text(statement))
+
+
+def _add_column(conn: Connection, table: str, name: str, ddl: str):
+    columns = {column["name"] for column in inspect(conn).get_columns(table)}
+    if name not in columns:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}"))
+
+
+def _0003_versions(conn: Connection):
+    _add_column(conn, "projects", "version", "INTEGER NOT NULL DEFAULT 1")
+    _add_column(conn, "tasks", "version", "INTEGER NOT NULL DEFAULT 1")
+
+
+def _0004_tasklog_autoincrement(conn: Connection):
+    if conn.dialect.name != "sqlite":
+        return
+    ddl = conn.execute(text(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' "
+        "AND name = 'tasklogs'"
+    )).scalar_one()
+    if "AUTOINCREMENT" in ddl.upper():
+        return
+    # SQLite can only add AUTOINCREMENT by rebuilding the table
+    for index in inspect(conn).get_indexes("tasklogs"):
+        conn.execute(text(f"DROP INDEX {index['name']}"))
+    conn.execute(text("ALTER TABLE tasklogs RENAME TO tasklogs_old"))
+    # The table as of this version, not the current model: later steps
+    # bring it up to date
+    conn.execute(text(
+        "CREATE TABLE tasklogs ("
+        "id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT, "
+        "task_id INTEGER NOT NULL REFERENCES tasks (id), "
+        "user_id INTEGER NOT NULL REFERENCES users (id), "
+        "action VARCHAR(255) NOT NULL, "
+        "timestamp DATETIME DEFAULT (CURRENT_TIMESTAMP) NOT NULL"
+        ")"
+    ))
+    conn.execute(text(
+        "INSERT INTO tasklogs (id, task_id, user_id, action, timestamp) "
+        "SELECT id, task_id, user_id, action, timestamp FROM tasklogs_old"
+    ))
+    conn.execute(text("DROP TABLE tasklogs_old"))
+    for statement in (
+        "CREATE INDEX ix_tasklogs_task_id_timestamp "
+        "ON tasklogs (task_id, timestamp)",
+        "CREATE INDEX ix_tasklogs_user_id ON tasklogs (user_id)",
+        "CREATE INDEX ix_tasklogs_timestamp ON tasklogs (timestamp)",
+    ):
+        conn.execute(text(statement))
+
+
+def _0005_task_search(conn: Connection):
+    create_task_search(conn)
+
+
+def _0006_revoked_tokens(conn: Connection):
+    _execute(
+        conn,
+        "CREATE TABLE IF NOT EXISTS revoked_tokens ("
+        "id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT, "
+        "jti VARCHAR(32) NOT NULL UNIQUE, "
+        "expires_at DATETIME NOT NULL"
+        ")",
+        "CREATE INDEX IF NOT EXISTS ix_revoked_tokens_expires_at "
+        "ON revoked_tokens (expires_at)"
+    )
+
+
+def _0007_refresh_tokens(conn: Connection):
+    _execute(
+        conn,
+        "CREATE TABLE IF NOT EXISTS refresh_tokens ("
+        "id INTEGER NOT NULL PRIMARY KEY, "
+        "token_hash VARCHAR(64) NOT NULL UNIQUE, "
+        "user_id INTEGER NOT NULL REFERENCES users (id), "
+        "family VARCHAR(32) NOT NULL, "
+        "session_started_at DATETIME NOT NULL, "
+        "created_at DATETIME NOT NULL, "
+        "expires_at DATETIME NOT NULL, "
+        "used_at DATETIME, "
+        "revoked BOOLEAN NOT NULL, "
+        "access_jti VARCHAR(32) NOT NULL, "
+        "access_expires_at DATETIME NOT NULL"
+        ")",
+        "CREATE INDEX IF NOT EXISTS ix_refresh_tokens_user_id "
+        "ON refresh_tokens (user_id)",
+        "CREATE INDEX IF NOT EXISTS ix_refresh_tokens_family "
+        "ON refresh_tokens (family)"
+    )
+
+
+def _0008_project_stats(conn: Connection):
+    _execute(
+        conn,
+        "CREATE TABLE IF NOT EXISTS project_stats ("
+        "project_id INTEGER NOT NULL PRIMARY KEY REFERENCES projects (id), "
+        "member_count INTEGER NOT NULL, "
+        "last_activity_at DATETIME"
+        ")",
+        "CREATE TABLE IF NOT EXISTS project_task_counts ("
+        "project_id INTEGER NOT NULL REFERENCES projects (id), "
+        "status VARCHAR(30) NOT NULL, "
+        "count INTEGER NOT NULL, "
+        "PRIMARY KEY (project_id, status)"
+        ")",
+        "DELETE FROM project_task_counts",
+        "DELETE FROM project_stats",
+        "INSERT INTO project_stats "
+        "(project_id, member_count, last_activity_at) "
+        "SELECT p.id, "
+        "(SELECT count(*) FROM project_access a WHERE a.project_id = p.id), "
+        "(SELECT max(l.timestamp) FROM tasklogs l "
+        "JOIN tasks t ON t.id = l.task_id WHERE t.project_id = p.id) "
+        "FROM projects p",
+        "INSERT INTO project_task_counts (project_id, status, count) "
+        "SELECT project_id, status, count(*) FROM tasks "
+        "GROUP BY project_id, status"
+    )
+
+
+def _0009_task_status_index(conn: Connection):
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_tasks_project_id_status_id "
+        "ON tasks (project_id, status, id)"
+    ))
+
+
+def _0010_insert_sentinels(conn: Connection):
+    _add_column(conn, "tasks", "_sentinel", "INTEGER")
+    _add_column(conn, "tasklogs", "_sentinel", "INTEGER")
+
+
+def _0011_tasklog_project(conn: Connection):
+    _add_column(
+        conn,
+        "tasklogs",
+        "project_id",
+        "INTEGER REFERENCES projects (id)"
+    )
+    conn.execute(text(
+        "UPDATE tasklogs SET project_id = ("
+        "SELECT project_id FROM tasks WHERE tasks.id = tasklogs.task_id"
+        ") WHERE project_id IS NULL"
+    ))
+    # Logs whose task no longer exists have no project to copy; they
+    # are kept, with a NULL project_id, rather than dropped
+    orphans = conn.execute(text(
+        "SELECT count(*) FROM tasklogs WHERE project_id IS NULL"
+    )).scalar_one()
+    if orphans:
+        logger.warning(
+            "%d task logs belong to deleted tasks and have no project",
+            orphans
+        )
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_tasklogs_project_id_timestamp "
+        "ON tasklogs (project_id, timestamp, id)"
+    ))
+
+
+def _0012_refresh_token_access_jti_index(conn: Connection):
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_refresh_tokens_access_jti "
+        "ON refresh_tokens (access_jti)"
+    ))
+
+
+def _0013_task_title_index(conn: Connection):
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_tasks_project_id_title_id "
+        "ON tasks (project_id, title, id)"
+    ))
+
+
+MIGRATIONS: list[Callable[[Connection], None]] = [
+    _0001_project_access,
+    _0002_indexes,
+    _0003_versions,
+    _0004_tasklog_autoincrement,
+    _0005_task_search,
+    _0006_revoked_tokens,
+    _0007_refresh_tokens,
+    _0008_project_stats,
+    _0009_task_status_index,
+    _0010_insert_sentinels,
+    _0011_tasklog_project,
+    _0012_refresh_token_access_jti_index,
+    _0013_task_title_index,
+]
+LATEST_VERSION = len(MIGRATIONS)
+
+
+def current_version(conn: Connection) -> int | None:
+    """Applied schema version, or None if the database isn't versioned."""
+    if not inspect(conn).has_table(schema_version.name):
+        return None
+    return conn.execute(
+        select(func.coalesce(func.max(schema_version.c.version), 0))
+    ).scalar_one()
+
+
+def migrate(conn: Connection) -> int:
+    """Bring the schema up to `LATEST_VERSION`; returns the version."""
+    version = current_version(conn)
+    if version == LATEST_VERSION:
+        return version
+    if version is None:
+        schema_version.create(conn)
+        if not inspect(conn).has_table("users"):
+            Base.metadata.create_all(conn)
+            conn.execute(
+                insert(schema_version).values(version=LATEST_VERSION)
+            )
+            return LATEST_VERSION
+        version = 0
+    for number, step in enumerate(MIGRATIONS[version:], start=version + 1):
+        step(conn)
+        conn.execute(insert(schema_version).values(version=number))
+    return LATEST_VERSION
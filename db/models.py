@@ -1,17 +1,25 @@
 from datetime import datetime
 
 from sqlalchemy import (
+    JSON,
+    Boolean,
     String,
     Text,
     DateTime,
     ForeignKey,
     Table,
-    Column
+    Column,
+    Index,
+    select,
+    type_coerce
 )
 from sqlalchemy.sql import func
+from sqlalchemy.dialects import sqlite
 from sqlalchemy.orm import (
     Mapped,
+    column_property,
     mapped_column,
+    orm_insert_sentinel,
     relationship
 )
 
@@ -28,10 +36,34 @@ user_project = Table(
         DateTime(timezone=True),
         server_default=func.now(),
         nullable=False
-    )
+    ),
+    Index("ix_users_teams_project_id", "project_id")
 )
 
 
+class ProjectAccess(Base):
+    """One row per (user, project) the user may access, owner included.
+
+    Kept in sync with `Project.owner_id` and `users_teams` by `db.access`,
+    so every authorization check is a single primary key lookup."""
+    __tablename__ = "project_access"
+
+    user_id: Mapped[int] = mapped_column(
+        ForeignKey("users.id"),
+        primary_key=True
+    )
+    project_id: Mapped[int] = mapped_column(
+        ForeignKey("projects.id"),
+        primary_key=True,
+        index=True
+    )
+    is_owner: Mapped[bool] = mapped_column(
+        Boolean,
+        nullable=False,
+        default=False
+    )
+
+
 class User(Base):
     __tablename__ = "users"
 
@@ -72,6 +104,12 @@ class Project(Base):
         String(30),
         nullable=False
     )
+    # Bumped on every change to the project, its members or its tasks
+    version: Mapped[int] = mapped_column(
+        nullable=False,
+        default=1,
+        server_default="1"
+    )
 
     users: Mapped[list[User]] = relationship(
         secondary=user_project,
@@ -89,11 +127,19 @@ class Project(Base):
 
 class Task(Base):
     __tablename__ = "tasks"
+    __table_args__ = (
+        # Status filters within and across projects; ix_tasks_project_id
+        # still serves per-project listings ordered by id
+        Index("ix_tasks_project_id_status_id", "project_id", "status", "id"),
+        # Per-project listings sorted by title
+        Index("ix_tasks_project_id_title_id", "project_id", "title", "id"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     project_id: Mapped[int] = mapped_column(
         ForeignKey("projects.id"),
-        nullable=False
+        nullable=False,
+        index=True
     )
     title: Mapped[str] = mapped_column(
         String(255),
@@ -104,6 +150,14 @@ class Task(Base):
         nullable=True
     )
     status: Mapped[str] = mapped_column(String(30), nullable=False)
+    version: Mapped[int] = mapped_column(
+        nullable=False,
+        default=1,
+        server_default="1"
+    )
+    # Filled in by batch inserts so that SQLite can return their ids in
+    # input order from a single multi-row INSERT; not meaningful after
+    _sentinel: Mapped[int] = orm_insert_sentinel()
 
     project: Mapped[Project] = relationship(
         back_populates="tasks",
@@ -117,15 +171,49 @@ class Task(Base):
 
 class TaskLog(Base):
     __tablename__ = "tasklogs"
+    __table_args__ = (
+        Index("ix_tasklogs_task_id_timestamp", "task_id", "timestamp"),
+        Index(
+            "ix_tasklogs_project_id_timestamp",
+            "project_id",
+            "timestamp",
+            "id"
+        ),
+        # Log ids double as event ids for resuming event streams, so
+        # SQLite mustn't reuse the ids of deleted rows.
+        {"sqlite_autoincrement": True},
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     task_id: Mapped[int] = mapped_column(ForeignKey("tasks.id"))
-    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
+    # The task's project, copied since tasks never move, so a project's
+    # latest entries can be read off an index without joining its tasks.
+    # NULL only for logs of tasks deleted before it was added.
+    project_id: Mapped[int | None] = mapped_column(
+        ForeignKey("projects.id")
+    )
+    user_id: Mapped[int] = mapped_column(
+        ForeignKey("users.id"),
+        index=True
+    )
     action: Mapped[str] = mapped_column(String(255), nullable=False)
+    # SQLite stores CURRENT_TIMESTAMP without microseconds; bind values
+    # in the same format so (timestamp, id) cursor comparisons are exact.
     timestamp: Mapped[datetime] = mapped_column(
-        DateTime,
-        server_default=func.now()
+        DateTime().with_variant(
+            sqlite.DATETIME(
+                storage_format=(
+                    "%(year)04d-%(month)02d-%(day)02d "
+                    "%(hour)02d:%(minute)02d:%(second)02d"
+                )
+            ),
+            "sqlite"
+        ),
+        server_default=func.now(),
+        index=True
     )
+    # As on Task
+    _sentinel: Mapped[int] = orm_insert_sentinel()
 
     task: Mapped[Task] = relationship(
         back_populates="logs",
@@ -135,3 +223,109 @@ class TaskLog(Base):
         back_populates="logs",
         foreign_keys=[user_id]
     )
+
+
+class ProjectTaskCount(Base):
+    """Number of a project's tasks in each status; see `db.stats`."""
+    __tablename__ = "project_task_counts"
+
+    project_id: Mapped[int] = mapped_column(
+        ForeignKey("projects.id"),
+        primary_key=True
+    )
+    status: Mapped[str] = mapped_column(String(30), primary_key=True)
+    count: Mapped[int] = mapped_column(nullable=False, default=0)
+
+
+class ProjectStats(Base):
+    """Per-project counters kept up to date by `db.stats` in the same
+    transaction as the changes they count."""
+    __tablename__ = "project_stats"
+
+    project_id: Mapped[int] = mapped_column(
+        ForeignKey("projects.id"),
+        primary_key=True
+    )
+    # Users with access, owner included
+    member_count: Mapped[int] = mapped_column(nullable=False, default=0)
+    last_activity_at: Mapped[datetime | None] = mapped_column(
+        DateTime,
+        nullable=True
+    )
+    # Loaded with the row, so stats are a single query
+    task_counts: Mapped[dict[str, int]] = column_property(
+        select(type_coerce(
+            func.json_group_object(
+                ProjectTaskCount.status,
+                ProjectTaskCount.count
+            ),
+            JSON
+        ))
+        .where(
+            ProjectTaskCount.project_id == project_id,
+            ProjectTaskCount.count > 0
+        )
+        .correlate_except(ProjectTaskCount)
+        .scalar_subquery()
+    )
+
+
+class RevokedToken(Base):
+    """Access tokens revoked before they expire, by their `jti` claim.
+
+    Rows can be deleted once `expires_at` has passed."""
+    __tablename__ = "revoked_tokens"
+    __table_args__ = ({"sqlite_autoincrement": True},)
+
+    # Increasing, so workers can poll for revocations they haven't seen
+    id: Mapped[int] = mapped_column(primary_key=True)
+    jti: Mapped[str] = mapped_column(String(32), nullable=False, unique=True)
+    expires_at: Mapped[datetime] = mapped_column(
+        DateTime,
+        nullable=False,
+        index=True
+    )
+
+
+class RefreshToken(Base):
+    """Single-use refresh tokens, stored as SHA-256 hashes.
+
+    Every refresh marks the token used and issues the next one in the
+    same `family`, which is the login session. Presenting a used token
+    again means it was stolen, and revokes the whole family."""
+    __tablename__ = "refresh_tokens"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    token_hash: Mapped[str] = mapped_column(
+        String(64),
+        nullable=False,
+        unique=True
+    )
+    user_id: Mapped[int] = mapped_column(
+        ForeignKey("users.id"),
+        nullable=False,
+        index=True
+    )
+    family: Mapped[str] = mapped_column(String(32), nullable=False, index=True)
+    session_started_at: Mapped[datetime] = mapped_column(
+        DateTime,
+        nullable=False
+    )
+    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    expires_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    used_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    revoked: Mapped[bool] = mapped_column(
+        Boolean,
+        nullable=False,
+        default=False
+    )
+    # The access token issued alongside, revoked with the family
+    access_jti: Mapped[str] = mapped_column(
+        String(32),
+        nullable=False,
+        index=True
+    )
+    access_expires_at: Mapped[datetime] = mapped_column(
+        DateTime,
+        nullable=False
+    )
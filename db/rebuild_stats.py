@@ -0,0 +1,19 @@
+"""Recompute `db.stats` counters from the source tables:
+
+    uv run python -m db.rebuild_stats
+"""
+import asyncio
+
+from db.session import engine, init_db
+from db.stats import rebuild_stats
+
+
+async def main():
+    await init_db()
+    async with engine.begin() as conn:
+        await conn.run_sync(rebuild_stats)
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
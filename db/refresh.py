@@ -0,0 +1,171 @@
+"""Rotating refresh tokens; see `db.models.RefreshToken`."""
+import hashlib
+import secrets
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.security import InvalidCredentials
+from core.settings import settings
+from db.models import RefreshToken, User
+from db.revocation import (
+    from_timestamp,
+    to_timestamp,
+    revoke_token,
+    utcnow
+)
+from schemas.auth import TokenData
+
+
+class RefreshTokenReused(InvalidCredentials):
+    pass
+
+
+@dataclass
+class RefreshGrant:
+    user_id: int
+    username: str
+    family: str
+    session_started_at: datetime
+
+
+def _hash(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+async def issue_refresh_token(
+    session: AsyncSession,
+    user_id: int,
+    access: TokenData,
+    family: str | None = None,
+    session_started_at: datetime | None = None
+) -> str:
+    """Store a new refresh token, starting a new session unless `family`
+    is given, and return it. `access` is the access token issued with
+    it."""
+    token = secrets.token_urlsafe(32)
+    now = utcnow()
+    await session.execute(insert(RefreshToken).values(
+        token_hash=_hash(token),
+        user_id=user_id,
+        family=family or uuid.uuid4().hex,
+        session_started_at=session_started_at or now,
+        created_at=now,
+        expires_at=now + timedelta(days=settings.refresh_token_days),
+        access_jti=access.jti,
+        access_expires_at=from_timestamp(access.exp)
+    ))
+    return token
+
+
+async def use_refresh_token(
+    session: AsyncSession,
+    token: str
+) -> RefreshGrant:
+    """Mark `token` used and return what to issue the next one for.
+
+    Claiming the token is a single conditional UPDATE, so of two
+    concurrent refreshes with the same token only one succeeds. Reuse
+    of a token that was already used revokes its session; the caller
+    must commit before raising it on."""
+    token_hash = _hash(token)
+    now = utcnow()
+    claimed = (await session.execute(
+        update(RefreshToken)
+        .where(
+            RefreshToken.token_hash == token_hash,
+            RefreshToken.used_at.is_(None),
+            RefreshToken.revoked.is_(False),
+            RefreshToken.expires_at > now
+        )
+        .values(used_at=now)
+        .returning(
+            RefreshToken.user_id,
+            RefreshToken.family,
+            RefreshToken.session_started_at
+        )
+    )).one_or_none()
+    if claimed is None:
+        reused = (await session.execute(
+            select(RefreshToken.user_id, RefreshToken.family)
+            .where(
+                RefreshToken.token_hash == token_hash,
+                RefreshToken.used_at.is_not(None),
+                RefreshToken.revoked.is_(False)
+            )
+        )).one_or_none()
+        if reused is not None:
+            await revoke_session(session, reused.user_id, reused.family)
+            raise RefreshTokenReused
+        raise InvalidCredentials
+    username = (await session.execute(
+        select(User.username).where(User.id == claimed.user_id)
+    )).scalar_one()
+    return RefreshGrant(
+        user_id=claimed.user_id,
+        username=username,
+        family=claimed.family,
+        session_started_at=claimed.session_started_at
+    )
+
+
+async def list_sessions(
+    session: AsyncSession,
+    user_id: int
+) -> list[RefreshToken]:
+    """The current refresh token of each of the user's live sessions."""
+    return list((await session.execute(
+        select(RefreshToken)
+        .where(
+            RefreshToken.user_id == user_id,
+            RefreshToken.used_at.is_(None),
+            RefreshToken.revoked.is_(False),
+            RefreshToken.expires_at > utcnow()
+        )
+        .order_by(RefreshToken.created_at.desc())
+    )).scalars().all())
+
+
+async def find_session(
+    session: AsyncSession,
+    user_id: int,
+    access_jti: str
+) -> str | None:
+    """The family of the session the access token was issued to."""
+    return (await session.execute(
+        select(RefreshToken.family)
+        .where(
+            RefreshToken.user_id == user_id,
+            RefreshToken.access_jti == access_jti
+        )
+    )).scalar_one_or_none()
+
+
+async def revoke_session(
+    session: AsyncSession,
+    user_id: int,
+    family: str
+) -> bool:
+    """Revoke a session's refresh tokens and its unexpired access tokens;
+    returns False if the user has no such session."""
+    access_tokens = (await session.execute(
+        update(RefreshToken)
+        .where(
+            RefreshToken.user_id == user_id,
+            RefreshToken.family == family,
+            RefreshToken.revoked.is_(False)
+        )
+        .values(revoked=True)
+        .returning(RefreshToken.access_jti, RefreshToken.access_expires_at)
+    )).all()
+    now = utcnow()
+    for jti, expires_at in access_tokens:
+        if expires_at > now:
+            await revoke_token(
+                session,
+                TokenData(jti=jti, exp=to_timestamp(expires_at))
+            )
+    return bool(access_tokens)
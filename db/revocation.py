@@ -0,0 +1,121 @@
+"""Persistence for `core.security.revoked_tokens`.
+
+Revocations are stored in `revoked_tokens` so they survive restarts and
+reach every worker: `RevocationSync` loads the unexpired ones at startup
+and then polls for rows added since, by id, every `interval` seconds.
+"""
+import asyncio
+import logging
+from datetime import datetime, timezone
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.security import revoked_tokens
+from core.settings import settings
+from db.models import RevokedToken, RefreshToken
+from db.session import AsyncSessionLocal
+from schemas.auth import TokenData
+
+
+logger = logging.getLogger(__name__)
+
+
+def from_timestamp(timestamp: float) -> datetime:
+    """Naive UTC datetime, as stored in the database."""
+    return datetime.fromtimestamp(timestamp, timezone.utc).replace(
+        tzinfo=None
+    )
+
+
+def to_timestamp(value: datetime) -> int:
+    return int(value.replace(tzinfo=timezone.utc).timestamp())
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+async def revoke_token(session: AsyncSession, token_data: TokenData):
+    """Revoke a token; takes effect in this worker immediately and in
+    the others once they poll, after the caller commits."""
+    if token_data.jti is None:
+        return
+    await session.execute(
+        insert(RevokedToken)
+        .values(
+            jti=token_data.jti,
+            expires_at=from_timestamp(token_data.exp)
+        )
+        .prefix_with("OR IGNORE", dialect="sqlite")
+    )
+    revoked_tokens.add(token_data.jti, token_data.exp)
+
+
+class RevocationSync:
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._last_id = 0
+        self._task: asyncio.Task | None = None
+
+    async def poll(self):
+        async with AsyncSessionLocal() as session:
+            rows = (await session.execute(
+                select(
+                    RevokedToken.id,
+                    RevokedToken.jti,
+                    RevokedToken.expires_at
+                )
+                .where(
+                    RevokedToken.id > self._last_id,
+                    RevokedToken.expires_at > utcnow()
+                )
+                .order_by(RevokedToken.id)
+            )).all()
+        for row in rows:
+            revoked_tokens.add(row.jti, to_timestamp(row.expires_at))
+            self._last_id = row.id
+
+    async def prune(self):
+        """Forget expired revocations, and expired refresh tokens along
+        with them."""
+        revoked_tokens.prune()
+        async with AsyncSessionLocal() as session:
+            for model in (RevokedToken, RefreshToken):
+                await session.execute(
+                    delete(model).where(model.expires_at <= utcnow())
+                )
+            await session.commit()
+
+    async def start(self):
+        await self.prune()
+        await self.poll()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        polls = 0
+        while True:
+            await asyncio.sleep(self.interval)
+            polls += 1
+            try:
+                await self.poll()
+                # Expired revocations are harmless, so prune rarely
+                if polls % 600 == 0:
+                    await self.prune()
+            except Exception:
+                logger.exception("Couldn't refresh revoked tokens")
+
+
+revocation_sync = RevocationSync(
+    interval=settings.token_revocation_poll_ms / 1000
+)
@@ -0,0 +1,102 @@
+"""Full-text search over task titles and descriptions.
+
+`tasks_fts` is an FTS5 index with `tasks` as its external content, kept
+in sync by triggers, so batch inserts and bulk deletes are indexed
+without the routes doing anything. SQLite only.
+"""
+import re
+
+from sqlalchemy import (
+    Connection,
+    DDL,
+    Float,
+    Select,
+    column,
+    event,
+    func,
+    literal_column,
+    select,
+    table,
+    text,
+    type_coerce
+)
+
+from db.models import Task
+
+
+task_fts = table("tasks_fts", column("rowid"))
+
+# bm25 weights for title and description: a title hit counts for more
+TITLE_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 1.0
+
+_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS tasks_fts USING fts5("
+    "title, description, content='tasks', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS tasks_fts_insert AFTER INSERT ON tasks "
+    "BEGIN "
+    "INSERT INTO tasks_fts (rowid, title, description) "
+    "VALUES (new.id, new.title, new.description); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS tasks_fts_delete AFTER DELETE ON tasks "
+    "BEGIN "
+    "INSERT INTO tasks_fts (tasks_fts, rowid, title, description) "
+    "VALUES ('delete', old.id, old.title, old.description); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS tasks_fts_update "
+    "AFTER UPDATE OF title, description ON tasks "
+    "BEGIN "
+    "INSERT INTO tasks_fts (tasks_fts, rowid, title, description) "
+    "VALUES ('delete', old.id, old.title, old.description); "
+    "INSERT INTO tasks_fts (rowid, title, description) "
+    "VALUES (new.id, new.title, new.description); "
+    "END",
+)
+
+for _statement in _DDL:
+    event.listen(
+        Task.__table__,
+        "after_create",
+        DDL(_statement).execute_if(dialect="sqlite")
+    )
+
+
+def create_task_search(conn: Connection):
+    """Create the index on an existing `tasks` table and fill it."""
+    if conn.dialect.name != "sqlite":
+        return
+    for statement in _DDL:
+        conn.execute(text(statement))
+    conn.execute(text("INSERT INTO tasks_fts (tasks_fts) VALUES ('rebuild')"))
+
+
+def match_query(q: str) -> str | None:
+    """FTS5 query matching every word of `q`, or None if it has none.
+
+    Words are quoted so that FTS5 operators and syntax in user input are
+    searched for literally instead of raising a syntax error."""
+    words = re.findall(r"\w+", q)
+    if not words:
+        return None
+    return " ".join(f'"{word}"' for word in words)
+
+
+# bm25 score of the current match; lower is more relevant
+relevance = type_coerce(
+    func.bm25(
+        literal_column(task_fts.name),
+        TITLE_WEIGHT,
+        DESCRIPTION_WEIGHT
+    ),
+    Float
+)
+
+
+def search_tasks(match: str) -> Select:
+    return (
+        select(Task)
+        .select_from(task_fts)
+        .join(Task, Task.id == task_fts.c.rowid)
+        .where(literal_column(task_fts.name).match(match))
+    )
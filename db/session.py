@@ -1,20 +1,147 @@
 from collections.abc import AsyncGenerator
+from typing import Any
+
+from sqlalchemy import URL, event, make_url
+from sqlalchemy.orm import Session
 from sqlalchemy.ext.asyncio import (
     create_async_engine,
     async_sessionmaker,
+    AsyncEngine,
     AsyncSession
 )
 
+from core.cache import TTLCache
 from core.settings import settings
-from db.base import Base
+from db.migrations import migrate
 
 
-engine = create_async_engine(
-    settings.database_url,
-    echo=settings.sqlalchemy_echo
-)
+def sqlite_pragmas() -> dict[str, Any]:
+    """Pragmas run on every new SQLite connection.
+
+    WAL lets readers proceed while a write is in flight, and busy_timeout
+    makes a second writer wait for the lock instead of failing at once
+    with "database is locked". synchronous=NORMAL is durable across
+    application crashes in WAL mode; only a power loss can undo the most
+    recent commits."""
+    return {
+        "journal_mode": settings.sqlite_journal_mode,
+        "synchronous": settings.sqlite_synchronous,
+        "busy_timeout": settings.sqlite_busy_timeout_ms,
+        "cache_size": settings.sqlite_cache_size,
+        "mmap_size": settings.sqlite_mmap_size,
+    }
+
+
+def _in_memory(url: str | URL) -> bool:
+    return make_url(url).database in (None, "", ":memory:")
+
+
+def make_engine(
+    url: str | URL,
+    pragmas: dict[str, Any] | None = None,
+    **kwargs: Any
+) -> AsyncEngine:
+    """Engine for `url` with the pool settings from `settings`.
+
+    For SQLite, `pragmas` defaults to `sqlite_pragmas()`; pass an empty
+    dict to leave SQLite's own defaults in place."""
+    options: dict[str, Any] = {
+        "echo": settings.sqlalchemy_echo,
+        "pool_pre_ping": settings.db_pool_pre_ping,
+        "pool_recycle": settings.db_pool_recycle,
+    }
+    # In-memory SQLite uses a single shared connection, not a sized pool
+    if not _in_memory(url):
+        options |= {
+            "pool_size": settings.db_pool_size,
+            "max_overflow": settings.db_max_overflow,
+            "pool_timeout": settings.db_pool_timeout,
+        }
+    new_engine = create_async_engine(url, **(options | kwargs))
+    if new_engine.dialect.name == "sqlite":
+        if pragmas is None:
+            pragmas = sqlite_pragmas()
+
+        @event.listens_for(new_engine.sync_engine, "connect")
+        def set_pragmas(dbapi_connection, _connection_record):
+            cursor = dbapi_connection.cursor()
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+            cursor.close()
+
+    return new_engine
+
+
+def read_only_sqlite_url(url: str | URL) -> URL:
+    """`url` opened through a read-only SQLite URI filename."""
+    url = make_url(url)
+    return url.set(
+        database=f"file:{url.database}",
+        query={"mode": "ro", "uri": "true"}
+    )
+
+
+def make_read_engine() -> AsyncEngine | None:
+    """Engine for read-only sessions, or None to read from the primary.
+
+    Uses DATABASE_READ_URL if set. Otherwise a file SQLite database gets
+    a second, read-only pool on the same file: in WAL mode its readers
+    never wait for writers and always see committed data."""
+    if settings.database_read_url:
+        return make_engine(settings.database_read_url)
+    url = make_url(settings.database_url)
+    if url.get_backend_name() != "sqlite" or _in_memory(url):
+        return None
+    # journal_mode is a write, and the primary has already set it
+    pragmas = sqlite_pragmas()
+    del pragmas["journal_mode"]
+    return make_engine(read_only_sqlite_url(url), pragmas)
+
+
+# SQLite's own default, 2000 KiB
+EXPORT_SQLITE_CACHE_SIZE = -2000
+
+
+def make_export_engine() -> AsyncEngine | None:
+    """Engine for streaming exports, or None to export from the primary.
+
+    An export reads a whole project once. For a file SQLite database it
+    gets a read-only pool on the same file without the memory map and
+    with SQLite's default page cache, since either would keep every page
+    the export read in the process's RSS."""
+    url = make_url(settings.database_url)
+    if url.get_backend_name() != "sqlite" or _in_memory(url):
+        return None
+    pragmas = sqlite_pragmas() | {
+        "cache_size": EXPORT_SQLITE_CACHE_SIZE,
+        "mmap_size": 0,
+    }
+    del pragmas["journal_mode"]
+    return make_engine(read_only_sqlite_url(url), pragmas)
+
+
+engine = make_engine(settings.database_url)
+read_engine = make_read_engine()
+export_engine = make_export_engine()
 
 AsyncSessionLocal = async_sessionmaker(bind=engine)
+AsyncReadSessionLocal = async_sessionmaker(bind=read_engine or engine)
+ExportSessionLocal = async_sessionmaker(bind=export_engine or engine)
+
+# Users who committed within the last `read_replica_lag_seconds`; their
+# reads go to the primary so they see their own writes
+RECENT_WRITERS = 10_000
+recent_writers: TTLCache[int, bool] = TTLCache(
+    maxsize=RECENT_WRITERS,
+    ttl=settings.read_replica_lag_seconds
+)
+
+
+@event.listens_for(Session, "after_commit")
+def _remember_writer(session: Session):
+    user_id = session.info.get("user_id")
+    if user_id is not None and read_engine is not None:
+        recent_writers.set(user_id, True)
 
 
 async def get_db() -> AsyncGenerator[AsyncSession]:
@@ -22,6 +149,12 @@ async def get_db() -> AsyncGenerator[AsyncSession]:
         yield session
 
 
+async def get_read_db() -> AsyncGenerator[AsyncSession]:
+    """Session for reads that may trail the primary by the replica lag."""
+    async with AsyncReadSessionLocal() as session:
+        yield session
+
+
 async def init_db():
     async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(migrate)
@@ -0,0 +1,117 @@
+"""Per-project task counts, member counts and last activity.
+
+Routes that change tasks or members update `project_stats` and
+`project_task_counts` in the same transaction, so reading a project's
+stats never touches its tasks. If the counters drift anyway, e.g. after
+editing the database by hand, `db.rebuild_stats` rebuilds them from the
+source tables.
+"""
+from collections import Counter
+from collections.abc import Iterable
+
+from sqlalchemy import (
+    Connection,
+    delete,
+    func,
+    insert,
+    select,
+    update
+)
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.models import (
+    ProjectAccess,
+    ProjectStats,
+    ProjectTaskCount,
+    Project,
+    Task,
+    TaskLog
+)
+
+
+type TaskCountDeltas = Counter[tuple[int, str]]
+
+
+async def init_project_stats(session: AsyncSession, project_id: int):
+    """Stats for a new project, whose only member is its owner."""
+    await session.execute(insert(ProjectStats).values(
+        project_id=project_id,
+        member_count=1,
+        last_activity_at=func.now()
+    ))
+
+
+async def adjust_task_counts(session: AsyncSession, deltas: TaskCountDeltas):
+    """Add `deltas`, by (project_id, status), to the task counts."""
+    for (project_id, status), delta in deltas.items():
+        if not delta:
+            continue
+        result = await session.execute(
+            update(ProjectTaskCount)
+            .where(
+                ProjectTaskCount.project_id == project_id,
+                ProjectTaskCount.status == status
+            )
+            .values(count=ProjectTaskCount.count + delta)
+        )
+        if result.rowcount == 0:
+            await session.execute(insert(ProjectTaskCount).values(
+                project_id=project_id,
+                status=status,
+                count=delta
+            ))
+
+
+async def touch_projects(session: AsyncSession, project_ids: Iterable[int]):
+    project_ids = set(project_ids)
+    if project_ids:
+        await session.execute(
+            update(ProjectStats)
+            .where(ProjectStats.project_id.in_(project_ids))
+            .values(last_activity_at=func.now())
+        )
+
+
+def _member_count(project_id_column):
+    return (
+        select(func.count())
+        .where(ProjectAccess.project_id == project_id_column)
+        .scalar_subquery()
+    )
+
+
+async def refresh_member_count(session: AsyncSession, project_id: int):
+    await session.execute(
+        update(ProjectStats)
+        .where(ProjectStats.project_id == project_id)
+        .values(member_count=_member_count(ProjectStats.project_id))
+    )
+
+
+async def drop_project_stats(session: AsyncSession, project_id: int):
+    for model in (ProjectTaskCount, ProjectStats):
+        await session.execute(
+            delete(model).where(model.project_id == project_id)
+        )
+
+
+def rebuild_stats(conn: Connection):
+    """Recompute every project's stats from its tasks, task logs and
+    access rows."""
+    conn.execute(delete(ProjectTaskCount))
+    conn.execute(delete(ProjectStats))
+    last_log = (
+        select(func.max(TaskLog.timestamp))
+        .join(Task, Task.id == TaskLog.task_id)
+        .where(Task.project_id == Project.id)
+        .scalar_subquery()
+    )
+    conn.execute(insert(ProjectStats).from_select(
+        ["project_id", "member_count", "last_activity_at"],
+        select(Project.id, _member_count(Project.id), last_log)
+    ))
+    conn.execute(insert(ProjectTaskCount).from_select(
+        ["project_id", "status", "count"],
+        select(Task.project_id, Task.status, func.count())
+        .group_by(Task.project_id, Task.status)
+    ))
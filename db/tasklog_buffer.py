@@ -0,0 +1,253 @@
+import asyncio
+import logging
+from collections import deque
+from dataclasses import replace
+from datetime import datetime, timezone
+from typing import Any
+
+from sqlalchemy import event, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, SessionTransaction
+
+from core.events import Event, event_bus
+from core.settings import settings
+from db.models import Task, TaskLog
+from db.session import AsyncSessionLocal
+
+
+logger = logging.getLogger(__name__)
+
+# Session.info key for entries waiting on the session's commit
+PENDING_KEY = "tasklog_entries"
+# Entry key for the event to publish, with the entry's id, once written
+EVENT_KEY = "event"
+# Times a failed batch is retried, with the delay doubling each time,
+# before its entries are written one at a time
+FLUSH_ATTEMPTS = 3
+RETRY_DELAY_SECONDS = 0.1
+
+
+def tasklog_entry(user_id: int, task: Task, action: str) -> dict[str, Any]:
+    return {
+        "user_id": user_id,
+        "task_id": task.id,
+        "project_id": task.project_id,
+        "action": action,
+        # Stamped now rather than at insert time, which may be later
+        "timestamp": datetime.now(timezone.utc).replace(tzinfo=None),
+    }
+
+
+class TaskLogBuffer:
+    """Write-behind queue for TaskLog rows.
+
+    Entries are inserted by a background task in batches of `batch_size`,
+    at least every `interval` seconds. While the buffer isn't running, or
+    is full, `submit` returns False and the caller writes the entries
+    itself. Without `sync_fallback`, a caller that has no transaction
+    open waits for the background task to make room instead; one that
+    has may hold the SQLite write lock, which would block that task.
+
+    A batch that fails to insert goes back to the head of the queue and
+    is retried; after FLUSH_ATTEMPTS its entries are inserted one at a
+    time, so a bad entry only loses itself.
+
+    Submitted entries are held on the caller's session and only join the
+    queue once it commits, so a rolled back request leaves no log rows.
+    Their room in the queue is reserved up front. Events submitted with
+    them are published once they are written, as only then do they have
+    the ids clients resume from."""
+
+    def __init__(
+        self,
+        maxsize: int,
+        batch_size: int,
+        interval: float,
+        sync_fallback: bool
+    ):
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.interval = interval
+        self.sync_fallback = sync_fallback
+        self._pending: deque[dict[str, Any]] = deque()
+        self._reserved = 0
+        self._wakeup = asyncio.Event()
+        self._room = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self._task: asyncio.Task | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the background task and write out everything pending."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        await self.flush()
+
+    async def submit(
+        self,
+        session: AsyncSession,
+        entries: list[dict[str, Any]],
+        events: list[Event | None] | None = None
+    ) -> bool:
+        if self._task is None:
+            return False
+        count = len(entries)
+        if not self._has_room(count):
+            if self.sync_fallback or session.in_transaction():
+                return False
+            await self._wait_for_room(count)
+            if not self._has_room(count):
+                return False
+        if not session.in_transaction():
+            # Otherwise closing the session unused wouldn't release them
+            await session.begin()
+        if events is not None:
+            entries = [
+                entry if event is None else entry | {EVENT_KEY: event}
+                for entry, event in zip(entries, events)
+            ]
+        self._reserved += count
+        session.info.setdefault(PENDING_KEY, []).extend(entries)
+        return True
+
+    def _has_room(self, count: int) -> bool:
+        return len(self._pending) + self._reserved + count <= self.maxsize
+
+    async def _wait_for_room(self, count: int):
+        while self._task is not None and count <= self.maxsize:
+            self._room.clear()
+            if self._has_room(count):
+                return
+            self._wakeup.set()
+            await self._room.wait()
+
+    def _put(self, entries: list[dict[str, Any]]):
+        self._reserved -= len(entries)
+        self._pending.extend(entries)
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    def _release(self, entries: list[dict[str, Any]]):
+        self._reserved -= len(entries)
+        self._room.set()
+
+    async def flush(self):
+        async with self._lock:
+            attempts = 0
+            while self._pending:
+                batch = [
+                    self._pending.popleft()
+                    for _ in range(min(self.batch_size, len(self._pending)))
+                ]
+                try:
+                    log_ids = await self._insert(batch)
+                except Exception:
+                    attempts += 1
+                    if attempts < FLUSH_ATTEMPTS:
+                        logger.warning(
+                            "Couldn't write %d task log entries, retrying",
+                            len(batch),
+                            exc_info=True
+                        )
+                        self._pending.extendleft(reversed(batch))
+                        await asyncio.sleep(
+                            RETRY_DELAY_SECONDS * 2 ** (attempts - 1)
+                        )
+                        continue
+                    await self._insert_each(batch)
+                else:
+                    await self._publish(batch, log_ids)
+                attempts = 0
+                self._room.set()
+
+    async def _insert(self, entries: list[dict[str, Any]]) -> list[int]:
+        rows = [
+            {key: value for key, value in entry.items() if key != EVENT_KEY}
+            for entry in entries
+        ]
+        async with AsyncSessionLocal() as session:
+            log_ids = (await session.execute(
+                insert(TaskLog).returning(
+                    TaskLog.id,
+                    sort_by_parameter_order=True
+                ),
+                rows
+            )).scalars().all()
+            await session.commit()
+        return list(log_ids)
+
+    async def _insert_each(self, entries: list[dict[str, Any]]):
+        for entry in entries:
+            try:
+                log_ids = await self._insert([entry])
+            except Exception:
+                logger.exception("Dropped task log entry %r", entry)
+            else:
+                await self._publish([entry], log_ids)
+
+    async def _publish(
+        self,
+        entries: list[dict[str, Any]],
+        log_ids: list[int]
+    ):
+        # The entries are written, so a failure here mustn't retry them
+        for entry, log_id in zip(entries, log_ids):
+            event = entry.get(EVENT_KEY)
+            if event is None:
+                continue
+            try:
+                await event_bus.publish(replace(event, id=log_id))
+            except Exception:
+                logger.exception("Couldn't publish task log event")
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except TimeoutError:
+                pass
+            self._wakeup.clear()
+            # A flush cut short by stop() could lose the batch it holds;
+            # stop() waits for it through the lock instead
+            await asyncio.shield(self.flush())
+
+
+tasklog_buffer = TaskLogBuffer(
+    maxsize=settings.tasklog_buffer_size,
+    batch_size=settings.tasklog_flush_batch,
+    interval=settings.tasklog_flush_ms / 1000,
+    sync_fallback=settings.tasklog_sync_fallback
+)
+
+
+@event.listens_for(Session, "after_commit")
+def _queue_committed(session: Session):
+    entries = session.info.pop(PENDING_KEY, None)
+    if entries:
+        tasklog_buffer._put(entries)
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _drop_uncommitted(session: Session, transaction: SessionTransaction):
+    # Anything left once the outermost transaction ends was rolled back
+    if transaction.parent is not None:
+        return
+    entries = session.info.pop(PENDING_KEY, None)
+    if entries:
+        tasklog_buffer._release(entries)
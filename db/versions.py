@@ -0,0 +1,37 @@
+from collections.abc import Iterable, Sequence
+
+from sqlalchemy import Row, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.models import Project, Task
+from db.stats import touch_projects
+
+
+async def bump_project_versions(
+    session: AsyncSession,
+    project_ids: Iterable[int]
+) -> Sequence[Row]:
+    """Mark the projects changed: bumps their version, which their
+    ETags are built from, and their last activity time. Returns their
+    new id, title and version."""
+    project_ids = set(project_ids)
+    if not project_ids:
+        return []
+    projects = (await session.execute(
+        update(Project)
+        .where(Project.id.in_(project_ids))
+        .values(version=Project.version + 1)
+        .returning(Project.id, Project.title, Project.version)
+    )).all()
+    await touch_projects(session, project_ids)
+    return projects
+
+
+async def bump_task_versions(session: AsyncSession, task_ids: Iterable[int]):
+    task_ids = set(task_ids)
+    if task_ids:
+        await session.execute(
+            update(Task)
+            .where(Task.id.in_(task_ids))
+            .values(version=Task.version + 1)
+        )
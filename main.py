@@ -3,19 +3,45 @@ from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
-from db.session import init_db, engine
-from api.routes import auth, project, task
+from core.security import hasher_pool
+from core.settings import settings
+from db.session import init_db, engine, read_engine, export_engine
+from db.tasklog_buffer import tasklog_buffer
+from db.revocation import revocation_sync
+from core.events import event_bus
+from core.metrics import metrics_store
+from api.responses import FastJSONResponse
+from api.metrics import MetricsMiddleware
+from api.timing import ServerTimingMiddleware, instrument_engine
+from api.routes import auth, project, task, events, metrics, dashboard
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     await init_db()
+    await revocation_sync.start()
+    if settings.tasklog_write_behind:
+        tasklog_buffer.start()
+    await event_bus.start()
+    if settings.metrics and metrics_store:
+        await metrics_store.start()
     yield
+    if metrics_store:
+        await metrics_store.stop()
+    # Publishes the events of the last buffered task logs
+    await tasklog_buffer.stop()
+    await event_bus.stop()
+    await revocation_sync.stop()
     if engine:
         await engine.dispose()
+    if read_engine:
+        await read_engine.dispose()
+    if export_engine:
+        await export_engine.dispose()
+    hasher_pool.shutdown()
 
 
-app = FastAPI()
+app = FastAPI(default_response_class=FastJSONResponse)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -25,6 +51,19 @@ app.add_middleware(
 )
 app.router.lifespan_context = lifespan
 
+if settings.server_timing:
+    app.add_middleware(ServerTimingMiddleware)
+    for instrumented in (engine, read_engine, export_engine):
+        if instrumented is not None:
+            instrument_engine(instrumented)
+
+if settings.metrics:
+    app.add_middleware(MetricsMiddleware)
+
 app.include_router(auth.router)
 app.include_router(project.router)
 app.include_router(task.router)
+app.include_router(events.router)
+app.include_router(dashboard.router)
+if settings.metrics:
+    app.include_router(metrics.router)
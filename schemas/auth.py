@@ -1,10 +1,35 @@
-from pydantic import BaseModel
+from datetime import datetime
+
+from pydantic import BaseModel, Field
 
 
 class Token(BaseModel):
     access_token: str
     token_type: str
+    expires_in: int | None = None
+    refresh_token: str | None = None
 
 
 class TokenData(BaseModel):
     username: str | None = None
+    jti: str | None = None
+    # Expiry as a Unix timestamp, as in the token's `exp` claim
+    exp: int = 0
+
+
+class Principal(BaseModel):
+    id: int
+    username: str
+
+    class Config:
+        frozen = True
+
+
+class SessionRead(BaseModel):
+    id: str = Field(validation_alias="family")
+    started_at: datetime = Field(validation_alias="session_started_at")
+    refreshed_at: datetime = Field(validation_alias="created_at")
+    expires_at: datetime
+
+    class Config:
+        from_attributes = True
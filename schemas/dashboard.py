@@ -0,0 +1,20 @@
+from datetime import datetime
+
+from pydantic import BaseModel
+
+from schemas.project import ProjectReadSimple
+from schemas.tasklog import TaskLogRead
+from schemas.user import UserReadSimple
+
+
+class DashboardProject(ProjectReadSimple):
+    is_owner: bool
+    task_counts: dict[str, int]
+    member_count: int
+    last_activity_at: datetime | None
+
+
+class Dashboard(BaseModel):
+    user: UserReadSimple
+    projects: list[DashboardProject]
+    recent_logs: list[TaskLogRead]
@@ -1,4 +1,9 @@
-from pydantic import BaseModel
+from datetime import datetime
+
+from pydantic import BaseModel, Field
+
+
+MAX_MEMBER_BATCH_SIZE = 500
 
 
 class ProjectBase(BaseModel):
@@ -11,6 +16,7 @@ class ProjectCreate(ProjectBase):
 
 class ProjectReadSimple(ProjectBase):
     id: int
+    version: int
 
     class Config:
         from_attributes = True
@@ -19,12 +25,39 @@ class ProjectReadSimple(ProjectBase):
 class ProjectRead(ProjectReadSimple):
     owner: "UserReadSimple"
     users: list["UserReadSimple"]
-    tasks: list["TaskReadSimple"]
 
 
 class ProjectUpdate(BaseModel):
     title: str | None = None
 
 
+class ProjectMemberBatch(BaseModel):
+    usernames: list[str] = Field(
+        min_length=1,
+        max_length=MAX_MEMBER_BATCH_SIZE
+    )
+
+
+class ProjectMembersAdded(BaseModel):
+    added: list[str]
+    already_members: list[str]
+    unknown: list[str]
+
+
+class ProjectMembersRemoved(BaseModel):
+    removed: list[str]
+    not_members: list[str]
+    unknown: list[str]
+
+
+class ProjectStatsRead(BaseModel):
+    project_id: int
+    task_counts: dict[str, int]
+    member_count: int
+    last_activity_at: datetime | None
+
+    class Config:
+        from_attributes = True
+
+
 from schemas.user import UserReadSimple  # noqa
-from schemas.task import TaskReadSimple  # noqa
@@ -1,4 +1,7 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+
+
+MAX_BATCH_SIZE = 500
 
 
 class TaskBase(BaseModel):
@@ -13,6 +16,7 @@ class TaskCreate(TaskBase):
 
 class TaskReadSimple(TaskBase):
     id: int
+    version: int
 
     class Config:
         from_attributes = True
@@ -20,7 +24,6 @@ class TaskReadSimple(TaskBase):
 
 class TaskRead(TaskReadSimple):
     project: "ProjectReadSimple"
-    logs: list["TaskLogRead"]
 
 
 class TaskUpdate(BaseModel):
@@ -29,5 +32,34 @@ class TaskUpdate(BaseModel):
     status: str | None = None
 
 
+class TaskBatchCreate(BaseModel):
+    tasks: list[TaskBase] = Field(min_length=1, max_length=MAX_BATCH_SIZE)
+
+
+class TaskBatchUpdateItem(TaskUpdate):
+    id: int
+
+
+class TaskBatchUpdate(BaseModel):
+    tasks: list[TaskBatchUpdateItem] = Field(
+        min_length=1,
+        max_length=MAX_BATCH_SIZE
+    )
+
+
+class TaskBatchDelete(BaseModel):
+    ids: list[int] = Field(min_length=1, max_length=MAX_BATCH_SIZE)
+
+
+class TaskBatchItemResult(BaseModel):
+    id: int | None = None
+    status: int
+    task: TaskReadSimple | None = None
+    detail: str | None = None
+
+
+class TaskBatchResult(BaseModel):
+    results: list[TaskBatchItemResult]
+
+
 from schemas.project import ProjectReadSimple  # noqa
-from schemas.tasklog import TaskLogRead  # noqa
@@ -10,6 +10,9 @@ class TaskLogRead(BaseModel):
     action: str
     timestamp: datetime
 
+    class Config:
+        from_attributes = True
+
 
 from schemas.task import TaskReadSimple  # noqa
 from schemas.user import UserReadSimple  # noqa
@@ -0,0 +1,93 @@
+import unittest
+
+from bench.common import client, register, login
+
+
+class ConditionalUpdateTest(unittest.IsolatedAsyncioTestCase):
+    """PATCH responses are built from the UPDATE's RETURNING row."""
+
+    async def asyncSetUp(self):
+        self._client = client()
+        self.c = await self._client.__aenter__()
+        username = self._testMethodName
+        await register(self.c, username, "password")
+        self.headers = await login(self.c, username, "password")
+        r = await self.c.post(
+            "/project/",
+            json={"title": "patch"},
+            headers=self.headers
+        )
+        self.project_id = r.json()["id"]
+
+    async def asyncTearDown(self):
+        await self._client.__aexit__(None, None, None)
+
+    async def test_task(self):
+        r = await self.c.post(
+            f"/project/{self.project_id}",
+            json={"title": "task", "status": "open"},
+            headers=self.headers
+        )
+        task_id = r.json()["id"]
+        r = await self.c.get(f"/task/{task_id}", headers=self.headers)
+        etag = r.headers["ETag"]
+        r = await self.c.patch(
+            f"/task/{task_id}",
+            json={"status": "done"},
+            headers=self.headers | {"If-Match": etag}
+        )
+        self.assertEqual(r.status_code, 200)
+        task = r.json()
+        self.assertEqual(task["status"], "done")
+        self.assertEqual(task["version"], 2)
+        self.assertEqual(task["project"]["id"], self.project_id)
+        self.assertNotEqual(r.headers["ETag"], etag)
+        r = await self.c.get(f"/task/{task_id}", headers=self.headers)
+        self.assertEqual(r.json()["project"], task["project"])
+        r = await self.c.patch(
+            f"/task/{task_id}",
+            json={"title": "stale"},
+            headers=self.headers | {"If-Match": etag}
+        )
+        self.assertEqual(r.status_code, 412)
+        r = await self.c.get(
+            f"/project/{self.project_id}/stats",
+            headers=self.headers
+        )
+        self.assertEqual(r.json()["task_counts"], {"done": 1})
+
+    async def test_project(self):
+        r = await self.c.get(
+            f"/project/{self.project_id}",
+            headers=self.headers
+        )
+        etag = r.headers["ETag"]
+        before = r.json()
+        r = await self.c.patch(
+            f"/project/{self.project_id}",
+            json={"title": "renamed"},
+            headers=self.headers | {"If-Match": etag}
+        )
+        self.assertEqual(r.status_code, 200)
+        project = r.json()
+        self.assertEqual(project["title"], "renamed")
+        self.assertEqual(project["version"], before["version"] + 1)
+        self.assertEqual(project["owner"], before["owner"])
+        self.assertEqual(project["users"], before["users"])
+        r = await self.c.patch(
+            f"/project/{self.project_id}",
+            json={"title": "stale"},
+            headers=self.headers | {"If-Match": etag}
+        )
+        self.assertEqual(r.status_code, 412)
+        # Setting the current title changes nothing
+        r = await self.c.patch(
+            f"/project/{self.project_id}",
+            json={"title": "renamed"},
+            headers=self.headers
+        )
+        self.assertEqual(r.json()["version"], project["version"])
+
+
+if __name__ == "__main__":
+    unittest.main()
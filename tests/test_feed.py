@@ -0,0 +1,48 @@
+import unittest
+from unittest import mock
+
+from bench.common import client, register, login
+from api import feed
+from db.tasklog_buffer import tasklog_buffer
+
+
+class ReplayTest(unittest.IsolatedAsyncioTestCase):
+    async def test_replays_past_the_limit(self):
+        async with client() as c:
+            await register(c, "replay", "password")
+            headers = await login(c, "replay", "password")
+            r = await c.post(
+                "/project/",
+                json={"title": "replay"},
+                headers=headers
+            )
+            project_id = r.json()["id"]
+            r = await c.post(
+                f"/project/{project_id}/tasks:batch",
+                json={"tasks": [
+                    {"title": f"task {i}", "status": "open"}
+                    for i in range(5)
+                ]},
+                headers=headers
+            )
+            self.assertEqual(r.status_code, 200)
+            user_id = (await c.get("/auth/me", headers=headers)).json()["id"]
+            await tasklog_buffer.flush()
+
+            titles = []
+            with (
+                mock.patch.object(feed, "REPLAY_LIMIT", 2),
+                mock.patch.object(feed, "KEEPALIVE_SECONDS", 0.01)
+            ):
+                events = feed.project_events(project_id, user_id, 0)
+                async for event in events:
+                    # Replay is over once the live stream idles
+                    if event is None:
+                        break
+                    titles.append(event.data["task"]["title"])
+                await events.aclose()
+            self.assertEqual(titles, [f"task {i}" for i in range(5)])
+
+
+if __name__ == "__main__":
+    unittest.main()
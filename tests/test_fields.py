@@ -0,0 +1,45 @@
+import unittest
+
+from bench.common import client, register, login
+from schemas.project import ProjectRead
+from schemas.task import TaskRead
+from schemas.user import UserRead
+
+
+class DefaultRepresentationTest(unittest.IsolatedAsyncioTestCase):
+    """Without `fields` or `expand`, reads return exactly the schema
+    their route declares, which is all OpenAPI documents."""
+
+    def assert_matches(self, schema, body):
+        schema.model_validate(body)
+        self.assertEqual(set(body), set(schema.model_fields))
+
+    async def test_default_representations(self):
+        async with client() as c:
+            await register(c, "fields", "password")
+            headers = await login(c, "fields", "password")
+            r = await c.post(
+                "/project/",
+                json={"title": "fields"},
+                headers=headers
+            )
+            project_id = r.json()["id"]
+            r = await c.post(
+                f"/project/{project_id}",
+                json={"title": "task", "status": "open"},
+                headers=headers
+            )
+            task_id = r.json()["id"]
+            for path, schema in (
+                (f"/task/{task_id}", TaskRead),
+                (f"/project/{project_id}", ProjectRead),
+                ("/auth/me", UserRead),
+            ):
+                with self.subTest(path=path):
+                    r = await c.get(path, headers=headers)
+                    self.assertEqual(r.status_code, 200)
+                    self.assert_matches(schema, r.json())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+import base64
+import unittest
+
+from fastapi import HTTPException
+
+from api.pagination import decode_cursor, encode_cursor
+from bench.common import client, register, login
+from db.models import Task, TaskLog
+
+
+def cursor(payload: str) -> str:
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+class DecodeCursorTest(unittest.TestCase):
+    def assert_invalid(self, value: str, keys=(Task.id,)):
+        with self.assertRaises(HTTPException) as raised:
+            decode_cursor(value, keys)
+        self.assertEqual(raised.exception.status_code, 400)
+
+    def test_round_trip(self):
+        keys = (TaskLog.timestamp, TaskLog.id)
+        values = decode_cursor(encode_cursor(["2026-01-02T03:04:05", 7]), keys)
+        self.assertEqual(encode_cursor(values), encode_cursor(
+            ["2026-01-02T03:04:05", 7]
+        ))
+
+    def test_tampered(self):
+        for payload in (
+            "[1e300]",
+            "[1.5]",
+            "[true]",
+            "[null]",
+            '["1"]',
+            f"[{2 ** 63}]",
+            "[1, 2]",
+            "{}",
+            "[" * 100_000,
+        ):
+            with self.subTest(payload=payload[:20]):
+                self.assert_invalid(cursor(payload))
+        self.assert_invalid("not base64!")
+        self.assert_invalid(cursor('[1, 2]'), (TaskLog.timestamp, TaskLog.id))
+        self.assert_invalid(cursor('[5, 2]'), (TaskLog.timestamp, TaskLog.id))
+
+
+class TamperedCursorRouteTest(unittest.IsolatedAsyncioTestCase):
+    async def test_bad_request(self):
+        async with client() as c:
+            await register(c, "cursor", "password")
+            headers = await login(c, "cursor", "password")
+            for payload in ("[1e300]", f"[{2 ** 64}]", "[1.5]"):
+                r = await c.get(
+                    "/project/",
+                    params={"cursor": cursor(payload)},
+                    headers=headers
+                )
+                self.assertEqual(r.status_code, 400, payload)
+
+
+class SortTest(unittest.IsolatedAsyncioTestCase):
+    async def test_title_sort_needs_project(self):
+        async with client() as c:
+            await register(c, "sort", "password")
+            headers = await login(c, "sort", "password")
+            r = await c.post(
+                "/project/",
+                json={"title": "sort"},
+                headers=headers
+            )
+            project_id = r.json()["id"]
+            for title in ("b", "c", "a"):
+                await c.post(
+                    f"/project/{project_id}",
+                    json={"title": title, "status": "open"},
+                    headers=headers
+                )
+            r = await c.get("/task/", params={"sort": "title"}, headers=headers)
+            self.assertEqual(r.status_code, 422)
+            r = await c.get(
+                "/task/",
+                params={"sort": "-title", "project_id": project_id, "limit": 2},
+                headers=headers
+            )
+            self.assertEqual(r.status_code, 200)
+            self.assertEqual([t["title"] for t in r.json()["items"]], ["c", "b"])
+            r = await c.get(
+                "/task/",
+                params={
+                    "sort": "-title",
+                    "project_id": project_id,
+                    "cursor": r.json()["next_cursor"]
+                },
+                headers=headers
+            )
+            self.assertEqual([t["title"] for t in r.json()["items"]], ["a"])
+
+
+if __name__ == "__main__":
+    unittest.main()
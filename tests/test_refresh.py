@@ -0,0 +1,34 @@
+import unittest
+
+from bench.common import client, register
+
+
+class LogoutTest(unittest.IsolatedAsyncioTestCase):
+    async def test_refresh_after_logout(self):
+        async with client() as c:
+            await register(c, "logout", "password")
+            r = await c.post(
+                "/auth/token",
+                data={"username": "logout", "password": "password"}
+            )
+            r.raise_for_status()
+            tokens = r.json()
+            r = await c.post(
+                "/auth/logout",
+                headers={
+                    "Authorization": f"Bearer {tokens['access_token']}"
+                }
+            )
+            self.assertEqual(r.status_code, 204)
+            r = await c.post(
+                "/auth/token",
+                data={
+                    "grant_type": "refresh_token",
+                    "refresh_token": tokens["refresh_token"]
+                }
+            )
+            self.assertEqual(r.status_code, 401)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+import unittest
+
+from sqlalchemy import event
+
+from bench.common import client, register, login
+from db.session import engine
+
+
+class StatementCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, *args):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(engine.sync_engine, "before_cursor_execute", self)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(engine.sync_engine, "before_cursor_execute", self)
+
+
+class BatchStatementsTest(unittest.IsolatedAsyncioTestCase):
+    """Batch routes run a fixed number of statements however many tasks
+    they are given."""
+
+    async def asyncSetUp(self):
+        self._client = client()
+        self.c = await self._client.__aenter__()
+        await register(self.c, "batch", "password")
+        self.headers = await login(self.c, "batch", "password")
+        r = await self.c.post(
+            "/project/",
+            json={"title": "batch"},
+            headers=self.headers
+        )
+        self.project_id = r.json()["id"]
+
+    async def asyncTearDown(self):
+        await self._client.__aexit__(None, None, None)
+
+    async def create(self, count: int) -> tuple[int, list[int]]:
+        with StatementCounter() as counter:
+            r = await self.c.post(
+                f"/project/{self.project_id}/tasks:batch",
+                json={"tasks": [
+                    {"title": f"task {i}", "status": "open"}
+                    for i in range(count)
+                ]},
+                headers=self.headers
+            )
+        self.assertEqual(r.status_code, 200)
+        results = r.json()["results"]
+        self.assertEqual(
+            [result["task"]["title"] for result in results],
+            [f"task {i}" for i in range(count)]
+        )
+        return counter.count, [result["id"] for result in results]
+
+    async def update(self, ids: list[int]) -> int:
+        with StatementCounter() as counter:
+            r = await self.c.patch(
+                "/task:batch",
+                json={"tasks": [
+                    {"id": task_id, "status": "done"} for task_id in ids
+                ]},
+                headers=self.headers
+            )
+        self.assertEqual(r.status_code, 200)
+        return counter.count
+
+    async def test_create_and_update(self):
+        # The first batch in each status also inserts its count row
+        _, ids = await self.create(1)
+        await self.update(ids)
+        small, small_ids = await self.create(2)
+        large, large_ids = await self.create(500)
+        self.assertEqual(small, large)
+        self.assertEqual(
+            await self.update(small_ids),
+            await self.update(large_ids)
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
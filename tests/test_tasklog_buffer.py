@@ -0,0 +1,150 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from sqlalchemy import func, select, update
+
+from bench.common import client, register, login
+from api.deps import log_task_modification
+from core.events import event_bus
+from db.models import Task, TaskLog
+from db.session import AsyncSessionLocal
+from db.tasklog_buffer import tasklog_buffer, tasklog_entry
+
+
+class TaskLogBufferTest(unittest.IsolatedAsyncioTestCase):
+    """Buffered entries only reach the queue once their session commits."""
+
+    async def asyncSetUp(self):
+        self._client = client()
+        c = await self._client.__aenter__()
+        # The database is shared by the tests in this module
+        username = self._testMethodName
+        await register(c, username, "password")
+        headers = await login(c, username, "password")
+        r = await c.post(
+            "/project/",
+            json={"title": "buffer"},
+            headers=headers
+        )
+        project_id = r.json()["id"]
+        r = await c.post(
+            f"/project/{project_id}",
+            json={"title": "task", "status": "open"},
+            headers=headers
+        )
+        self.task = Task(**r.json(), project_id=project_id)
+        self.user_id = (await c.get("/auth/me", headers=headers)).json()["id"]
+        await tasklog_buffer.flush()
+        tasklog_buffer.start()
+
+    async def asyncTearDown(self):
+        await self._client.__aexit__(None, None, None)
+
+    async def submit(self, session, action: str):
+        self.assertTrue(await tasklog_buffer.submit(
+            session,
+            [tasklog_entry(self.user_id, self.task, action)]
+        ))
+        self.assertEqual(len(tasklog_buffer), 0)
+
+    async def count(self, action: str) -> int:
+        async with AsyncSessionLocal() as session:
+            return await session.scalar(
+                select(func.count()).where(TaskLog.action == action)
+            )
+
+    async def test_only_committed_entries_are_queued(self):
+        async with AsyncSessionLocal() as session:
+            await session.execute(select(1))
+            await self.submit(session, "rolled back")
+            await session.rollback()
+        async with AsyncSessionLocal() as session:
+            await self.submit(session, "closed")
+        async with AsyncSessionLocal() as session:
+            await self.submit(session, "committed")
+            await session.commit()
+        self.assertEqual(len(tasklog_buffer), 1)
+        self.assertEqual(tasklog_buffer._reserved, 0)
+        await tasklog_buffer.flush()
+        self.assertEqual(await self.count("rolled back"), 0)
+        self.assertEqual(await self.count("closed"), 0)
+        self.assertEqual(await self.count("committed"), 1)
+
+    async def test_full_buffer_inside_a_transaction(self):
+        # Flushing here would wait on the write lock the session holds
+        for name, value in (
+            ("maxsize", 1),
+            ("sync_fallback", False),
+            # Only flush when woken up
+            ("interval", 3600)
+        ):
+            self.addCleanup(
+                setattr,
+                tasklog_buffer,
+                name,
+                getattr(tasklog_buffer, name)
+            )
+            setattr(tasklog_buffer, name, value)
+        await tasklog_buffer.stop()
+        tasklog_buffer.start()
+        async with AsyncSessionLocal() as session:
+            await self.submit(session, "queued")
+            await session.commit()
+        async with AsyncSessionLocal() as session:
+            await session.execute(
+                update(Task)
+                .where(Task.id == self.task.id)
+                .values(title="locked")
+            )
+            self.assertFalse(await tasklog_buffer.submit(
+                session,
+                [tasklog_entry(self.user_id, self.task, "overflow")]
+            ))
+            self.assertEqual(len(tasklog_buffer), 1)
+            await session.commit()
+        # Without a transaction the caller waits for the background task
+        async with AsyncSessionLocal() as session:
+            await self.submit(session, "waited")
+            await session.commit()
+        await tasklog_buffer.flush()
+        self.assertEqual(await self.count("queued"), 1)
+        self.assertEqual(await self.count("waited"), 1)
+
+    async def test_failed_batch_is_retried_entry_by_entry(self):
+        entries = [
+            tasklog_entry(self.user_id, self.task, f"entry {i}")
+            for i in range(3)
+        ]
+        entries[1]["action"] = None
+        tasklog_buffer._pending.extend(entries)
+        with mock.patch("db.tasklog_buffer.RETRY_DELAY_SECONDS", 0):
+            await tasklog_buffer.flush()
+        self.assertEqual(len(tasklog_buffer), 0)
+        self.assertEqual(await self.count("entry 0"), 1)
+        self.assertEqual(await self.count("entry 2"), 1)
+
+    async def test_events_get_log_ids(self):
+        subscription = event_bus.subscribe(self.task.project_id)
+        self.addCleanup(event_bus.unsubscribe, subscription)
+        async with AsyncSessionLocal() as session:
+            self.assertIsNone(await log_task_modification(
+                session,
+                self.user_id,
+                self.task,
+                "published",
+                "task.updated"
+            ))
+            await session.commit()
+        await tasklog_buffer.flush()
+        event = await asyncio.wait_for(subscription.get(), 1)
+        async with AsyncSessionLocal() as session:
+            log_id = await session.scalar(
+                select(TaskLog.id).where(TaskLog.action == "published")
+            )
+        self.assertEqual(event.type, "task.updated")
+        self.assertEqual(event.id, log_id)
+
+
+if __name__ == "__main__":
+    unittest.main()